@@ -1 +1,3 @@
-from backup_processor import BackupProcessor
\ No newline at end of file
+from backup_processor import BackupProcessor
+from .backup_runner import BackupResult, run_backups
+from .backup_scheduler import BackupScheduler
@@ -0,0 +1,216 @@
+from abc import ABCMeta, abstractmethod
+import os
+import shutil
+import tarfile
+import threading
+import zipfile
+
+from ap_backup.manifest import update_file_hash
+from ap_backup.throttle import ThrottledReader, ThrottledWriter
+
+from .compressors import open_compressed_output, COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_ZSTD
+
+__author__ = 'Alexander Pikovsky'
+
+
+class ArchiveWriter(object):
+    """
+    Base class for archive writers.
+
+    Writers are thread-safe: entries can be added from several threads, they are written one at a time.
+    """
+    __metaclass__ = ABCMeta
+
+    def __init__(self, archive_file, throttle=None):
+        self.archive_file = archive_file
+        self.throttle = throttle   # ap_backup.throttle.Throttle limiting the archive rate, None for unlimited
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_file(self, src_file, arc_name):
+        """Adds the given file to the archive under the given archive name."""
+        with self._lock:
+            self._add_file(src_file, self._normalize_arc_name(arc_name))
+
+    def add_folder(self, src_folder, arc_name, file_callback=None):
+        """
+        Adds the given folder (deep) to the archive under the given archive name.
+        Symbolic links are followed, so the result is the same as for the folder copied by shutil.copytree.
+        Folders which cannot be read do not stop the other folders from being added, they are raised as
+        shutil.Error afterwards (like shutil.copytree does).
+
+        :param src_folder: folder to add
+        :param arc_name: archive folder name; empty string to add the folder content to the archive root
+        :param file_callback: if specified, called with the source file path after every added file
+        :returns: number of files added
+        """
+        files = 0
+        errors = []
+        for dir_path, dir_names, file_names in os.walk(src_folder, followlinks=True,
+                                                        onerror=lambda ex: errors.append((ex.filename, None, str(ex)))):
+            dir_names.sort()
+            rel_dir = os.path.relpath(dir_path, src_folder)
+            arc_dir = arc_name if rel_dir == os.curdir else os.path.join(arc_name, rel_dir)
+
+            with self._lock:
+                if arc_dir:
+                    self._add_folder_entry(dir_path, self._normalize_arc_name(arc_dir))
+                for file_name in sorted(file_names):
+                    self._add_file(os.path.join(dir_path, file_name),
+                                   self._normalize_arc_name(os.path.join(arc_dir, file_name)))
+
+            files += len(file_names)
+            if file_callback:
+                for file_name in sorted(file_names):
+                    file_callback(os.path.join(dir_path, file_name))
+
+        if errors:
+            raise shutil.Error(errors)
+
+        return files
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    @staticmethod
+    def _normalize_arc_name(arc_name):
+        return arc_name.replace(os.sep, '/').strip('/')
+
+    @abstractmethod
+    def _add_file(self, src_file, arc_name):
+        raise Exception("This method must be overridden.")
+
+    @abstractmethod
+    def _add_folder_entry(self, src_folder, arc_name):
+        raise Exception("This method must be overridden.")
+
+    @abstractmethod
+    def _close(self):
+        raise Exception("This method must be overridden.")
+
+
+class ZipArchiveWriter(ArchiveWriter):
+    """ZIP archive writer (single-threaded deflate, ZIP64 extensions enabled for large archives).
+       Compression level and threads are not supported, zipfile always uses the default deflate level.
+       zipfile rewrites the entry headers after writing the entries, so the archive is hashed after it is closed.
+       zipfile reads and writes the entries itself, the throttle is charged after every entry."""
+
+    def __init__(self, archive_file, compression_level=None, compression_threads=0, file_hash=None, throttle=None):
+        super(ZipArchiveWriter, self).__init__(archive_file, throttle)
+        self._zip_file = zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._file_hash = file_hash
+
+    def _add_file(self, src_file, arc_name):
+        self._zip_file.write(src_file, arc_name)
+
+        if self.throttle is not None:
+            zip_info = self._zip_file.infolist()[-1]
+            self.throttle.read(zip_info.file_size)
+            self.throttle.write(zip_info.compress_size)
+
+    def _add_folder_entry(self, src_folder, arc_name):
+        self._zip_file.write(src_folder, arc_name)
+
+    def _close(self):
+        self._zip_file.close()
+
+        if self._file_hash is not None:
+            update_file_hash(self._file_hash, self.archive_file)
+
+
+class TarArchiveWriter(ArchiveWriter):
+    """
+    Uncompressed TAR archive writer, base class for compressed TAR writers.
+
+    The archive is written as a stream, compressed formats pipe it through a (possibly multi-threaded)
+    compressor, see open_compressed_output(). The file hash (if requested) is computed from the written stream.
+    The write limit of the throttle applies to the (uncompressed) TAR stream, so compressed archives are written
+    to disk slower than the limit.
+    """
+
+    COMPRESSION = COMPRESSION_NONE
+
+    def __init__(self, archive_file, compression_level=None, compression_threads=0, file_hash=None, throttle=None):
+        super(TarArchiveWriter, self).__init__(archive_file, throttle)
+        self._output = open_compressed_output(archive_file, self.COMPRESSION, compression_level, compression_threads,
+                                              file_hash)
+        try:
+            #closing the throttled output accounts the end of the stream and closes the output
+            self._tar_output = ThrottledWriter(self._output, throttle) if throttle is not None else self._output
+            self._tar_file = tarfile.open(fileobj=self._tar_output, mode='w|', format=tarfile.PAX_FORMAT)
+        except Exception:
+            self._output.close()
+            raise
+
+        #store content of linked files, like zip and shutil.copytree do
+        self._tar_file.dereference = True
+
+    def _add_file(self, src_file, arc_name):
+        if self.throttle is None:
+            self._tar_file.add(src_file, arc_name, recursive=False)
+            return
+
+        #same as tarfile.add(), but the file content is read through the throttle
+        tar_info = self._tar_file.gettarinfo(src_file, arc_name)
+        if tar_info.isreg():
+            in_file = ThrottledReader(open(src_file, 'rb'), self.throttle)
+            try:
+                self._tar_file.addfile(tar_info, in_file)
+            finally:
+                in_file.close()     # accounts the rest of the file, tarfile reads the file size only
+        else:
+            self._tar_file.addfile(tar_info)
+
+    def _add_folder_entry(self, src_folder, arc_name):
+        self._tar_file.add(src_folder, arc_name, recursive=False)
+
+    def _close(self):
+        try:
+            self._tar_file.close()
+        finally:
+            self._tar_output.close()
+
+
+class TarGzArchiveWriter(TarArchiveWriter):
+    """TAR archive writer with gzip compression (parallel pigz if installed)."""
+    COMPRESSION = COMPRESSION_GZIP
+
+
+class TarZstdArchiveWriter(TarArchiveWriter):
+    """TAR archive writer with multi-threaded zstd compression."""
+    COMPRESSION = COMPRESSION_ZSTD
+
+
+#archive writer classes by archive format (the format is also the archive file extension)
+ARCHIVE_WRITER_CLASSES = {
+    'zip': ZipArchiveWriter,
+    'tar': TarArchiveWriter,
+    'tar.gz': TarGzArchiveWriter,
+    'tar.zst': TarZstdArchiveWriter,
+}
+
+
+def create_archive_writer(archive_file, archive_format, compression_level=None, compression_threads=0,
+                          file_hash=None, throttle=None):
+    """
+    Creates archive writer for the given archive format.
+
+    :param archive_file: path of the archive file to create
+    :param archive_format: archive format, see ARCHIVE_WRITER_CLASSES
+    :param compression_level: compression level; None for the compressor default
+    :param compression_threads: number of compressor threads; 0 to use all cores
+    :param file_hash: hashlib hash object; if specified, updated with the content of the archive file
+    :param throttle: ap_backup.throttle.Throttle limiting the rate the sources are read and the archive is written;
+                     None for unlimited
+    """
+    writer_class = ARCHIVE_WRITER_CLASSES.get(archive_format)
+    if not writer_class:
+        raise Exception("Unsupported archive format '{0}'.".format(archive_format))
+
+    return writer_class(archive_file, compression_level, compression_threads, file_hash, throttle)
@@ -1,12 +1,20 @@
 from abc import abstractmethod, ABCMeta
+from datetime import datetime
+import errno
+import hashlib
 import os
 import sh
 import shutil
 import subprocess
 
 from ap_backup.config import BackupObjectFile, BackupObjectFolder, BackupObjectMySql, BackupObjectSvn
+from ap_backup.manifest import get_mtime_ns
+from ap_backup.multicopy import copy_file, copy_file_with_stat
+from ap_backup.throttle import ThrottledWriter
 
 from .backup_object_processor_manager import backup_object_processor_class
+from .compressors import COMPRESSION_EXTENSIONS, open_compressed_output
+from .mysql_parallel_dump import ParallelMySqlDump
 
 
 class BackupObjectProcessor(object):
@@ -20,9 +28,18 @@ class BackupObjectProcessor(object):
 
         self.target_folder = os.path.join(self.backup_processor.last_backup_folder, self.backup_object.target_subfolder)
 
+    @staticmethod
+    def _make_dirs(folder):
+        """Creates the folder with all parents. Tolerates folders created concurrently by other processors."""
+        try:
+            os.makedirs(folder)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST or not os.path.isdir(folder):
+                raise
+
     def ensure_target_folder_exists(self):
         if not os.path.isdir(self.target_folder):
-            os.makedirs(self.target_folder)
+            self._make_dirs(self.target_folder)
 
     def ensure_target_folder_does_not_exist(self):
         """Ensures that the parent of the target folder exists, but the target folder does not."""
@@ -31,12 +48,81 @@ class BackupObjectProcessor(object):
 
         parent_folder = os.path.dirname(self.target_folder)
         if not os.path.isdir(parent_folder):
-            os.makedirs(parent_folder)
+            self._make_dirs(parent_folder)
+
+    def get_command(self, program):
+        """Returns the sh command running the given program with the process priority of the backup config."""
+        prefix = self.backup_processor.command_prefix
+        if not prefix:
+            return sh.Command(program)
+        return sh.Command(prefix[0]).bake(*(prefix[1:] + [program]))
+
+    def throttle_output(self, out_file):
+        """Returns the file-like object writing to out_file limited by the throttle of the backup (if any)."""
+        throttle = self.backup_processor.throttle
+        return ThrottledWriter(out_file, throttle) if throttle is not None else out_file
+
+    def add_to_manifest(self, src_file, src_stat, content_file=None):
+        """Records the backed up source file in the manifest, if the backup config maintains one."""
+        manifest = self.backup_processor.manifest
+        if manifest is not None:
+            manifest.add_file(src_file, src_stat, content_file)
+
+    def fingerprint(self):
+        """
+        Returns a cheap fingerprint of the object source (e.g. file stats, repository revision), which changes
+        whenever the source changes. Used to skip rebuilding the archive if no source changed.
+
+        :returns: fingerprint string; None if the source state cannot be determined (the object is always
+                  considered changed)
+        """
+        return None
+
+    def get_destination_state(self, previous_state):
+        """
+        Returns the object state to record for every destination the backup was copied to (see
+        DestinationStatus.object_states), e.g. the last backed up revision of incremental backups.
+
+        :param previous_state: state recorded for the destination by the previous backup (None if not recorded)
+        :returns: new state (dict); None to keep the previous state
+        """
+        return None
+
+    def get_retained_since(self, state):
+        """
+        Returns the time since which all copies of a destination must be kept by the retention, because the
+        object backup of the destination depends on them (e.g. incremental backups on their full backup).
+
+        :param state: object state recorded for the destination (None if not recorded)
+        :returns: datetime; None if the object backup does not depend on older copies
+        """
+        return None
+
+    @staticmethod
+    def _stat_fingerprint(stat_result):
+        return "{0}:{1}:{2}".format(stat_result.st_size, get_mtime_ns(stat_result), stat_result.st_ino)
 
     @abstractmethod
     def process(self):
         raise Exception("This method must be overridden.")
 
+    def stream(self, archive_writer):
+        """
+        Writes the backup object into the given archive writer (streaming archive mode).
+
+        The default implementation processes the object to its target folder, adds that folder to the archive
+        and removes it afterwards, so that at most one object is staged on disk at a time. Processors able to
+        feed their sources directly into the archive override this method.
+
+        :returns: number of files added to the archive
+        """
+        self.process()
+        try:
+            self.reporter.info("Adding '{0}' to archive...".format(self.backup_object.target_subfolder))
+            return archive_writer.add_folder(self.target_folder, self.backup_object.target_subfolder)
+        finally:
+            shutil.rmtree(self.target_folder, ignore_errors=True)
+
 
 @backup_object_processor_class(BackupObjectFile)
 class BackupObjectFileProcessor(BackupObjectProcessor) :
@@ -47,7 +133,33 @@ class BackupObjectFileProcessor(BackupObjectProcessor) :
 
     def process(self):
         self.ensure_target_folder_exists()
+        src_file, target_file_name = self._get_src_file_and_target_file_name()
+
+        self.reporter.info("Copying file '{0}' to '{1}'...".format(src_file, target_file_name))
+        target_file = os.path.join(self.target_folder, target_file_name)
+        src_stat = os.stat(src_file)
+        strategy = copy_file(src_file, target_file, throttle=self.backup_processor.throttle)
+        self.add_to_manifest(src_file, src_stat, target_file)
+        self.reporter.info("Done ({0} copy)".format(strategy))
+
+    def stream(self, archive_writer):
+        src_file, target_file_name = self._get_src_file_and_target_file_name()
+
+        arc_name = os.path.join(self.backup_object.target_subfolder, target_file_name)
+        self.reporter.info("Adding file '{0}' to archive as '{1}'...".format(src_file, arc_name))
+        src_stat = os.stat(src_file)
+        archive_writer.add_file(src_file, arc_name)
+        self.add_to_manifest(src_file, src_stat)
+        self.reporter.info("Done")
+        return 1
+
+    def fingerprint(self):
+        try:
+            return self._stat_fingerprint(os.stat(self.backup_object.src_file_path))
+        except OSError:
+            return None
 
+    def _get_src_file_and_target_file_name(self):
         src_file = self.backup_object.src_file_path
         if not os.path.isfile(src_file):
             raise Exception("Source file '{0}' does not exist!".format(src_file))
@@ -56,10 +168,7 @@ class BackupObjectFileProcessor(BackupObjectProcessor) :
         if not target_file_name:
             target_file_name = os.path.basename(src_file)
 
-        self.reporter.info("Copying file '{0}' to '{1}'...".format(src_file, target_file_name))
-        target_file = os.path.join(self.target_folder, target_file_name)
-        shutil.copyfile(src_file, target_file)
-        self.reporter.info("Done")
+        return src_file, target_file_name
 
 
 @backup_object_processor_class(BackupObjectFolder)
@@ -76,18 +185,194 @@ class BackupObjectFolderProcessor(BackupObjectProcessor) :
         if not os.path.isdir(src_folder):
             raise Exception("Source folder '{0}' does not exist!".format(src_folder))
 
-        self.reporter.info("Copying folder '{0}' to '{1}'...".format(src_folder, self.target_folder))
-        shutil.copytree(src_folder, self.target_folder)
+        if self.backup_object.incremental:
+            prev_folder = os.path.join(self.backup_processor.prev_backup_folder, self.backup_object.target_subfolder)
+            self.reporter.info("Copying folder '{0}' to '{1}' (incremental, unchanged files are linked from '{2}')..."
+                               .format(src_folder, self.target_folder, prev_folder))
+        else:
+            prev_folder = None
+            self.reporter.info("Copying folder '{0}' to '{1}'...".format(src_folder, self.target_folder))
+
+        linked_files, copied_files_by_strategy = self._copy_folder(src_folder, prev_folder)
+        self.reporter.info("Done: {0} files linked from previous backup, {1} files copied ({2})."
+                           .format(linked_files, sum(copied_files_by_strategy.values()),
+                                   ", ".join("{0}: {1}".format(strategy, count)
+                                             for strategy, count in sorted(copied_files_by_strategy.items()))
+                                   or "none"))
+
+    def stream(self, archive_writer):
+        src_folder = self.backup_object.src_folder_path
+        if not os.path.isdir(src_folder):
+            raise Exception("Source folder '{0}' does not exist!".format(src_folder))
+
+        arc_name = self.backup_object.target_subfolder
+        self.reporter.info("Adding folder '{0}' to archive as '{1}'...".format(src_folder, arc_name))
+        if self.backup_processor.manifest is not None:
+            files = archive_writer.add_folder(src_folder, arc_name, file_callback=lambda src_file:
+                                              self.add_to_manifest(src_file, os.stat(src_file)))
+        else:
+            files = archive_writer.add_folder(src_folder, arc_name)
         self.reporter.info("Done")
+        return files
+
+    def fingerprint(self):
+        """Hash of the folder and file stats of the whole source folder (metadata walk, no data is read)."""
+        src_folder = self.backup_object.src_folder_path
+        if not os.path.isdir(src_folder):
+            return None
+
+        fingerprint_hash = hashlib.sha1()
+        for dir_path, dir_names, file_names in os.walk(src_folder, followlinks=True):
+            dir_names.sort()
+            try:
+                fingerprint_hash.update("{0}|{1}\n".format(dir_path, get_mtime_ns(os.stat(dir_path))).encode('utf-8'))
+                for file_name in sorted(file_names):
+                    file_stat = os.stat(os.path.join(dir_path, file_name))
+                    fingerprint_hash.update("{0}|{1}\n".format(file_name, self._stat_fingerprint(file_stat))
+                                            .encode('utf-8'))
+            except OSError:
+                return None
+
+        return fingerprint_hash.hexdigest()
+
+    def _is_file_unchanged(self, src_file, src_stat, prev_file):
+        """
+        Checks whether the source file is unchanged since the previous backup, which contains prev_file.
+
+        The previous copy must have the same size and modification time as the source (copy_file_with_stat preserves
+        the modification time up to float precision). If the manifest is maintained, the source must also match
+        its manifest entry (size, modification time and inode).
+        """
+        try:
+            prev_stat = os.stat(prev_file)
+        except OSError:
+            return False
+
+        if prev_stat.st_size != src_stat.st_size or abs(prev_stat.st_mtime - src_stat.st_mtime) >= 0.001:
+            return False
+
+        manifest = self.backup_processor.manifest
+        return manifest is None or manifest.get_unchanged_entry(src_file, src_stat) is not None
+
+    def _copy_folder(self, src_folder, prev_folder):
+        """
+        Copies the source folder to the target folder like shutil.copytree. If prev_folder is specified, files
+        unchanged since the previous backup are hard-linked from prev_folder instead of being copied (like rsync
+        --link-dest). Files and folders which cannot be read are raised as shutil.Error after all others are copied.
+
+        :returns: tuple (number of linked files, dict: copy strategy -> number of files copied by it)
+        """
+        linked_files = 0
+        copied_files_by_strategy = {}
+        copied_dirs = []
+        errors = []
+        for dir_path, dir_names, file_names in os.walk(src_folder, followlinks=True,
+                                                        onerror=lambda ex: errors.append((ex.filename, None, str(ex)))):
+            rel_dir = os.path.relpath(dir_path, src_folder)
+            target_dir = os.path.normpath(os.path.join(self.target_folder, rel_dir))
+            prev_dir = os.path.normpath(os.path.join(prev_folder, rel_dir)) if prev_folder else None
+            os.mkdir(target_dir)
+            copied_dirs.append((dir_path, target_dir))
+
+            for file_name in file_names:
+                src_file = os.path.join(dir_path, file_name)
+                target_file = os.path.join(target_dir, file_name)
+                try:
+                    src_stat = os.stat(src_file)
+                    if prev_dir and self._link_unchanged_file(src_file, src_stat, os.path.join(prev_dir, file_name),
+                                                              target_file):
+                        linked_files += 1
+                    else:
+                        strategy = copy_file_with_stat(src_file, target_file, self.backup_processor.throttle)
+                        copied_files_by_strategy[strategy] = copied_files_by_strategy.get(strategy, 0) + 1
+
+                    self.add_to_manifest(src_file, src_stat, target_file)
+                except (IOError, OSError) as ex:
+                    errors.append((src_file, target_file, str(ex)))
+
+        #set folder times after all files are created, like shutil.copytree does
+        for dir_path, target_dir in reversed(copied_dirs):
+            try:
+                shutil.copystat(dir_path, target_dir)
+            except OSError as ex:
+                errors.append((dir_path, target_dir, str(ex)))
+
+        if errors:
+            raise shutil.Error(errors)
+
+        return linked_files, copied_files_by_strategy
+
+    def _link_unchanged_file(self, src_file, src_stat, prev_file, target_file):
+        """Hard-links prev_file to target_file if the source file is unchanged. Returns True if linked."""
+        if not self._is_file_unchanged(src_file, src_stat, prev_file):
+            return False
+
+        try:
+            os.link(prev_file, target_file)
+            return True
+        except OSError:
+            return False    # e.g. too many links, copy instead
 
 
 @backup_object_processor_class(BackupObjectMySql)
 class BackupObjectMySqlProcessor(BackupObjectProcessor) :
     """MySql backup object processor."""
 
+    #size of the chunks the dump output is written to the (compressed) target file in
+    DUMP_BUFFER_SIZE = 1024 * 1024
+
     def __init__(self, backup_object, backup_processor):
         super(BackupObjectMySqlProcessor, self).__init__(backup_object, backup_processor)
 
+    def _get_connection_kwargs(self):
+        """Returns sh keyword arguments with the connection options for mysql and mysqldump."""
+        kwargs = {
+            'user': self.backup_object.user,
+            'password': self.backup_object.password
+        }
+        if self.backup_object.host is not None:
+            kwargs['host'] = self.backup_object.host
+        if self.backup_object.port is not None:
+            kwargs['port'] = self.backup_object.port
+
+        return kwargs
+
+    def _query(self, query):
+        """Executes the given query in the backed up database, returns the result rows as lists of strings."""
+        # noinspection PyUnresolvedReferences
+        output = sh.mysql(self.backup_object.database, '--batch', '--skip-column-names', '-e', query,
+                          **self._get_connection_kwargs())
+        return [line.split('\t') for line in str(output).splitlines() if line]
+
+    def fingerprint(self):
+        """
+        Fingerprint of the database tables: update times and row counts from information_schema (fingerprint
+        mode "update_time") or table checksums (fingerprint mode "checksum", reads all table data).
+        Update times are not maintained for all storage engines (e.g. InnoDB before MySQL 5.7), in this case
+        the "update_time" mode returns None.
+        """
+        fingerprint_mode = self.backup_object.fingerprint
+        if fingerprint_mode == BackupObjectMySql.FINGERPRINT_NONE:
+            return None
+
+        try:
+            rows = self._query("SELECT TABLE_NAME, UPDATE_TIME, TABLE_ROWS FROM information_schema.TABLES "
+                               "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME")
+
+            if fingerprint_mode == BackupObjectMySql.FINGERPRINT_CHECKSUM:
+                if rows:
+                    table_names = ", ".join("`{0}`".format(row[0]) for row in rows)
+                    rows = self._query("CHECKSUM TABLE {0}".format(table_names))
+            elif any(row[1] == 'NULL' for row in rows):
+                return None
+
+        except sh.ErrorReturnCode as ex:
+            self.reporter.error("Cannot determine fingerprint of MySQL database '{0}': {1}"
+                                .format(self.backup_object.database, ex.message))
+            return None
+
+        return hashlib.sha1("\n".join("|".join(row) for row in rows).encode('utf-8')).hexdigest()
+
     def process(self):
         self.ensure_target_folder_exists()
         target_file_path = os.path.join(self.target_folder, self.backup_object.target_file_name)
@@ -95,18 +380,27 @@ class BackupObjectMySqlProcessor(BackupObjectProcessor) :
         try:
             self.reporter.info("Backing up MySql database '{0}'...".format(self.backup_object.database))
 
-            kwargs = {
-                'user': self.backup_object.user,
-                'password': self.backup_object.password,
-                '_out': target_file_path
-            }
-            if self.backup_object.host is not None:
-                kwargs['host'] = self.backup_object.host
-            if self.backup_object.port is not None:
-                kwargs['port'] = self.backup_object.port
-
-            # noinspection PyUnresolvedReferences
-            sh.mysqldump(self.backup_object.database, '--lock-tables', '--opt', '--skip-extended-insert', **kwargs)
+            compression = None if self.backup_object.compression == BackupObjectMySql.COMPRESSION_NONE \
+                else self.backup_object.compression
+            target_file_path += COMPRESSION_EXTENSIONS[compression]
+
+            options = ['--opt']
+            if self.backup_object.single_transaction:
+                options.extend(['--single-transaction', '--skip-lock-tables'])
+            else:
+                options.append('--lock-tables')
+            if not self.backup_object.extended_insert:
+                options.append('--skip-extended-insert')
+
+            if self.backup_object.parallel_workers > 1:
+                self._dump_parallel(options, compression)
+            else:
+                kwargs = self._get_connection_kwargs()
+                kwargs['_out_bufsize'] = self.DUMP_BUFFER_SIZE
+                with open_compressed_output(target_file_path, compression, self.backup_object.compression_level) \
+                        as out_file:
+                    kwargs['_out'] = self.throttle_output(out_file)
+                    self.get_command('mysqldump')(self.backup_object.database, *options, **kwargs)
 
             self.reporter.info("Database backup complete.")
 
@@ -118,6 +412,36 @@ class BackupObjectMySqlProcessor(BackupObjectProcessor) :
                             .format(self.backup_object.database, repr(ex)))
 
 
+    def _dump_parallel(self, options, compression):
+        """
+        Dumps the schema and the data of every table to separate files in the target folder
+        (<name>-schema.sql and <name>.<table>.sql, where <name> is the target file name without extension)
+        with parallel_workers connections, see ParallelMySqlDump.
+        """
+        table_sizes = []
+        rows = self._query("SELECT TABLE_NAME, DATA_LENGTH + INDEX_LENGTH FROM information_schema.TABLES "
+                           "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'")
+        for table_name, size in rows:
+            table_sizes.append((table_name, int(size) if size.isdigit() else 0))
+
+        base_name, extension = os.path.splitext(self.backup_object.target_file_name)
+        extension += COMPRESSION_EXTENSIONS[compression]
+
+        def get_table_file_path(table_name):
+            return os.path.join(self.target_folder, "{0}.{1}{2}".format(base_name, table_name, extension))
+
+        connection_options = ['--{0}={1}'.format(name, value)
+                              for name, value in sorted(self._get_connection_kwargs().items())]
+        options = [option for option in options if option != '--lock-tables']
+        parallel_dump = ParallelMySqlDump(['mysql'] + connection_options,
+                                          self.backup_processor.command_prefix + ['mysqldump'] + connection_options +
+                                          options,
+                                          self.backup_object.database, self.reporter, self.backup_processor.throttle)
+        parallel_dump.dump(table_sizes, self.backup_object.parallel_workers,
+                           os.path.join(self.target_folder, base_name + "-schema" + extension), get_table_file_path,
+                           compression, self.backup_object.compression_level)
+
+
 @backup_object_processor_class(BackupObjectSvn)
 class BackupObjectSvnProcessor(BackupObjectProcessor):
     """Subversion repository backup object processor."""
@@ -125,13 +449,51 @@ class BackupObjectSvnProcessor(BackupObjectProcessor):
     def __init__(self, backup_object, backup_processor):
         super(BackupObjectSvnProcessor, self).__init__(backup_object, backup_processor)
 
+        #incremental mode: last revision contained in the backup and time of the full backup it is based on
+        #(None for incremental backups, every destination keeps the time of its own full backup)
+        self.last_revision = None
+        self.full_backup_time = None
+
+    def fingerprint(self):
+        """Youngest revision of the repository (None in the incremental mode, destinations may need other ranges)."""
+        if self.backup_object.incremental:
+            return None
+
+        try:
+            return "r{0}".format(self._get_youngest_revision(self.backup_object.repository_folder))
+        except sh.ErrorReturnCode as ex:
+            self.reporter.error("Cannot determine youngest revision of Subversion repository '{0}': {1}"
+                                .format(self.backup_object.repository_folder, ex.message))
+            return None
+
+    def get_destination_state(self, previous_state):
+        if self.last_revision is None:
+            return None     # not processed or not incremental
+
+        full_backup_time = self.full_backup_time or previous_state['last_full_backup_time']
+        return {'last_revision': self.last_revision, 'last_full_backup_time': full_backup_time}
+
+    def get_retained_since(self, state):
+        """Time of the full backup of the destination, the incremental backups made since then depend on it."""
+        if not self.backup_object.incremental or state is None:
+            return None
+
+        return state['last_full_backup_time']
+
+    @staticmethod
+    def _get_youngest_revision(repository_folder):
+        # noinspection PyUnresolvedReferences
+        return int(str(sh.svnlook('youngest', repository_folder)).strip())
+
     def process(self):
         self.ensure_target_folder_does_not_exist()
 
         try:
             self.reporter.info("Backing up Subversion repository '{0}'...".format(self.backup_object.repository_folder))
-            # noinspection PyUnresolvedReferences
-            sh.svnadmin('hotcopy', self.backup_object.repository_folder, self.target_folder)
+            if self.backup_object.incremental:
+                self._process_incremental()
+            else:
+                self.get_command('svnadmin')('hotcopy', self.backup_object.repository_folder, self.target_folder)
             self.reporter.info("Subversion repository backup complete.")
             
         except sh.ErrorReturnCode as ex:
@@ -141,3 +503,39 @@ class BackupObjectSvnProcessor(BackupObjectProcessor):
             raise Exception("Subversion backup for repository folder '{0}' failed: {1}".format(
                 self.backup_object.repository_folder, repr(ex)))
 
+
+    def _process_incremental(self):
+        """
+        Makes a full backup (hotcopy) if a destination has no full backup newer than full_backup_interval_days,
+        otherwise dumps the revisions missing in the destination with the oldest revision
+        (incremental-r<from>-r<to>.svndump, revisions may overlap with the previous dumps of other destinations).
+        """
+        repository_folder = self.backup_object.repository_folder
+        now = datetime.now()
+        previous_states = self.backup_processor.get_destination_object_states(self.backup_object)
+        max_days = self.backup_object.full_backup_interval_days
+        full_backup_needed = any(state is None or (now - state['last_full_backup_time']).days >= max_days
+                                 for state in previous_states)
+
+        if full_backup_needed:
+            self.reporter.info("Making full backup (hotcopy)...")
+            self.get_command('svnadmin')('hotcopy', repository_folder, self.target_folder)
+            self.last_revision = self._get_youngest_revision(self.target_folder)
+            self.full_backup_time = now
+            return
+
+        os.makedirs(self.target_folder)
+        youngest_revision = self._get_youngest_revision(repository_folder)
+        from_revision = min(state['last_revision'] for state in previous_states) + 1
+        if from_revision <= youngest_revision:
+            dump_file_path = os.path.join(self.target_folder, "incremental-r{0}-r{1}.svndump"
+                                          .format(from_revision, youngest_revision))
+            self.reporter.info("Dumping revisions {0} to {1}...".format(from_revision, youngest_revision))
+            with open(dump_file_path, 'wb') as out_file:
+                self.get_command('svnadmin')('dump', '--incremental', '--quiet', '-r',
+                                             '{0}:{1}'.format(from_revision, youngest_revision), repository_folder,
+                                             _out=self.throttle_output(out_file))
+        else:
+            self.reporter.info("No revisions added since the last backup.")
+
+        self.last_revision = youngest_revision
@@ -1,14 +1,23 @@
 from datetime import datetime
 from os import path
+import glob
+import hashlib
 import os
-import shutil
 from croniter import croniter
 from shutil import rmtree
 
-from ap_backup.multicopy import multicopy
+from ap_backup.config.backup_config import BackupConfig
+from ap_backup.manifest import Manifest, HASH_ALGORITHM, compute_file_hash
+from ap_backup.metrics import RunMetrics, export_run_metrics
+from ap_backup.multicopy import CopyCatalog, RetentionPolicy, fanout_copy, get_copy_path
+from ap_backup.throttle import create_throttle
 
+from .archive_writer import create_archive_writer
 from .backup_status import BackupStatus
+from .process_priority import get_priority_command_prefix
+from .status_store import BackupAttempt, StatusStore
 from .backup_object_processor_manager import backup_object_processor_manager
+from .object_processor_pool import ObjectProcessorPool
 
 # Import all work object processor classes, this will register them in backup_object_processor_manager
 # noinspection PyUnresolvedReferences
@@ -23,20 +32,51 @@ from .backup_object_processors import \
 class BackupProcessor(object):
     """Processes the given backup configuration (makes backup)."""
     
-    def __init__(self, app_config, backup_config, reporter):
+    def __init__(self, app_config, backup_config, reporter, global_throttle=None):
+        """
+        :param global_throttle: ap_backup.throttle.Throttle with the limits of all backups together (shared by
+                                the parallel backup processes); None for unlimited
+        """
         self.app_config = app_config
         self.backup_config = backup_config
         self.reporter = reporter.reporter(logger_name='protocol')
 
+        #throttle limiting the file copies, archiving and destination copies of this backup (None for unlimited)
+        self.throttle = create_throttle(backup_config.read_rate_limit, backup_config.write_rate_limit,
+                                        parent=global_throttle)
+
+        #command line prefix of the mysqldump and svnadmin child processes setting their priority (see
+        #get_priority_command_prefix())
+        self.command_prefix = []
+
         self.data_folder = None
+        self.status_store = None
         self.last_backup_status = None
 
         #directory in which last backup files are placed and from where they are then archived
         self.last_backup_folder = None
 
+        #directory holding the files of the previous backup run (may not exist)
+        self.prev_backup_folder = None
+
         #last backup archive file
         self.last_backup_archive_file = None
 
+        #manifest of backed up files (None if not maintained for this backup config)
+        self.manifest = None
+
+        #list of BackupObjectProcessor objects, one per backup object
+        self.object_processors = None
+
+        #list of BackupDestination objects updated by the running backup
+        self.destinations_to_update = []
+
+        #names of the destinations whose attempt of the running backup is recorded
+        self._recorded_destination_names = set()
+
+        #timing and throughput of the stages of the running backup
+        self.metrics = RunMetrics(backup_config.name)
+
     def process(self):
         """Processes the given backup configuration (makes backup).
            Returns the number of updated destinations (0 if nothing updated)."""
@@ -46,44 +86,164 @@ class BackupProcessor(object):
 
         self._init_data_folder()
         self._load_last_backup_status()
-
-        destinations_to_update = self._prepare_destinations_to_update(backup_time)
-        if not destinations_to_update:
-            self.reporter.info("Backup '{0}' skipped: all destinations up-to-date.".format(self.backup_config.name))
-            return 0
-
-        self.reporter.info("Preparing folders...")
-        self._prepare_folders()
-
-        self.reporter.info("Processing objects...")
-        self._process_objects()
-
-        #create archive       
-        self.reporter.info("Creating archive '{0}'...".format(self.last_backup_archive_file))
-        self._create_archive()
+        result = RunMetrics.RESULT_FAILED
+        try:
+            destinations_to_update = self._prepare_destinations_to_update(backup_time)
+            self.destinations_to_update = destinations_to_update
+            if not destinations_to_update:
+                self.reporter.info("Backup '{0}' skipped: all destinations up-to-date."
+                                   .format(self.backup_config.name))
+                result = RunMetrics.RESULT_SKIPPED
+                return 0
+
+            try:
+                self._update_destinations(destinations_to_update, backup_time)
+            except Exception as ex:
+                #record the failure for the destinations not reached
+                for destination in destinations_to_update:
+                    if destination.name not in self._recorded_destination_names:
+                        self._record_attempt(destination, backup_time, "failed", error=str(ex))
+                raise
+
+            self.reporter.info("Backup '{0}' complete: {1} destinations updated."
+                               .format(self.backup_config.name, len(destinations_to_update)))
+            result = RunMetrics.RESULT_SUCCEEDED
+            return len(destinations_to_update)
+
+        finally:
+            self.status_store.close()
+            self._export_metrics(result)
+
+    def _export_metrics(self, result):
+        """Finishes the metrics of the run and exports them (if configured). Skipped runs are not exported, so that
+           the exported metrics are those of the last run which did some work."""
+        self.metrics.finish(result)
+        if result == RunMetrics.RESULT_SKIPPED:
+            return
+
+        try:
+            export_run_metrics(self.app_config, self.metrics)
+        except Exception as ex:
+            self.reporter.error("Writing metrics of backup '{0}' failed: {1}".format(self.backup_config.name, str(ex)))
+
+    def _update_destinations(self, destinations_to_update, backup_time):
+        """Creates (or reuses) the archive and copies it to the given destinations."""
+        self.command_prefix = get_priority_command_prefix(self.backup_config)
+        if self.throttle is not None:
+            self.reporter.info("I/O rate limits: {0}.".format(self.throttle))
+
+        self.object_processors = self._create_object_processors()
+        self.last_backup_archive_file = \
+            os.path.join(self.data_folder, "last_backup" + self.backup_config.get_archive_extension())
+
+        source_fingerprint = None
+        if self.backup_config.reuse_unchanged_archive:
+            self.reporter.info("Computing source fingerprint...")
+            with self.metrics.measure("fingerprint"):
+                source_fingerprint = self._compute_source_fingerprint()
+
+        if source_fingerprint is not None and source_fingerprint == self.last_backup_status.source_fingerprint \
+                and path.isfile(self.last_backup_archive_file):
+            self.reporter.info("Sources unchanged since the last backup, reusing archive '{0}'."
+                               .format(self.last_backup_archive_file))
+        else:
+            self._create_backup_archive(source_fingerprint)
 
         #process destinations
         self.reporter.info("Copying archive to destinations...")
         self._copy_archive_to_destinations(destinations_to_update, backup_time)
 
-        self.reporter.info("Backup '{0}' complete: {1} destinations updated."
-                           .format(self.backup_config.name, len(destinations_to_update)))
-        return len(destinations_to_update)
+    def _create_backup_archive(self, source_fingerprint):
+        """Backs up all objects to the archive, records the given source fingerprint for the new archive."""
+
+        #forget the fingerprint and checksum of the archive being replaced, in case this run fails half-way
+        if self.last_backup_status.source_fingerprint is not None or \
+                self.last_backup_status.archive_checksum is not None:
+            self.last_backup_status.source_fingerprint = None
+            self.last_backup_status.archive_checksum = None
+            self._save_last_backup_status()
+
+        self.reporter.info("Preparing folders...")
+        with self.metrics.measure("prepare_folders"):
+            self._prepare_folders()
+
+        if self.backup_config.manifest:
+            self.manifest = Manifest.for_data_folder(self.data_folder)
+
+        if self.backup_config.archive_mode == BackupConfig.ARCHIVE_MODE_STREAMING:
+            #write objects directly into the archive, last_backup folder is only used as scratch space
+            self.reporter.info("Streaming objects to archive '{0}'...".format(self.last_backup_archive_file))
+            with self.metrics.measure("stream_objects") as stage_metrics:
+                stage_metrics.files = self._stream_objects_to_archive()
+        else:
+            self.reporter.info("Processing objects...")
+            with self.metrics.measure("process_objects") as stage_metrics:
+                stage_metrics.files = self._process_objects()
+
+            #create archive
+            self.reporter.info("Creating archive '{0}'...".format(self.last_backup_archive_file))
+            with self.metrics.measure("create_archive") as stage_metrics:
+                stage_metrics.files = self._create_archive()
+
+        if self.manifest is not None:
+            self.reporter.info("Saving manifest '{0}'...".format(self.manifest.file_path))
+            with self.metrics.measure("save_manifest"):
+                self.manifest.commit()
+
+        self.last_backup_status.source_fingerprint = source_fingerprint
+        self._save_last_backup_status()
+
+    def _compute_source_fingerprint(self):
+        """
+        Computes the fingerprint of all backup sources and the archive settings.
+        Returns None if the fingerprint of any object cannot be determined.
+        """
+        fingerprint_hash = hashlib.sha1()
+        fingerprint_hash.update("{0}|{1}|{2}\n".format(self.backup_config.archive_format,
+                                                       self.backup_config.compression_level,
+                                                       self.backup_config.archive_mode).encode('utf-8'))
+        for object_processor in self.object_processors:
+            object_fingerprint = object_processor.fingerprint()
+            if object_fingerprint is None:
+                self.reporter.info("Fingerprint of {0} cannot be determined, archive will be created."
+                                   .format(object_processor.backup_object))
+                return None
+
+            #object settings are part of the fingerprint, so that config changes invalidate the archive
+            object_settings = repr(sorted(vars(object_processor.backup_object).items()))
+            fingerprint_hash.update("{0}|{1}\n".format(object_settings, object_fingerprint).encode('utf-8'))
+
+        return fingerprint_hash.hexdigest()
 
     def _init_data_folder(self):
         self.data_folder = self.backup_config.data_folder
         if not path.exists(self.data_folder):
             os.makedirs(self.data_folder)
 
+        #the object processors created before _prepare_folders() derive their target folders from last_backup_folder
+        self.last_backup_folder = os.path.join(self.data_folder, "last_backup")
+        self.prev_backup_folder = os.path.join(self.data_folder, "prev_backup")
+
     def _load_last_backup_status(self):
-        """Reads last backup status to self.last_backup_status."""
-        status_dir = self.data_folder
-        self.last_backup_status = BackupStatus(self.backup_config.name, status_dir)
+        """Reads last backup status to self.last_backup_status (migrates the status file of older versions)."""
+        self.status_store = StatusStore(self.app_config.status_db_file)
+        try:
+            self.last_backup_status = BackupStatus(self.backup_config.name, self.status_store,
+                                                   legacy_status_dir=self.data_folder)
+        except Exception:
+            self.status_store.close()
+            raise
 
     def _save_last_backup_status(self):
         """Saves last backup status from self.last_backup_status."""
         self.last_backup_status.save()
 
+    def _record_attempt(self, destination, backup_time, result, bytes_written=None, error=None):
+        """Records the attempt of the running backup to update the given destination."""
+        self.last_backup_status.record_attempt(BackupAttempt(self.backup_config.name, destination.name, backup_time,
+                                                             datetime.now(), result, bytes_written, error))
+        self._recorded_destination_names.add(destination.name)
+
     def is_backup_expired_for_destination(self, destination, now):
         """Determines whether update is required for the given destination."""
         destination_status = self.last_backup_status.get_or_create_destination_status(destination.name)
@@ -93,6 +253,36 @@ class BackupProcessor(object):
         prev_trigger = croniter(destination.schedule, now).get_prev(datetime)
         return prev_trigger > destination_status.last_successful_backup_time
 
+    def get_destination_object_states(self, backup_object):
+        """
+        Returns the list of states of the given backup object recorded for the destinations updated by the running
+        backup (None for destinations without recorded state), see BackupObjectProcessor.get_destination_state().
+        """
+        object_states = []
+        for destination in self.destinations_to_update:
+            destination_status = self.last_backup_status.get_or_create_destination_status(destination.name)
+            object_states.append(destination_status.object_states.get(backup_object.target_subfolder))
+
+        return object_states
+
+    def _get_retained_since(self, destination_status):
+        """
+        Returns the time since which all copies of the destination are kept (the oldest copy the object backups of
+        the destination depend on, see BackupObjectProcessor.get_retained_since()), None if not needed.
+        """
+        retained_since = []
+        for object_processor in self.object_processors:
+            object_state = destination_status.object_states.get(object_processor.backup_object.target_subfolder)
+            object_retained_since = object_processor.get_retained_since(object_state)
+            if object_retained_since is not None:
+                retained_since.append(object_retained_since)
+
+        if not retained_since:
+            return None
+
+        #the object times precede the copy time, but catalog timestamps of the copies may be truncated to minutes
+        return min(retained_since).replace(second=0, microsecond=0)
+
     def _prepare_destinations_to_update(self, backup_time):
 
         #enumerate destinations and decide which must be updated
@@ -113,55 +303,157 @@ class BackupProcessor(object):
         return destinations_to_update
 
     def _prepare_folders(self):
-        #remove last archive
-        self.last_backup_archive_file = os.path.join(self.data_folder, "last_backup.zip")
-        if path.exists(self.last_backup_archive_file):
-            os.remove(self.last_backup_archive_file)
+        #remove last archive (of any format, the format may have been changed in the config)
+        for archive_file in glob.glob(os.path.join(self.data_folder, "last_backup.*")):
+            if path.isfile(archive_file):
+                os.remove(archive_file)
 
         #remove prev_backup folder, we do this by first renaming it
         #(workaround for the following code to always be able to rename to prevBackupDir)
-        prev_backup_folder = os.path.join(self.data_folder, "prev_backup")
-        if path.exists(prev_backup_folder):
-            rmtree(prev_backup_folder)
+        if path.exists(self.prev_backup_folder):
+            rmtree(self.prev_backup_folder)
 
         #rename last_backup folder to prev_backup
-        self.last_backup_folder = os.path.join(self.data_folder, "last_backup")
         if path.exists(self.last_backup_folder):
-            os.rename(self.last_backup_folder, prev_backup_folder)
+            os.rename(self.last_backup_folder, self.prev_backup_folder)
 
         #create last_backup folder
         os.mkdir(self.last_backup_folder)
 
-    def _process_objects(self):
-
-        #create backup object processors
+    def _create_object_processors(self):
+        object_processors = []
         for backup_object in self.backup_config.backup_objects:
             object_processor = backup_object_processor_manager.create_processor(backup_object, self)
             if not object_processor:
                 raise Exception("Unsupported backup object type '{0}'.".format(type(backup_object).__name__))
+            object_processors.append(object_processor)
+
+        return object_processors
+
+    def _run_object_processors(self, object_processors, action):
+        """Calls action(object_processor) for all object processors, in parallel if configured so."""
+        if self.backup_config.max_parallel_objects <= 1:
+            for object_processor in object_processors:
+                action(object_processor)
+            return
+
+        pool = ObjectProcessorPool(self.backup_config.max_parallel_objects, self.backup_config.concurrency_limits,
+                                   self.reporter)
+        failures = pool.run(object_processors, action)
+        if failures:
+            raise Exception("Backup of {0} of {1} objects failed: {2}."
+                            .format(len(failures), len(object_processors),
+                                    ", ".join(str(object_processor.backup_object)
+                                              for object_processor, ex in failures)))
+
+    def _run_measured_object_processors(self, stage, action):
+        """
+        Calls action(object_processor) for all object processors like _run_object_processors(), every object is
+        measured as the given stage. action returns the number of files of the object.
+        Returns the total number of files.
+        """
+        object_stages = []
+
+        def measured_action(object_processor):
+            with self.metrics.measure(stage, object_processor.backup_object.target_subfolder) as stage_metrics:
+                object_stages.append(stage_metrics)
+                stage_metrics.files = action(object_processor)
+
+        self._run_object_processors(self.object_processors, measured_action)
+        return sum(stage_metrics.files or 0 for stage_metrics in object_stages)
+
+    def _process_objects(self):
+        """Processes all objects to the last_backup folder. Returns the number of files created."""
 
+        def process_object(object_processor):
             object_processor.process()
+            return sum(len(file_names) for dir_path, dir_names, file_names in os.walk(object_processor.target_folder))
+
+        return self._run_measured_object_processors("process_object", process_object)
+
+    def _stream_objects_to_archive(self):
+        """Writes all objects directly into the archive. Returns the number of files added."""
+        archive_hash = hashlib.new(HASH_ALGORITHM)
+        with self._create_archive_writer(archive_hash) as archive_writer:
+            files = self._run_measured_object_processors(
+                "stream_object", lambda object_processor: object_processor.stream(archive_writer))
+        self.last_backup_status.archive_checksum = archive_hash.hexdigest()
+        return files
+
+    def _create_archive_writer(self, archive_hash):
+        """Creates the writer of the archive, archive_hash is updated with the archive content while written."""
+        return create_archive_writer(self.last_backup_archive_file, self.backup_config.archive_format,
+                                     compression_level=self.backup_config.compression_level,
+                                     compression_threads=self.backup_config.compression_threads,
+                                     file_hash=archive_hash, throttle=self.throttle)
 
     def _create_archive(self):
-        archive_base_name, archive_ext = os.path.splitext(self.last_backup_archive_file)
-        archive_format = archive_ext[1:]
-        shutil.make_archive(archive_base_name, archive_format, self.last_backup_folder)
+        """Archives the last_backup folder. Returns the number of files added."""
+        archive_hash = hashlib.new(HASH_ALGORITHM)
+        with self._create_archive_writer(archive_hash) as archive_writer:
+            files = archive_writer.add_folder(self.last_backup_folder, '')
+        self.last_backup_status.archive_checksum = archive_hash.hexdigest()
+        return files
 
     def _copy_archive_to_destinations(self, destinations_to_update, backup_time):
+        #construct the names of the new copies
+        copy_time = datetime.now()
+        target_files = []
         for destination in destinations_to_update:
             #create destination dir if does not exist
             if not path.exists(destination.folder):
                 os.makedirs(destination.folder)
 
-            #multi-copy archive
-            multicopy(self.last_backup_archive_file, destination.folder,
-                      num_copies=destination.num_copies, target_base_name=self.backup_config.name,
-                      min_period_days=0, append_time=True, ignore_errors=False, reporter=self.reporter)
+            target_files.append(get_copy_path(self.last_backup_archive_file, destination.folder,
+                                              target_base_name=self.backup_config.name, copy_time=copy_time))
+
+        #checksum is computed while the archive is written, archives of older versions are hashed here once
+        checksum = self.last_backup_status.archive_checksum
+        if checksum is None:
+            checksum = compute_file_hash(self.last_backup_archive_file)
+            self.last_backup_status.archive_checksum = checksum
+
+        #read the archive once and write it to all destinations in parallel, the copies are hashed while written
+        self.metrics.archive_size = path.getsize(self.last_backup_archive_file)
+        with self.metrics.measure("copy_to_destinations") as stage_metrics:
+            errors = fanout_copy(self.last_backup_archive_file, target_files, reporter=self.reporter,
+                                 expected_checksum=checksum, throttle=self.throttle)
+            stage_metrics.files = len(target_files) - len(errors)
+
+        for destination, target_file in zip(destinations_to_update, target_files):
+            error = errors.get(target_file)
+            if error is not None:
+                self.reporter.error("Copying archive to destination '{0}' failed: {1}".format(destination.name, error))
+                if path.isfile(target_file):
+                    os.remove(target_file)   # do not leave incomplete copies
+                self._record_attempt(destination, backup_time, "failed", error=str(error))
+                continue
 
             #update destination status
             destination_status = self.last_backup_status.get_or_create_destination_status(destination.name)
             destination_status.last_successful_backup_time = backup_time
             destination_status.last_backup_result = "succeded"
+            for object_processor in self.object_processors:
+                object_key = object_processor.backup_object.target_subfolder
+                object_state = object_processor.get_destination_state(destination_status.object_states.get(object_key))
+                if object_state is not None:
+                    destination_status.object_states[object_key] = object_state
+
+            #record the copy in the catalog of the destination folder, delete old copies
+            catalog = CopyCatalog(destination.folder, self.backup_config.name,
+                                  self.backup_config.get_archive_extension())
+            catalog.add_copy(target_file, copy_time, checksum)
+            catalog.apply_retention(RetentionPolicy(num_copies=destination.num_copies, daily=destination.keep_daily,
+                                                    weekly=destination.keep_weekly, monthly=destination.keep_monthly,
+                                                    keep_since=self._get_retained_since(destination_status)))
+            catalog.save()
+
+            self._record_attempt(destination, backup_time, "succeded", bytes_written=path.getsize(target_file))
+            self.metrics.updated_destinations += 1
 
         #save last backup status
         self._save_last_backup_status()
+
+        if errors:
+            raise Exception("Copying archive to {0} of {1} destinations failed."
+                            .format(len(errors), len(destinations_to_update)))
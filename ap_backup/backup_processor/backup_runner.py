@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+
+from ap_backup.throttle import create_throttle
+
+from .backup_processor import BackupProcessor
+
+__author__ = 'Alexander Pikovsky'
+
+
+class BackupResult(object):
+    """Result of processing a single backup configuration."""
+
+    def __init__(self, backup_name, updated_destinations=0, error=None):
+        self.backup_name = backup_name
+        self.updated_destinations = updated_destinations   # number of updated destinations
+        self.error = error   # error message if the backup failed, otherwise None
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+
+def get_source_devices(backup_config):
+    """Returns the set of devices (st_dev) the backup objects of the given config read from."""
+    devices = set()
+    for backup_object in backup_config.backup_objects:
+        for src_path in backup_object.get_source_paths():
+            try:
+                devices.add(os.stat(src_path).st_dev)
+            except OSError:
+                pass    # missing sources are reported by the object processor
+
+    return devices
+
+
+def group_backup_configs_by_device(backup_configs):
+    """
+    Groups backup configs so that configs reading from a common source device are in the same group.
+
+    :returns: list of groups, every group is a list of backup config indexes (in the original order)
+    """
+    group_by_device = {}
+    groups = []
+    for index, backup_config in enumerate(backup_configs):
+        #merge all groups sharing a device with this config
+        group = [index]
+        for device in get_source_devices(backup_config):
+            other_group = group_by_device.get(device)
+            if other_group is not None and other_group is not group:
+                group.extend(other_group)
+                groups.remove(other_group)
+                for other_device, device_group in list(group_by_device.items()):
+                    if device_group is other_group:
+                        group_by_device[other_device] = group
+            group_by_device[device] = group
+        groups.append(group)
+
+    return [sorted(group) for group in groups]
+
+
+def create_global_throttle(app_config):
+    """
+    Returns the throttle with the global rate limits of the given app config (None if unlimited). The limits are
+    shared by the worker processes forked after the creation, so they apply to all parallel backups together.
+    """
+    return create_throttle(app_config.read_rate_limit, app_config.write_rate_limit, shared=True)
+
+
+def run_backup(app_config, backup_config, reporter, global_throttle=None, profiler=None):
+    """
+    Processes the given backup configuration, returns BackupResult. Errors are reported, not raised.
+
+    :param profiler: ap_backup.profiling.Profiler profiling the run; None to not profile
+    """
+    try:
+        backup_processor = BackupProcessor(app_config, backup_config, reporter, global_throttle)
+        if profiler is not None:
+            with profiler.profile(backup_config.name, backup_processor.reporter,
+                                  get_stages=backup_processor.metrics.get_running_stages):
+                updated_destinations = backup_processor.process()
+        else:
+            updated_destinations = backup_processor.process()
+        return BackupResult(backup_config.name, updated_destinations=updated_destinations)
+
+    except Exception as ex:
+        reporter.critical("Backup {0} failed: {1}".format(backup_config.name, str(ex)), exc_info=True)
+        return BackupResult(backup_config.name, error=str(ex))
+
+
+#app_config, backup_configs, reporter, global throttle and profiler of the parallel run, inherited by forked worker
+#processes
+_worker_context = None
+
+
+def _run_backup_group(backup_config_indexes):
+    app_config, backup_configs, reporter, global_throttle, profiler = _worker_context
+    return [run_backup(app_config, backup_configs[index], reporter, global_throttle, profiler)
+            for index in backup_config_indexes]
+
+
+def run_backups(app_config, backup_configs, reporter, jobs=1, group_by_device=False, profiler=None):
+    """
+    Processes the given backup configurations, in parallel worker processes if jobs > 1.
+    Failed backups do not abort the run.
+
+    :param app_config: application config
+    :param backup_configs: list of backup configs to process
+    :param reporter: reporter
+    :param jobs: maximum number of backup configs processed in parallel
+    :param group_by_device: if True, configs reading from the same source device are never processed in parallel
+    :param profiler: ap_backup.profiling.Profiler profiling every backup config; None to not profile
+    :returns: list of BackupResult objects in the order of backup_configs
+    """
+    global _worker_context
+
+    if group_by_device:
+        groups = group_backup_configs_by_device(backup_configs)
+    else:
+        groups = [[index] for index in range(len(backup_configs))]
+
+    global_throttle = create_global_throttle(app_config)
+
+    jobs = min(jobs, len(groups))
+    if jobs <= 1:
+        return [run_backup(app_config, backup_config, reporter, global_throttle, profiler)
+                for backup_config in backup_configs]
+
+    reporter.info("Processing {0} backup configuration(s) in {1} group(s) with {2} parallel jobs..."
+                  .format(len(backup_configs), len(groups), jobs))
+
+    results = [None] * len(backup_configs)
+    _worker_context = (app_config, backup_configs, reporter, global_throttle, profiler)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        #start the largest groups first, they determine the total run time
+        groups.sort(key=len, reverse=True)
+        for group, group_results in zip(groups, pool.imap(_run_backup_group, groups)):
+            for index, result in zip(group, group_results):
+                results[index] = result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _worker_context = None
+
+    return results
@@ -0,0 +1,290 @@
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import multiprocessing
+import os
+import sys
+from croniter import croniter
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from ap_backup.config import AppConfig
+from ap_backup.config.backup_config import BackupConfig
+
+from .backup_runner import BackupResult, create_global_throttle, run_backup
+from .status_store import StatusStore
+
+__author__ = 'Alexander Pikovsky'
+
+
+DEFAULT_CONFIG_CHECK_INTERVAL = 60
+DEFAULT_RETRY_INTERVAL = 900
+DEFAULT_RUN_TIMEOUT = 86400
+
+
+def get_next_due_time(destination, last_successful_backup_time, now):
+    """
+    Returns the time the given destination has to be updated next: now if a scheduled time passed since its last
+    successful backup (see BackupProcessor.is_backup_expired_for_destination()), otherwise its next scheduled time.
+    """
+    schedule = croniter(destination.schedule, now)
+    if last_successful_backup_time is None or schedule.get_prev(datetime) > last_successful_backup_time:
+        return now
+
+    return croniter(destination.schedule, now).get_next(datetime)
+
+
+#reporter, global throttle and profiler of the scheduler, inherited by the forked worker processes
+_worker_reporter = None
+_worker_throttle = None
+_worker_profiler = None
+
+
+def _run_scheduled_backup(config_file, backup_name):
+    """
+    Loads and processes the given backup configuration in a worker process, returns BackupResult. Never raises,
+    so that the scheduler gets a result carrying the backup name for every run (see BackupScheduler._reap_runs()).
+    """
+    try:
+        app_config = AppConfig(config_file)
+        backup_config = app_config.get_backup_configs([backup_name])[0]
+        return run_backup(app_config, backup_config, _worker_reporter, _worker_throttle, _worker_profiler)
+    except Exception as ex:
+        try:
+            _worker_reporter.critical("Backup {0} failed: {1}".format(backup_name, str(ex)), exc_info=True)
+        except Exception:
+            pass    # the result is reported by the scheduler
+        return BackupResult(backup_name, error=str(ex))
+
+
+class BackupScheduler(object):
+    """
+    Backup daemon: keeps the next due time of every destination of every backup configuration in a heap, sleeps
+    until the earliest one and runs the due configurations in a pool of worker processes (every run in a new
+    process, at most `jobs` at a time, never two runs of the same configuration).
+
+    The next due time of a destination is computed when the configuration is loaded and after every run of it,
+    from the schedule and the last successful backup recorded in the status store. A failed run is retried after
+    retry_interval seconds. A run whose worker failed without a result or which did not complete within
+    run_timeout seconds (e.g. its worker process was killed) is given up and handled as failed. Configuration files
+    are checked for changes every config_check_interval seconds and reloaded if changed. The global rate limits are
+    shared by all runs, they are read when the scheduler starts.
+    """
+
+    def __init__(self, config_file, reporter, jobs=1, backup_names=None,
+                 config_check_interval=DEFAULT_CONFIG_CHECK_INTERVAL, retry_interval=DEFAULT_RETRY_INTERVAL,
+                 profiler=None, run_timeout=DEFAULT_RUN_TIMEOUT):
+        """
+        :param config_file: application config file
+        :param backup_names: names of the backup configurations to run; None for all
+        :param profiler: ap_backup.profiling.Profiler profiling every run; None to not profile
+        :param run_timeout: seconds after which a run not completed is given up
+        """
+        self.config_file = config_file
+        self.reporter = reporter
+        self.jobs = max(jobs, 1)
+        self.backup_names = backup_names
+        self.config_check_interval = config_check_interval
+        self.retry_interval = retry_interval
+        self.profiler = profiler
+        self.run_timeout = run_timeout
+
+        self.app_config = None
+        self._config_signature = None
+
+        #dict: backup name -> BackupConfig of the scheduled configurations
+        self._backup_config_by_name = {}
+
+        #heap of tuples (due time, sequence number, backup name, generation, destination name); entries of older
+        #generations of a configuration are outdated and skipped
+        self._due_times = []
+        self._sequence = itertools.count()
+        self._generation_by_name = {}
+
+        #dict: name of a configuration being processed -> tuple (run id, AsyncResult, time the run is given up)
+        self._running = {}
+        self._run_ids = itertools.count()
+
+        #queue of tuples (run id, BackupResult) of completed runs
+        self._completed = queue.Queue()
+
+    def run(self):
+        """Runs until interrupted."""
+        global _worker_reporter, _worker_throttle, _worker_profiler
+
+        self._reload_config()
+
+        _worker_reporter = self.reporter
+        _worker_throttle = create_global_throttle(self.app_config)
+        _worker_profiler = self.profiler
+        pool = multiprocessing.Pool(self.jobs, maxtasksperchild=1)
+        try:
+            next_config_check = datetime.now() + timedelta(seconds=self.config_check_interval)
+            while True:
+                now = datetime.now()
+                if now >= next_config_check:
+                    config_signature = self._get_config_signature(self.app_config)
+                    if config_signature != self._config_signature:
+                        self.reporter.info("Configuration changed, reloading...")
+                        try:
+                            self._reload_config()
+                        except Exception as ex:
+                            #keep the previous configuration until the configuration is changed again
+                            self._config_signature = config_signature
+                            self.reporter.critical("Reloading configuration failed: {0}".format(str(ex)),
+                                                   exc_info=True)
+                    next_config_check = now + timedelta(seconds=self.config_check_interval)
+
+                self._reap_runs(now)
+                for backup_name in self._pop_due_backup_names(now):
+                    self._dispatch(pool, backup_name)
+
+                #sleep until the next due time, a completed run, the timeout of a run or the next configuration check
+                wake_time = next_config_check
+                if self._due_times:
+                    wake_time = min(wake_time, self._due_times[0][0])
+                if self._running:
+                    wake_time = min(wake_time, min(deadline for run_id, async_result, deadline
+                                                   in self._running.values()))
+                try:
+                    run_id, result = self._completed.get(timeout=max(_total_seconds(wake_time - datetime.now()), 0))
+                except queue.Empty:
+                    continue
+                self._handle_result(run_id, result)
+
+        except BaseException:
+            #stopped (e.g. interrupted), running backups are aborted
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _worker_reporter = None
+            _worker_throttle = None
+            _worker_profiler = None
+
+    def _dispatch(self, pool, backup_name):
+        self.reporter.info("Backup {0} due, starting...".format(backup_name))
+        run_id = next(self._run_ids)
+        kwargs = {'callback': lambda result: self._completed.put((run_id, result))}
+        if sys.version_info[0] >= 3:
+            kwargs['error_callback'] = lambda ex: self._completed.put(
+                (run_id, BackupResult(backup_name, error="worker failed: {0}".format(ex))))
+
+        async_result = pool.apply_async(_run_scheduled_backup, (self.app_config.config_file, backup_name), **kwargs)
+        self._running[backup_name] = (run_id, async_result, datetime.now() + timedelta(seconds=self.run_timeout))
+
+    def _reap_runs(self, now):
+        """
+        Handles the runs without a result as failed: runs whose worker raised (Python 2 calls no callback then, e.g.
+        the result could not be returned) and runs not completed within run_timeout (e.g. the worker process was
+        killed, the pool never completes its task).
+        """
+        for backup_name, (run_id, async_result, deadline) in list(self._running.items()):
+            if async_result.ready():
+                if async_result.successful():
+                    continue    # the result is queued by the callback
+                try:
+                    async_result.get(0)
+                    error = "worker failed"
+                except Exception as ex:
+                    error = "worker failed: {0}".format(ex)
+            elif now >= deadline:
+                error = "not completed within {0} seconds, given up (worker process lost?)".format(self.run_timeout)
+            else:
+                continue
+
+            self._handle_result(run_id, BackupResult(backup_name, error=error))
+
+    def _handle_result(self, run_id, result):
+        running = self._running.get(result.backup_name)
+        if running is None or running[0] != run_id:
+            self.reporter.debug("Backup {0}: ignoring the result of a run given up before.".format(result.backup_name))
+            return
+
+        del self._running[result.backup_name]
+        if result.failed:
+            self.reporter.error("Backup {0} failed: {1}, retrying in {2} seconds."
+                                .format(result.backup_name, result.error, self.retry_interval))
+        else:
+            self.reporter.info("Backup {0}: {1} destination(s) updated."
+                               .format(result.backup_name, result.updated_destinations))
+
+        if result.backup_name in self._backup_config_by_name:
+            not_before = datetime.now() + timedelta(seconds=self.retry_interval) if result.failed else None
+            self._schedule([result.backup_name], not_before)
+
+    def _pop_due_backup_names(self, now):
+        """Removes the due entries from the heap, returns the names of the due configurations not running."""
+        backup_names = []
+        while self._due_times and self._due_times[0][0] <= now:
+            due_time, sequence, backup_name, generation, destination_name = heapq.heappop(self._due_times)
+            if generation != self._generation_by_name.get(backup_name):
+                continue    # outdated entry
+
+            #a configuration being processed is rescheduled when its run completes
+            if backup_name not in self._running and backup_name not in backup_names:
+                backup_names.append(backup_name)
+
+        for backup_name in backup_names:
+            self._generation_by_name[backup_name] += 1     # remaining entries are replaced after the run
+        return backup_names
+
+    def _reload_config(self):
+        app_config = AppConfig(self.config_file)
+        backup_configs = [backup_config for backup_config in app_config.get_backup_configs(self.backup_names)
+                          if backup_config.backup_type == BackupConfig.BACKUP_TYPE_ARCHIVE]
+        self.app_config = app_config
+        self._config_signature = self._get_config_signature(app_config)
+        self._backup_config_by_name = dict((backup_config.name, backup_config) for backup_config in backup_configs)
+
+        #forget removed configurations, running configurations are scheduled when their run completes
+        for backup_name in list(self._generation_by_name.keys()):
+            if backup_name not in self._backup_config_by_name:
+                del self._generation_by_name[backup_name]
+        self._schedule([backup_config.name for backup_config in backup_configs
+                        if backup_config.name not in self._running])
+
+        self.reporter.info("Scheduling {0} backup configuration(s).".format(len(backup_configs)))
+
+    def _schedule(self, backup_names, not_before=None):
+        """(Re)computes the due times of all destinations of the given configurations."""
+        now = datetime.now()
+        status_store = StatusStore(self.app_config.status_db_file)
+        try:
+            for backup_name in backup_names:
+                generation = self._generation_by_name.get(backup_name, 0) + 1
+                self._generation_by_name[backup_name] = generation
+
+                status_data = status_store.load_backup_status(backup_name) or {}
+                destination_statuses = status_data.get('destination_statuses', {})
+                for destination in self._backup_config_by_name[backup_name].destination_by_name.values():
+                    destination_status = destination_statuses.get(destination.name, {})
+                    due_time = get_next_due_time(destination, destination_status.get('last_successful_backup_time'),
+                                                 now)
+                    if not_before is not None:
+                        due_time = max(due_time, not_before)
+                    heapq.heappush(self._due_times,
+                                   (due_time, next(self._sequence), backup_name, generation, destination.name))
+        finally:
+            status_store.close()
+
+    def _get_config_signature(self, app_config):
+        """Returns the modification times and sizes of all configuration files and folders of the given config."""
+        paths = [app_config.config_file] + app_config.backup_configs_folders + app_config.backup_config_files
+
+        signature = []
+        for file_path in paths:
+            try:
+                stat_result = os.stat(file_path)
+                signature.append((file_path, stat_result.st_mtime, stat_result.st_size))
+            except OSError:
+                signature.append((file_path, None, None))
+
+        return signature
+
+
+def _total_seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
@@ -1,7 +1,5 @@
-import codecs
 from copy import copy
 import os
-import yaml
             
                        
 class DestinationStatus(object):
@@ -13,34 +11,48 @@ class DestinationStatus(object):
         self.last_successful_backup_time = None
         self.last_backup_attempt_time = None
 
+        #map of backup object key (target subfolder) -> dict with the object state of the last backup copied to
+        #this destination (e.g. last backed up revision for incremental backups)
+        self.object_states = {}
+
     def serialize(self):
         return copy(self.__dict__)
 
     def deserialize(self, data):
-        self.__dict__ = copy(data)
+        self.__dict__.update(copy(data))
 
 
 class BackupStatus(object):
-    """Holds backup status (infos for all destinations)), reads and writes it from/to config file."""
-
-    def get_file_path(self):
-        return os.path.join(self.status_dir, self.backup_name + ".bstat")
-    
-    def __init__(self, backup_name, status_dir):
-        """Loads backup status file if exists, otherwise creates one."""
-        
-        self.status_dir = status_dir
+    """Holds backup status (infos for all destinations)), reads and writes it from/to the status store."""
+
+    def get_legacy_file_path(self):
+        return os.path.join(self.legacy_status_dir, self.backup_name + ".bstat")
+
+    def __init__(self, backup_name, status_store, legacy_status_dir=None):
+        """
+        Loads backup status from the given StatusStore if stored, otherwise creates one.
+
+        :param legacy_status_dir: folder of the YAML status file (<backup_name>.bstat) of older versions, which is
+                                  migrated to the status store if the store holds no status of the backup yet
+        """
+        self.status_store = status_store
+        self.legacy_status_dir = legacy_status_dir
         self.backup_name = backup_name
 
         #map of destination_name -> DestinationStatus
         self.destination_statuses = {}
 
-        #read config file if exists
-        file_path = self.get_file_path()
-        if os.path.exists(file_path):
-            with codecs.open(file_path, mode='r', encoding='utf-8') as in_file:
-                data = yaml.load(in_file)
-                self.deserialize(data)
+        #fingerprint of the sources the last archive in the data folder was created from (None if unknown)
+        self.source_fingerprint = None
+
+        #checksum (sha256 hex digest) of the last archive in the data folder (None if unknown)
+        self.archive_checksum = None
+
+        data = status_store.load_backup_status(backup_name)
+        if data is None and legacy_status_dir is not None and os.path.exists(self.get_legacy_file_path()):
+            data = status_store.migrate_bstat_file(backup_name, self.get_legacy_file_path())
+        if data is not None:
+            self.deserialize(data)
 
     def get_or_create_destination_status(self, destination_name):
         """Gets status for the given destination or creates one (and adds to map) if does not exist."""
@@ -52,22 +64,27 @@ class BackupStatus(object):
         return destination_status
 
     def save(self):
-        data = self.serialize()
-        with open(self.get_file_path(), 'w') as out_file:
-            out_file.write(yaml.safe_dump(data, default_flow_style=False))
+        self.status_store.save_backup_status(self.backup_name, self.serialize())
+
+    def record_attempt(self, attempt):
+        """Records the given BackupAttempt in the history of the status store."""
+        self.status_store.add_attempt(attempt)
 
     def deserialize(self, data):
+        self.source_fingerprint = data.get('source_fingerprint')
+        self.archive_checksum = data.get('archive_checksum')
         self.destination_statuses = {}
-        for destination_name, destination_status_data in data['destination_statuses'].iteritems():
+        for destination_name, destination_status_data in data['destination_statuses'].items():
             destination_status = DestinationStatus(destination_name)
             destination_status.deserialize(destination_status_data)
             self.destination_statuses[destination_name] = destination_status
 
     def serialize(self):
-        data = {'destination_statuses': {}}
+        data = {'destination_statuses': {}, 'source_fingerprint': self.source_fingerprint,
+                'archive_checksum': self.archive_checksum}
 
         destination_statuses = data['destination_statuses']
-        for destination_name, destination_status in self.destination_statuses.iteritems():
+        for destination_name, destination_status in self.destination_statuses.items():
             destination_statuses[destination_name] = destination_status.serialize()
 
         return data
@@ -0,0 +1,172 @@
+import gzip
+import os
+import shutil
+import subprocess
+import threading
+
+__author__ = 'Alexander Pikovsky'
+
+
+COMPRESSION_NONE = None
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+
+#file extensions by compression
+COMPRESSION_EXTENSIONS = {
+    COMPRESSION_NONE: "",
+    COMPRESSION_GZIP: ".gz",
+    COMPRESSION_ZSTD: ".zst",
+}
+
+#buffer size for passing compressed data through this process
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def find_executable(name):
+    """Returns the full path of the given executable found in PATH, None if not found."""
+    for folder in os.environ.get('PATH', '').split(os.pathsep):
+        file_path = os.path.join(folder, name)
+        if os.path.isfile(file_path) and os.access(file_path, os.X_OK):
+            return file_path
+
+    return None
+
+
+class HashingOutput(object):
+    """File-like object writing to the given file and updating the given hash object with all written data."""
+
+    def __init__(self, out_file, file_hash):
+        self.out_file = out_file
+        self.file_hash = file_hash
+
+    def write(self, data):
+        self.file_hash.update(data)
+        self.out_file.write(data)
+
+    def flush(self):
+        self.out_file.flush()
+
+    def close(self):
+        self.out_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _GzipOutput(gzip.GzipFile):
+    """GzipFile closing the given output file object when closed."""
+
+    def __init__(self, out_file, level):
+        gzip.GzipFile.__init__(self, '', 'wb', level, fileobj=out_file)
+        self._out_file = out_file
+
+    def close(self):
+        try:
+            gzip.GzipFile.close(self)
+        finally:
+            self._out_file.close()
+
+
+class PipedCompressorOutput(object):
+    """File-like object writing to a file through an external compressor process (e.g. pigz or zstd)."""
+
+    def __init__(self, file_path, command, file_hash=None):
+        self.file_path = file_path
+        self.command = command
+        self._copy_error = None
+
+        if file_hash is None:
+            self._copy_thread = None
+            with open(file_path, 'wb') as out_file:
+                self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=out_file)
+        else:
+            #compressed data is passed through this process to be hashed while written
+            out_file = HashingOutput(open(file_path, 'wb'), file_hash)
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._copy_thread = threading.Thread(target=self._copy_output, args=(self._process.stdout, out_file))
+            self._copy_thread.daemon = True
+            self._copy_thread.start()
+
+    def _copy_output(self, in_file, out_file):
+        try:
+            with out_file:
+                shutil.copyfileobj(in_file, out_file, COPY_BUFFER_SIZE)
+        except Exception as ex:
+            self._copy_error = ex
+            in_file.close()     # the compressor fails with a broken pipe instead of blocking
+
+    def write(self, data):
+        self._process.stdin.write(data)
+
+    def flush(self):
+        self._process.stdin.flush()
+
+    def close(self):
+        if self._process is None:
+            return
+
+        process, self._process = self._process, None
+        process.stdin.close()
+        return_code = process.wait()
+        if self._copy_thread is not None:
+            self._copy_thread.join()
+        if self._copy_error is not None:
+            raise Exception("Writing '{0}' failed: {1}".format(self.file_path, self._copy_error))
+        if return_code != 0:
+            raise Exception("Compressor '{0}' failed with exit code {1} while writing '{2}'."
+                            .format(" ".join(self.command), return_code, self.file_path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def open_compressed_output(file_path, compression, level=None, threads=0, file_hash=None):
+    """
+    Opens the given file for writing through the given compressor.
+
+    Gzip output is written by pigz (parallel gzip, output is gzip compatible) if installed, otherwise by the
+    gzip module. Zstandard output requires the zstd executable.
+
+    :param file_path: file to write
+    :param compression: one of COMPRESSION_xxx constants
+    :param level: compression level; None for the compressor default
+    :param threads: number of compressor threads; 0 to use all cores
+    :param file_hash: hashlib hash object; if specified, updated with the (compressed) data written to the file
+    :returns: file-like object with write(), flush() and close()
+    """
+    if compression == COMPRESSION_NONE:
+        out_file = open(file_path, 'wb')
+        return HashingOutput(out_file, file_hash) if file_hash is not None else out_file
+
+    if compression == COMPRESSION_GZIP:
+        pigz = find_executable('pigz')
+        if not pigz:
+            level = level if level is not None else 6
+            if file_hash is None:
+                return gzip.GzipFile(file_path, 'wb', compresslevel=level)
+            return _GzipOutput(HashingOutput(open(file_path, 'wb'), file_hash), level)
+
+        command = [pigz, '-c']
+        if threads:
+            command.append('-p{0}'.format(threads))
+
+    elif compression == COMPRESSION_ZSTD:
+        zstd = find_executable('zstd')
+        if not zstd:
+            raise Exception("Zstandard compression requires the 'zstd' executable, which was not found in PATH.")
+
+        command = [zstd, '-c', '-q', '-T{0}'.format(threads)]
+
+    else:
+        raise Exception("Unsupported compression '{0}'.".format(compression))
+
+    if level is not None:
+        command.append('-{0}'.format(level))
+
+    return PipedCompressorOutput(file_path, command, file_hash)
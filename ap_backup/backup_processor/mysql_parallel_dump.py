@@ -0,0 +1,234 @@
+import subprocess
+import tempfile
+import threading
+
+from ap_backup.throttle import ThrottledWriter
+
+from .compressors import open_compressed_output
+
+__author__ = 'Alexander Pikovsky'
+
+
+#comment line written by mysqldump before the data of every table
+TABLE_DATA_MARKER = b"-- Dumping data for table `"
+
+#maximum size of the dump header (the output before the first table data marker, a few KB for mysqldump);
+#output without markers (comments disabled by --skip-comments or --compact) fails the worker when exceeded
+#instead of being buffered in memory while the global read lock is held
+MAX_HEADER_SIZE = 1024 * 1024
+
+#hint of the errors about missing table data markers
+NO_MARKER_HINT = "mysqldump comments must not be disabled (--skip-comments, --compact)"
+
+
+def distribute_tables(table_sizes, num_workers):
+    """
+    Distributes the tables to the workers so that all workers dump about the same amount of data (largest tables
+    first, every table to the least loaded worker, equally loaded workers get the table in turn, e.g. the tables
+    of unknown size 0).
+
+    :param table_sizes: list of tuples (table name, size in bytes)
+    :returns: list of table name lists, one per worker (empty workers are omitted)
+    """
+    workers = [(0, 0, index, []) for index in range(num_workers)]
+    for table_name, size in sorted(table_sizes, key=lambda table_size: table_size[1], reverse=True):
+        load, num_tables, index, tables = min(workers)
+        tables.append(table_name)
+        workers[index] = (load + size, num_tables + 1, index, tables)
+
+    return [tables for load, num_tables, index, tables in workers if tables]
+
+
+class _GlobalReadLock(object):
+    """Global read lock (FLUSH TABLES WITH READ LOCK) held by a mysql client process until released."""
+
+    def __init__(self, mysql_command):
+        self._process = subprocess.Popen(mysql_command + ['--batch', '--skip-column-names', '--unbuffered'],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._process.stdin.write(b"FLUSH TABLES WITH READ LOCK;\nSELECT 'locked';\n")
+        self._process.stdin.flush()
+
+        if self._process.stdout.readline().strip() != b"locked":
+            self.release()
+            raise Exception("Cannot acquire the global read lock.")
+
+    def release(self):
+        if self._process is None:
+            return
+
+        process, self._process = self._process, None
+        try:
+            process.stdin.write(b"UNLOCK TABLES;\n")
+            process.stdin.close()
+        except (IOError, OSError):
+            pass    # client already exited, the lock is released with the connection
+        process.wait()
+
+
+class _DumpWorker(threading.Thread):
+    """
+    Runs a mysqldump process dumping the data of the given tables in a single transaction and splits its output
+    into one (compressed) file per table. The header of the dump (session settings) is written to every file.
+    The split relies on the TABLE_DATA_MARKER comments, the worker fails if mysqldump does not write them.
+    """
+
+    def __init__(self, mysqldump_command, tables, get_table_file_path, compression, compression_level,
+                 throttle=None):
+        super(_DumpWorker, self).__init__()
+        self.daemon = True
+
+        self.tables = tables
+        self.get_table_file_path = get_table_file_path
+        self.compression = compression
+        self.compression_level = compression_level
+        self.throttle = throttle
+
+        #set as soon as the consistent snapshot of the worker is established (or the worker failed)
+        self.snapshot_started = threading.Event()
+
+        #exception raised by the worker (None if succeeded)
+        self.error = None
+
+        self._stderr_file = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(mysqldump_command + tables, stdout=subprocess.PIPE,
+                                         stderr=self._stderr_file)
+
+    def abort(self):
+        """Kills the mysqldump process, the worker fails."""
+        if self._process.poll() is None:
+            self._process.kill()
+
+    def run(self):
+        header_lines = []
+        header_size = 0
+        out_file = None
+        try:
+            for line in iter(self._process.stdout.readline, b""):
+                if line.startswith(TABLE_DATA_MARKER):
+                    #data is dumped after the transaction is started
+                    self.snapshot_started.set()
+
+                    if out_file is not None:
+                        out_file.close()
+                    table_name = line[len(TABLE_DATA_MARKER):].split(b"`")[0].decode('utf-8')
+                    out_file = open_compressed_output(self.get_table_file_path(table_name), self.compression,
+                                                      self.compression_level)
+                    if self.throttle is not None:
+                        out_file = ThrottledWriter(out_file, self.throttle)
+                    for header_line in header_lines:
+                        out_file.write(header_line)
+
+                if out_file is None:
+                    header_size += len(line)
+                    if header_size > MAX_HEADER_SIZE:
+                        raise Exception("mysqldump wrote more than {0} bytes without a table data marker, {1}."
+                                        .format(MAX_HEADER_SIZE, NO_MARKER_HINT))
+                    header_lines.append(line)
+                else:
+                    out_file.write(line)
+
+            no_table_data = out_file is None
+            if out_file is not None:
+                out_file, last_out_file = None, out_file
+                last_out_file.close()
+
+            return_code = self._process.wait()
+            if return_code != 0:
+                self._stderr_file.seek(0)
+                raise Exception("mysqldump failed with exit code {0}: {1}"
+                                .format(return_code, self._stderr_file.read().decode('utf-8', 'replace').strip()))
+            if no_table_data and self.tables:
+                raise Exception("mysqldump wrote no table data marker for tables {0}, {1}."
+                                .format(", ".join(self.tables), NO_MARKER_HINT))
+
+        except Exception as ex:
+            self.error = ex
+            if self._process.poll() is None:
+                self._process.kill()
+                self._process.wait()
+
+        finally:
+            if out_file is not None:
+                try:
+                    out_file.close()
+                except Exception:
+                    pass
+            self._stderr_file.close()
+            self.snapshot_started.set()
+
+
+class ParallelMySqlDump(object):
+    """
+    Dumps the tables of a database over several connections in parallel, consistent with each other.
+
+    A global read lock is held while the workers (mysqldump processes with --single-transaction) start their
+    transactions, so all workers see the same snapshot. The lock is released as soon as every worker started
+    dumping data. The consistency is only guaranteed for transactional tables (InnoDB).
+
+    The throttle limits the data dump only: the schema is dumped while the global read lock is held.
+    """
+
+    def __init__(self, mysql_command, mysqldump_command, database, reporter, throttle=None):
+        """
+        :param mysql_command: mysql client command line with connection options (without database)
+        :param mysqldump_command: mysqldump command line with connection and output options (without database)
+        :param database: database to dump
+        :param reporter: reporter
+        :param throttle: ap_backup.throttle.Throttle limiting the rate the table dumps are written; None for unlimited
+        """
+        self.mysql_command = mysql_command
+        self.mysqldump_command = mysqldump_command
+        self.database = database
+        self.reporter = reporter
+        self.throttle = throttle
+
+    def dump(self, table_sizes, num_workers, schema_file_path, get_table_file_path, compression=None,
+             compression_level=None):
+        """
+        Dumps the schema to schema_file_path and the data of every table to get_table_file_path(table_name).
+
+        :param table_sizes: list of tuples (table name, size in bytes) of the tables to dump
+        :param num_workers: maximum number of parallel connections dumping data
+        """
+        worker_tables = distribute_tables(table_sizes, num_workers)
+
+        self.reporter.info("Acquiring global read lock...")
+        read_lock = _GlobalReadLock(self.mysql_command + [self.database])
+        workers = []
+        try:
+            data_command = self.mysqldump_command + ['--single-transaction', '--skip-lock-tables', '--no-create-info',
+                                                     '--skip-triggers', self.database]
+            for tables in worker_tables:
+                workers.append(_DumpWorker(data_command, tables, get_table_file_path, compression,
+                                           compression_level, self.throttle))
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.snapshot_started.wait()
+
+            #schema is dumped while the lock is held, so that it matches the data
+            self.reporter.info("Dumping schema of database '{0}'...".format(self.database))
+            schema_command = self.mysqldump_command + ['--single-transaction', '--skip-lock-tables', '--no-data',
+                                                       self.database]
+            with open_compressed_output(schema_file_path, compression, compression_level) as out_file:
+                schema_process = subprocess.Popen(schema_command, stdout=subprocess.PIPE)
+                for data in iter(lambda: schema_process.stdout.read(1024 * 1024), b""):
+                    out_file.write(data)
+                if schema_process.wait() != 0:
+                    raise Exception("Schema dump of database '{0}' failed.".format(self.database))
+
+        except Exception:
+            for worker in workers:
+                worker.abort()
+            raise
+
+        finally:
+            read_lock.release()
+            self.reporter.info("Global read lock released, dumping {0} tables with {1} workers..."
+                               .format(len(table_sizes), len(workers)))
+            for worker in workers:
+                worker.join()
+
+        errors = [str(worker.error) for worker in workers if worker.error is not None]
+        if errors:
+            raise Exception("Parallel dump of database '{0}' failed: {1}".format(self.database, "; ".join(errors)))
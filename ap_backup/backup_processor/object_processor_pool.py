@@ -0,0 +1,92 @@
+import threading
+
+__author__ = 'Alexander Pikovsky'
+
+
+class ObjectProcessorPool(object):
+    """
+    Runs backup object processors on a pool of worker threads.
+
+    Objects of the same type and concurrency group (see BackupObject.get_concurrency_group()) are limited
+    by the concurrency limits of the backup config. A worker never blocks on a saturated group while another
+    pending object could run, it takes the first pending object whose group has free capacity.
+    """
+
+    def __init__(self, max_parallel, concurrency_limits, reporter):
+        """
+        :param max_parallel: maximum number of objects processed in parallel
+        :param concurrency_limits: dict: object type -> maximum number of parallel objects per concurrency group
+        :param reporter: reporter
+        """
+        self.max_parallel = max_parallel
+        self.concurrency_limits = concurrency_limits
+        self.reporter = reporter
+
+        self._condition = threading.Condition()
+        self._pending = None
+        self._running_by_group = None
+        self._failures = None
+
+    def run(self, object_processors, action):
+        """
+        Calls action(object_processor) for all given object processors. Failures do not stop other objects,
+        every failure is reported.
+
+        :returns: list of (object_processor, exception) tuples for failed objects
+        """
+        self._pending = list(object_processors)
+        self._running_by_group = {}
+        self._failures = []
+
+        num_workers = min(self.max_parallel, len(self._pending))
+        workers = [threading.Thread(target=self._worker, args=(action,), name="object-worker-{0}".format(i))
+                   for i in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        return self._failures
+
+    def _get_group(self, object_processor):
+        backup_object = object_processor.backup_object
+        if backup_object.object_type not in self.concurrency_limits:
+            return None
+        return backup_object.object_type, backup_object.get_concurrency_group()
+
+    def _take_next(self):
+        """Takes the next pending object processor which may run now. Must be called with the condition acquired.
+           Returns (None, None) if no objects are pending."""
+        while self._pending:
+            for i, object_processor in enumerate(self._pending):
+                group = self._get_group(object_processor)
+                if group is None or self._running_by_group.get(group, 0) < self.concurrency_limits[group[0]]:
+                    del self._pending[i]
+                    if group is not None:
+                        self._running_by_group[group] = self._running_by_group.get(group, 0) + 1
+                    return object_processor, group
+
+            #all pending objects are limited by their groups, wait for a running object to finish
+            self._condition.wait()
+
+        return None, None
+
+    def _worker(self, action):
+        while True:
+            with self._condition:
+                object_processor, group = self._take_next()
+            if object_processor is None:
+                return
+
+            try:
+                action(object_processor)
+            except Exception as ex:
+                self.reporter.error("Backup of {0} failed: {1}".format(object_processor.backup_object, str(ex)),
+                                    exc_info=True)
+                with self._condition:
+                    self._failures.append((object_processor, ex))
+            finally:
+                with self._condition:
+                    if group is not None:
+                        self._running_by_group[group] -= 1
+                    self._condition.notify_all()
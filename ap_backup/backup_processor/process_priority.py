@@ -0,0 +1,30 @@
+from ap_backup.config.backup_config import BackupConfig
+
+from .compressors import find_executable
+
+__author__ = 'Alexander Pikovsky'
+
+
+def get_priority_command_prefix(backup_config):
+    """
+    Returns the command line prefix (list) running a child process with the nice and ionice settings of the given
+    backup config, e.g. ['/usr/bin/ionice', '-c', '3', '/usr/bin/nice', '-n', '10']; empty list if not configured.
+    """
+    prefix = []
+    if backup_config.ionice_class is not None:
+        ionice = find_executable('ionice')
+        if ionice is None:
+            raise Exception("Setting the I/O priority requires the 'ionice' executable, which was not found in PATH.")
+
+        prefix.extend([ionice, '-c', str(BackupConfig.IONICE_CLASSES[backup_config.ionice_class])])
+        if backup_config.ionice_level is not None and backup_config.ionice_class != BackupConfig.IONICE_CLASS_IDLE:
+            prefix.extend(['-n', str(backup_config.ionice_level)])
+
+    if backup_config.nice is not None:
+        nice = find_executable('nice')
+        if nice is None:
+            raise Exception("Setting the process priority requires the 'nice' executable, which was not found in PATH.")
+
+        prefix.extend([nice, '-n', str(backup_config.nice)])
+
+    return prefix
@@ -0,0 +1,219 @@
+from datetime import datetime
+import codecs
+import os
+import sqlite3
+import yaml
+
+__author__ = 'Alexander Pikovsky'
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+#seconds a connection waits for a lock held by a concurrent run
+LOCK_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backup_status (
+    backup_name TEXT PRIMARY KEY,
+    source_fingerprint TEXT,
+    archive_checksum TEXT
+);
+
+CREATE TABLE IF NOT EXISTS destination_status (
+    backup_name TEXT NOT NULL,
+    destination_name TEXT NOT NULL,
+    last_backup_result TEXT,
+    last_successful_backup_time TEXT,
+    last_backup_attempt_time TEXT,
+    object_states TEXT,
+    PRIMARY KEY (backup_name, destination_name)
+);
+
+CREATE TABLE IF NOT EXISTS backup_attempt (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    backup_name TEXT NOT NULL,
+    destination_name TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    duration REAL NOT NULL,
+    result TEXT NOT NULL,
+    bytes_written INTEGER,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS backup_attempt_destination ON backup_attempt (backup_name, destination_name, start_time);
+"""
+
+
+def _format_time(value):
+    return value.strftime(TIMESTAMP_FORMAT) if value is not None else None
+
+
+def _parse_time(value):
+    return datetime.strptime(value, TIMESTAMP_FORMAT) if value is not None else None
+
+
+class BackupAttempt(object):
+    """Record of a single attempt to update a destination of a backup."""
+
+    def __init__(self, backup_name, destination_name, start_time, end_time, result, bytes_written=None, error=None):
+        self.backup_name = backup_name
+        self.destination_name = destination_name
+        self.start_time = start_time
+        self.end_time = end_time
+        self.result = result
+        self.bytes_written = bytes_written   # size of the copy written to the destination; None if failed
+        self.error = error   # error message if failed, otherwise None
+
+    @property
+    def duration(self):
+        delta = self.end_time - self.start_time
+        return delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
+
+
+class StatusStore(object):
+    """
+    SQLite database holding the backup statuses of all backup configs and the history of backup attempts.
+
+    The database runs in WAL mode: every save is a single short transaction, readers (e.g. reports across all
+    configs) are never blocked by a running backup and concurrent backup runs wait for each other's writes.
+    A connection must not be shared between processes, every (worker) process opens its own store.
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+
+        db_folder = os.path.dirname(db_file)
+        if db_folder and not os.path.exists(db_folder):
+            os.makedirs(db_folder)
+
+        #autocommit mode, transactions are started explicitly (see _transaction())
+        self._connection = sqlite3.connect(db_file, timeout=LOCK_TIMEOUT, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+
+        #the schema is created in a write transaction, so that processes opening a new database concurrently wait
+        #for each other (executescript() fails with "database schema has changed" if another process creates it)
+        with self._transaction():
+            for statement in _SCHEMA.split(";"):
+                if statement.strip():
+                    self._connection.execute(statement)
+
+    def close(self):
+        self._connection.close()
+
+    def load_backup_status(self, backup_name):
+        """Returns the status data of the given backup (see BackupStatus.serialize()), None if not stored."""
+        row = self._connection.execute(
+            "SELECT source_fingerprint, archive_checksum FROM backup_status WHERE backup_name = ?",
+            (backup_name,)).fetchone()
+        if row is None:
+            return None
+
+        data = {'source_fingerprint': row[0], 'archive_checksum': row[1], 'destination_statuses': {}}
+        for row_backup_name, destination_name, destination_data in self._query_destination_statuses(backup_name):
+            data['destination_statuses'][destination_name] = destination_data
+
+        return data
+
+    def save_backup_status(self, backup_name, data):
+        """Stores the status data of the given backup (see BackupStatus.serialize()) in one transaction."""
+        with self._transaction():
+            self._connection.execute(
+                "INSERT OR REPLACE INTO backup_status (backup_name, source_fingerprint, archive_checksum) "
+                "VALUES (?, ?, ?)",
+                (backup_name, data.get('source_fingerprint'), data.get('archive_checksum')))
+
+            for destination_name, destination_data in data['destination_statuses'].items():
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO destination_status (backup_name, destination_name, last_backup_result, "
+                    "last_successful_backup_time, last_backup_attempt_time, object_states) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (backup_name, destination_name, destination_data.get('last_backup_result'),
+                     _format_time(destination_data.get('last_successful_backup_time')),
+                     _format_time(destination_data.get('last_backup_attempt_time')),
+                     yaml.safe_dump(destination_data.get('object_states') or {}, default_flow_style=False)))
+
+    def get_destination_statuses(self):
+        """Returns the list of tuples (backup name, destination name, status data) of all backups."""
+        return list(self._query_destination_statuses())
+
+    def add_attempt(self, attempt):
+        """Records the given BackupAttempt."""
+        with self._transaction():
+            self._connection.execute(
+                "INSERT INTO backup_attempt (backup_name, destination_name, start_time, end_time, duration, result, "
+                "bytes_written, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (attempt.backup_name, attempt.destination_name, _format_time(attempt.start_time),
+                 _format_time(attempt.end_time), attempt.duration, attempt.result, attempt.bytes_written,
+                 attempt.error))
+
+    def get_attempts(self, backup_name=None, destination_name=None, limit=None):
+        """Returns the recorded BackupAttempt objects (newest first), optionally filtered."""
+        query = "SELECT backup_name, destination_name, start_time, end_time, result, bytes_written, error " \
+                "FROM backup_attempt"
+        conditions = []
+        parameters = []
+        if backup_name is not None:
+            conditions.append("backup_name = ?")
+            parameters.append(backup_name)
+        if destination_name is not None:
+            conditions.append("destination_name = ?")
+            parameters.append(destination_name)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY start_time DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+
+        return [BackupAttempt(row[0], row[1], _parse_time(row[2]), _parse_time(row[3]), row[4], row[5], row[6])
+                for row in self._connection.execute(query, parameters)]
+
+    def migrate_bstat_file(self, backup_name, file_path):
+        """
+        Imports the given YAML status file of older versions, renames it to <file>.migrated.
+        Returns the imported status data.
+        """
+        with codecs.open(file_path, mode='r', encoding='utf-8') as in_file:
+            data = yaml.safe_load(in_file) or {}
+        data.setdefault('destination_statuses', {})
+
+        self.save_backup_status(backup_name, data)
+        try:
+            os.rename(file_path, file_path + ".migrated")
+        except OSError:
+            if os.path.exists(file_path):
+                raise   # otherwise migrated by a concurrent run
+        return data
+
+    def _query_destination_statuses(self, backup_name=None):
+        query = "SELECT backup_name, destination_name, last_backup_result, last_successful_backup_time, " \
+                "last_backup_attempt_time, object_states FROM destination_status"
+        parameters = ()
+        if backup_name is not None:
+            query += " WHERE backup_name = ?"
+            parameters = (backup_name,)
+
+        for row in self._connection.execute(query, parameters):
+            yield row[0], row[1], {'destination_name': row[1],
+                                   'last_backup_result': row[2],
+                                   'last_successful_backup_time': _parse_time(row[3]),
+                                   'last_backup_attempt_time': _parse_time(row[4]),
+                                   'object_states': yaml.safe_load(row[5]) if row[5] else {}}
+
+    def _transaction(self):
+        return _Transaction(self._connection)
+
+
+class _Transaction(object):
+    """Write transaction; the database is locked for writing on begin, so that concurrent writers wait."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
@@ -1 +1,5 @@
-from .check_processor import CheckProcessor
\ No newline at end of file
+from .check_processor import CheckProcessor
+from .checker_daemon import CheckerDaemon
+from .concurrent_checker import CheckResult, run_checks
+from .latest_file_cache import LatestFileCache
+from .verification import CopyVerifier, VerificationCache
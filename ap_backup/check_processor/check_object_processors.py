@@ -4,9 +4,10 @@ import os
 from croniter import croniter
 
 from ap_backup.config import CheckObjectRecentFileExists, CheckObjectCompareFileToSrc
+from ap_backup.metrics import BackupCopyState
 
 from .check_object_processor_manager import check_object_processor_class
-from .utils import check_recent_file_exists
+from .utils import check_recent_file_exists, find_latest_file_time
 
 
 class CheckObjectProcessor(object):
@@ -32,11 +33,21 @@ class CheckObjectRecentFileExistsProcessor(CheckObjectProcessor) :
         super(CheckObjectRecentFileExistsProcessor, self).__init__(check_object, check_processor)
 
     def process(self):
+        latest_file_time = None
+        if self.check_processor.backup_states is not None:
+            latest_file_time = find_latest_file_time(self.check_object.backup_folder,
+                                                     self.check_object.backup_file_name_pattern,
+                                                     self.check_processor.latest_file_cache)
+            self.check_processor.backup_states.append(
+                BackupCopyState(self.backup_config.name, self.check_object.backup_folder, latest_file_time))
+
         return check_recent_file_exists(self.check_object.backup_folder,
                                         self.check_object.backup_file_name_pattern,
                                         self.check_object.schedule,
                                         self.backup_config.checker_accuracy_days,
-                                        self.reporter)
+                                        self.reporter,
+                                        cache=self.check_processor.latest_file_cache,
+                                        latest_file_time=latest_file_time)
 
 
 @check_object_processor_class(CheckObjectCompareFileToSrc)
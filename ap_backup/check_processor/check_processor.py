@@ -1,7 +1,15 @@
+from datetime import datetime, timedelta
+import os
+from croniter import croniter
+
 from ap_backup.config.backup_config import BackupConfig
+from ap_backup.manifest import Manifest
+from ap_backup.metrics import BackupCopyState
+from ap_backup.multicopy import CopyCatalog
 
 from .check_object_processor_manager import check_object_processor_manager
-from .utils import check_recent_file_exists
+from .utils import check_recent_file_exists, check_manifest_up_to_date
+from .verification import VERIFIED_RECENTLY
 
 # Import all work object processor classes, this will register them in backup_object_processor_manager
 # noinspection PyUnresolvedReferences
@@ -11,13 +19,31 @@ from .check_object_processors import \
     CheckObjectCompareFileToSrcProcessor
 
 
+class Check(object):
+    """Single check of a backup configuration (see CheckProcessor.get_checks())."""
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function   # function without arguments returning True if up-to-date
+
+    def run(self):
+        return self.function()
+
+
 class CheckProcessor:
     """Processes the given backup configuration (makes backup)."""
        
-    def __init__(self, app_config, backup_config, reporter):
+    def __init__(self, app_config, backup_config, reporter, latest_file_cache=None, copy_verifier=None,
+                 backup_states=None):
         self.app_config = app_config
         self.backup_config = backup_config
         self.reporter = reporter.reporter(logger_name='protocol')
+        self.latest_file_cache = latest_file_cache   # LatestFileCache or None
+        self.copy_verifier = copy_verifier   # CopyVerifier used by the verify checks or None
+
+        #list the checks append the BackupCopyState of every checked destination or folder to (for metrics);
+        #None to not collect them
+        self.backup_states = backup_states
 
     def check(self):
         """Checks the given backup configuration (checks whether all backups are up-to-date).
@@ -25,37 +51,111 @@ class CheckProcessor:
         
         self.reporter.info("Checking backup '{0}'...".format(self.backup_config.name))
 
+        #run all checks, so that every out-of-date backup is reported
+        checks = self.get_checks()
+        failed_checks = [check for check in checks if not check.run()]
+        if failed_checks:
+            return False
+
+        self.reporter.info("Backup '{0}' checked: {1} checks passed.".format(self.backup_config.name, len(checks)))
+        return True
+
+    def get_checks(self):
+        """Returns the list of independent checks (Check objects) of the backup configuration."""
         if self.backup_config.backup_type == BackupConfig.BACKUP_TYPE_ARCHIVE:
-            return self.check_archive_config()
+            return self.get_archive_config_checks()
         elif self.backup_config.backup_type == BackupConfig.BACKUP_TYPE_CHECKER:
-            return self.check_checker_config()
+            return self.get_checker_config_checks()
         else:
             raise Exception("Unsupported backup type '{0}' in backup '{1}'"
                             .format(self.backup_config.backup_type, self.backup_config.name))
-                  
-    def check_archive_config(self):
-        for destination in self.backup_config.destination_by_name.values():
-            if (not check_recent_file_exists(destination.folder,
-                                             self.backup_config.name + "_*.zip",
-                                             destination.schedule,
-                                             self.backup_config.checker_accuracy_days,
-                                             self.reporter)):
-                return False
-
-        self.reporter.info("Backup '{0}' checked: {1} destinations up-to-date."
-                           .format(self.backup_config.name, len(self.backup_config.destination_by_name)))
-        return True
 
-    def check_checker_config(self):
+    def get_archive_config_checks(self):
+        checks = [Check("destination '{0}'".format(destination.name),
+                        lambda destination=destination: self.check_destination(destination))
+                  for destination in self.backup_config.destination_by_name.values()]
+        checks.append(Check("manifest", self.check_manifest))
+        return checks
+
+    def check_destination(self, destination):
+        if self.backup_states is not None and os.path.isdir(destination.folder):
+            #catalog is only read, it is maintained by the backup processor
+            catalog = CopyCatalog(destination.folder, self.backup_config.name,
+                                  self.backup_config.get_archive_extension())
+            last_entry = catalog.get_last_entry()
+            self.backup_states.append(BackupCopyState(self.backup_config.name, destination.name,
+                                                      last_entry.timestamp if last_entry else None,
+                                                      last_entry.size if last_entry else None,
+                                                      len(catalog.entries)))
+
+        return check_recent_file_exists(destination.folder,
+                                        self.backup_config.name + "_*" + self.backup_config.get_archive_extension(),
+                                        destination.schedule,
+                                        self.backup_config.checker_accuracy_days,
+                                        self.reporter,
+                                        cache=self.latest_file_cache)
+
+    def check_manifest(self):
+        """Checks the sources against the manifest of the last backup (if the backup maintains a manifest):
+           no source file may have been modified before the last scheduled backup time minus the accuracy."""
+        manifest_file = os.path.join(self.backup_config.data_folder, Manifest.FILE_NAME)
+        if not os.path.exists(manifest_file) or not self.backup_config.destination_by_name:
+            return True
+
+        current_time = datetime.now()
+        last_trigger = max(croniter(destination.schedule, current_time).get_prev(datetime)
+                           for destination in self.backup_config.destination_by_name.values())
+        min_time = last_trigger - timedelta(days=self.backup_config.checker_accuracy_days)
+
+        return check_manifest_up_to_date(Manifest(manifest_file), min_time, self.reporter)
+
+    def get_verify_checks(self):
+        """Returns the checks verifying the copies in the destinations against their recorded checksums, one per
+           destination (copies in one destination are usually on one device and are verified one after another)."""
+        if self.backup_config.backup_type != BackupConfig.BACKUP_TYPE_ARCHIVE:
+            return []
+
+        return [Check("verify destination '{0}'".format(destination.name),
+                      lambda destination=destination: self.verify_destination(destination))
+                for destination in self.backup_config.destination_by_name.values()]
+
+    def verify_destination(self, destination):
+        """Verifies all copies recorded in the catalog of the destination. Returns True if all intact."""
+        #catalog is only read, it is maintained by the backup processor
+        catalog = CopyCatalog(destination.folder, self.backup_config.name, self.backup_config.get_archive_extension())
+
+        verified = skipped = unknown = 0
+        corrupted = []
+        for entry in catalog.entries:
+            copy_path = catalog.get_copy_path(entry)
+            if entry.checksum is None:
+                unknown += 1
+                continue
+            if not os.path.isfile(copy_path):
+                continue    # copy deleted meanwhile
+
+            result = self.copy_verifier.verify(copy_path, entry.size, entry.checksum)
+            if result is True:
+                verified += 1
+            elif result == VERIFIED_RECENTLY:
+                skipped += 1
+            else:
+                corrupted.append(copy_path)
+                self.reporter.error("Backup copy CORRUPTED: '{0}': {1}".format(copy_path, result))
+
+        self.reporter.info("Destination '{0}' of backup '{1}': {2} copies verified, {3} verified recently, "
+                           "{4} without checksum, {5} corrupted."
+                           .format(destination.name, self.backup_config.name, verified, skipped, unknown,
+                                   len(corrupted)))
+        return not corrupted
+
+    def get_checker_config_checks(self):
+        checks = []
         for check_object in self.backup_config.backup_objects:
             object_processor = check_object_processor_manager.create_processor(check_object, self)
             if not object_processor:
                 raise Exception("Unsupported check object type '{0}'.".format(type(check_object).__name__))
 
-            #check
-            if not object_processor.process():
-                return False
+            checks.append(Check(str(check_object), object_processor.process))
 
-        self.reporter.info("Backup '{0}' checked: {1} objects up-to-date."
-                           .format(self.backup_config.name, len(self.backup_config.backup_objects)))
-        return True
+        return checks
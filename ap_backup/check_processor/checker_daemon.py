@@ -0,0 +1,229 @@
+from datetime import datetime, timedelta
+import glob
+import heapq
+import itertools
+import os
+import select
+import time
+from croniter import croniter
+
+from ap_backup.config import CheckObjectRecentFileExists
+from ap_backup.config.backup_config import BackupConfig
+
+from . import inotify
+from .utils import find_latest_file_time
+
+__author__ = 'Alexander Pikovsky'
+
+
+DEFAULT_RESCAN_INTERVAL = 3600
+
+
+class FreshnessWatch(object):
+    """Latest backup file time of a folder and file name pattern, which must be renewed according to a schedule."""
+
+    def __init__(self, backup_name, folder, pattern, schedule, accuracy_days):
+        self.backup_name = backup_name
+        self.folder = folder
+        self.pattern = pattern
+        self.schedule = schedule
+        self.accuracy_days = accuracy_days
+
+        self.latest_file_time = None   # datetime of the latest matching file, None if no file found
+        self.stale = False   # True if reported as out-of-date
+
+    def __str__(self):
+        return "backup '{0}', files '{1}' in '{2}'".format(self.backup_name, self.pattern, self.folder)
+
+    def update(self):
+        self.latest_file_time = find_latest_file_time(self.folder, self.pattern)
+
+    def get_watched_folders(self):
+        """
+        Returns the folders in which the matching files are added, i.e. the subfolder of a pattern with subfolders.
+        For wildcards in the subfolders the existing matching subfolders are returned together with the first folder
+        without wildcards, in which the new subfolders are created.
+        """
+        pattern_folder = os.path.dirname(os.path.join(self.folder, self.pattern))
+        if not glob.has_magic(pattern_folder):
+            return [pattern_folder]
+
+        base_folder = pattern_folder
+        while glob.has_magic(base_folder):
+            base_folder = os.path.dirname(base_folder)
+        return [base_folder] + sorted(glob.glob(pattern_folder))
+
+    def get_deadline(self):
+        """
+        Returns the time the backup becomes out-of-date, i.e. the first scheduled time for which the latest file is
+        older than the accuracy (see check_recent_file_exists). None if out-of-date already (no file found).
+        """
+        if self.latest_file_time is None:
+            return None
+
+        return croniter(self.schedule, self.latest_file_time + timedelta(days=self.accuracy_days)).get_next(datetime)
+
+
+def get_freshness_watches(backup_configs):
+    """Returns FreshnessWatch objects for the destinations and recent file checks of the given backup configs."""
+    watches = []
+    for backup_config in backup_configs:
+        if backup_config.backup_type == BackupConfig.BACKUP_TYPE_ARCHIVE:
+            pattern = backup_config.name + "_*" + backup_config.get_archive_extension()
+            for destination in backup_config.destination_by_name.values():
+                watches.append(FreshnessWatch(backup_config.name, destination.folder, pattern, destination.schedule,
+                                              backup_config.checker_accuracy_days))
+
+        elif backup_config.backup_type == BackupConfig.BACKUP_TYPE_CHECKER:
+            for check_object in backup_config.backup_objects:
+                if isinstance(check_object, CheckObjectRecentFileExists):
+                    watches.append(FreshnessWatch(backup_config.name, check_object.backup_folder,
+                                                  check_object.backup_file_name_pattern, check_object.schedule,
+                                                  backup_config.checker_accuracy_days))
+
+    return watches
+
+
+class CheckerDaemon(object):
+    """
+    Long-running checker: watches the backup folders with inotify, keeps the latest backup file time per folder
+    and pattern in memory and reports a backup as out-of-date as soon as its deadline passes (no folder is
+    scanned while nothing changes). The folder watched for a pattern with subfolders is the subfolder containing
+    the files (see FreshnessWatch.get_watched_folders()). Folders are additionally rescanned every rescan_interval
+    seconds, which also covers platforms without inotify and network mounts not reporting remote changes.
+
+    Only the freshness of destinations and recent_file_exists checks is tracked, other checks (manifest,
+    compare_file_to_src) are left to the regular checker runs.
+    """
+
+    def __init__(self, backup_configs, reporter, rescan_interval=DEFAULT_RESCAN_INTERVAL):
+        self.reporter = reporter
+        self.rescan_interval = rescan_interval
+        self.watches = get_freshness_watches(backup_configs)
+
+        #heap of tuples (deadline, sequence number, watch), outdated entries are skipped
+        self._deadlines = []
+        self._sequence = itertools.count()
+        self._deadline_by_watch = {}
+
+        self._inotify = inotify.Inotify() if inotify.is_available() else None
+
+        #dict: watch descriptor -> (folder, list of watches of the folder)
+        self._folder_watches = {}
+
+    def run(self):
+        """Runs until interrupted."""
+        self.reporter.info("Checker daemon started: {0} backup folder pattern(s), inotify {1}."
+                           .format(len(self.watches), "enabled" if self._inotify else "not available"))
+        self._add_folder_watches()
+        self._rescan(self.watches)
+
+        next_rescan = time.time() + self.rescan_interval
+        try:
+            while True:
+                self._report_expired()
+
+                wait_time = next_rescan - time.time()
+                if self._deadlines:
+                    wait_time = min(wait_time, _total_seconds(self._deadlines[0][0] - datetime.now()))
+                wait_time = max(wait_time, 0)
+
+                if self._inotify is not None:
+                    readable = select.select([self._inotify.fd], [], [], wait_time)[0]
+                    if readable:
+                        self._handle_events(self._inotify.read_events())
+                else:
+                    time.sleep(wait_time)
+
+                if time.time() >= next_rescan:
+                    self._add_folder_watches()     # folders may have been created meanwhile
+                    self._rescan(self.watches)
+                    next_rescan = time.time() + self.rescan_interval
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+    def _add_folder_watches(self, watches=None):
+        """Watches the folders of the given watches (all by default) not watched yet."""
+        if self._inotify is None:
+            return
+
+        descriptor_by_folder = dict((folder, watch_descriptor)
+                                    for watch_descriptor, (folder, _) in self._folder_watches.items())
+        failed_folders = set()
+        for watch in watches if watches is not None else self.watches:
+            for folder in watch.get_watched_folders():
+                watch_descriptor = descriptor_by_folder.get(folder)
+                if watch_descriptor is None:
+                    if folder in failed_folders:
+                        continue
+                    try:
+                        watch_descriptor = self._inotify.add_watch(folder)
+                    except OSError as ex:
+                        self.reporter.error("Cannot watch backup folder '{0}': {1}".format(folder, ex))
+                        failed_folders.add(folder)
+                        continue
+                    descriptor_by_folder[folder] = watch_descriptor
+                    self._folder_watches[watch_descriptor] = (folder, [])
+
+                folder_watches = self._folder_watches[watch_descriptor][1]
+                if watch not in folder_watches:
+                    folder_watches.append(watch)
+
+    def _handle_events(self, events):
+        changed_watches = []
+        for watch_descriptor, mask, name in events:
+            if mask & inotify.IN_Q_OVERFLOW:
+                changed_watches = self.watches     # events lost, rescan everything
+                break
+
+            watches = self._folder_watches.get(watch_descriptor, (None, []))[1]
+            if mask & inotify.IN_IGNORED:
+                #folder deleted or moved, watched again once it exists
+                self._folder_watches.pop(watch_descriptor, None)
+            changed_watches.extend(watch for watch in watches if watch not in changed_watches)
+
+        self._add_folder_watches(changed_watches)     # subfolders matching a pattern may have been created
+        self._rescan(changed_watches)
+
+    def _rescan(self, watches):
+        for watch in watches:
+            watch.update()
+            deadline = watch.get_deadline()
+            if deadline is not None and deadline > datetime.now():
+                if watch.stale:
+                    watch.stale = False
+                    self.reporter.info("Backup up-to-date again: {0}, last backup at {1}."
+                                       .format(watch, watch.latest_file_time))
+                self._schedule(watch, deadline)
+            else:
+                self._deadline_by_watch.pop(watch, None)
+                self._report_stale(watch)
+
+    def _schedule(self, watch, deadline):
+        if self._deadline_by_watch.get(watch) != deadline:
+            self._deadline_by_watch[watch] = deadline
+            heapq.heappush(self._deadlines, (deadline, next(self._sequence), watch))
+
+    def _report_expired(self):
+        now = datetime.now()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, sequence, watch = heapq.heappop(self._deadlines)
+            if self._deadline_by_watch.get(watch) == deadline:
+                del self._deadline_by_watch[watch]
+                self._report_stale(watch)
+
+    def _report_stale(self, watch):
+        if watch.stale:
+            return
+
+        watch.stale = True
+        if watch.latest_file_time is None:
+            self.reporter.error("Backup OUT-OF-DATE: no backup file found for {0}.".format(watch))
+        else:
+            self.reporter.error("Backup OUT-OF-DATE: last backup for {0} found at {1}."
+                                .format(watch, watch.latest_file_time))
+
+
+def _total_seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
@@ -0,0 +1,131 @@
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .check_processor import Check, CheckProcessor
+
+__author__ = 'Alexander Pikovsky'
+
+
+class CheckResult(object):
+    """Result of a single check of a backup configuration."""
+
+    def __init__(self, backup_name, check_name, up_to_date=False, error=None, timed_out=False):
+        self.backup_name = backup_name
+        self.check_name = check_name
+        self.up_to_date = up_to_date
+        self.error = error   # error message if the check failed with an exception, otherwise None
+        self.timed_out = timed_out   # True if the check did not complete in time
+
+    @property
+    def failed(self):
+        return not self.up_to_date
+
+    def __str__(self):
+        if self.timed_out:
+            status = "TIMED OUT"
+        elif self.error is not None:
+            status = "ERROR: {0}".format(self.error)
+        else:
+            status = "up-to-date" if self.up_to_date else "OUT-OF-DATE"
+        return "{0}, {1}: {2}".format(self.backup_name, self.check_name, status)
+
+
+def run_checks(app_config, backup_configs, reporter, jobs=1, timeout=None, latest_file_cache=None,
+               copy_verifier=None, backup_states=None, profiler=None):
+    """
+    Runs all checks (destinations, manifests, check objects) of the given backup configurations in up to `jobs`
+    parallel threads. A check not completed within `timeout` seconds (e.g. hanging on a network mount) is reported
+    as timed out and abandoned, its thread does not block the remaining checks. All checks are run, failed checks
+    do not abort the run.
+
+    :param timeout: timeout of a single check in seconds; None for no timeout
+    :param latest_file_cache: LatestFileCache used by the checks; None for no cache
+    :param copy_verifier: CopyVerifier; if specified, the destination copies are verified against their checksums
+                          instead of running the regular checks
+    :param backup_states: list the checks append the BackupCopyState of every checked destination or folder to;
+                          None to not collect them
+    :param profiler: ap_backup.profiling.Profiler; if specified, the checks of every backup configuration are
+                     profiled (in the threads running them), the profile is saved when all checks completed
+    :returns: list of CheckResult objects in the order of backup_configs and their checks
+    """
+    results = []
+    pending = []    # list of tuples (result index, Check)
+    profile_runs = []
+    for backup_config in backup_configs:
+        try:
+            check_processor = CheckProcessor(app_config, backup_config, reporter, latest_file_cache, copy_verifier,
+                                             backup_states)
+            checks = check_processor.get_verify_checks() if copy_verifier else check_processor.get_checks()
+        except Exception as ex:
+            reporter.critical("Backup checker failed for backup '{0}': {1}".format(backup_config.name, str(ex)),
+                              exc_info=True)
+            results.append(CheckResult(backup_config.name, "configuration", error=str(ex)))
+            continue
+
+        if profiler is not None:
+            profile_run = profiler.profile(backup_config.name, check_processor.reporter)
+            profile_run.start()
+            profile_runs.append(profile_run)
+            checks = [Check(check.name,
+                            lambda check=check, profile_run=profile_run: profile_run.profile_call(check.run))
+                      for check in checks]
+
+        for check in checks:
+            pending.append((len(results), check))
+            results.append(CheckResult(backup_config.name, check.name))
+
+    completed = queue.Queue()
+
+    def run_check(result_index, check):
+        try:
+            completed.put((result_index, bool(check.run()), None))
+        except Exception as ex:
+            result = results[result_index]
+            reporter.critical("Check {0} of backup '{1}' failed: {2}".format(result.check_name, result.backup_name,
+                                                                             str(ex)), exc_info=True)
+            completed.put((result_index, False, str(ex)))
+
+    #dict: result index -> start time of the running checks
+    running = {}
+    pending.reverse()
+    while pending or running:
+        while pending and len(running) < max(jobs, 1):
+            result_index, check = pending.pop()
+            thread = threading.Thread(target=run_check, args=(result_index, check))
+            thread.daemon = True    # a hanging check must not prevent the process from exiting
+            running[result_index] = time.time()
+            thread.start()
+
+        #wait for the next completed check or the next timeout
+        wait_time = None
+        if timeout is not None:
+            wait_time = max(min(running.values()) + timeout - time.time(), 0)
+        try:
+            result_index, up_to_date, error = completed.get(timeout=wait_time)
+            if result_index in running:
+                del running[result_index]
+                results[result_index].up_to_date = up_to_date
+                results[result_index].error = error
+        except queue.Empty:
+            pass
+
+        if timeout is not None:
+            now = time.time()
+            for result_index, start_time in list(running.items()):
+                if now - start_time >= timeout:
+                    del running[result_index]
+                    result = results[result_index]
+                    result.timed_out = True
+                    reporter.error("Check {0} of backup '{1}' did not complete within {2} seconds."
+                                   .format(result.check_name, result.backup_name, timeout))
+
+    #profiles of timed out checks are not included
+    for profile_run in profile_runs:
+        profile_run.finish()
+
+    return results
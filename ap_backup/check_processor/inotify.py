@@ -0,0 +1,98 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+
+__author__ = 'Alexander Pikovsky'
+
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+#events changing the set or the modification times of the files in a watched folder
+FOLDER_CHANGE_EVENTS = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | \
+    IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_BUFFER_SIZE = 64 * 1024
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1     # check that the functions exist
+        libc.inotify_add_watch
+        libc.inotify_rm_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+_libc = _load_libc()
+
+
+def is_available():
+    """Returns True if inotify is supported on this platform."""
+    return _libc is not None
+
+
+class Inotify(object):
+    """Minimal ctypes based inotify wrapper watching folders (Linux only)."""
+
+    def __init__(self):
+        if _libc is None:
+            raise Exception("inotify is not available on this platform.")
+
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, "inotify_init1 failed: {0}".format(os.strerror(error)))
+
+    def add_watch(self, path, mask=FOLDER_CHANGE_EVENTS):
+        """Watches the given path, returns the watch descriptor."""
+        watch_descriptor = _libc.inotify_add_watch(self.fd, path.encode(sys.getfilesystemencoding()), mask)
+        if watch_descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, "Cannot watch '{0}': {1}".format(path, os.strerror(error)))
+
+        return watch_descriptor
+
+    def remove_watch(self, watch_descriptor):
+        _libc.inotify_rm_watch(self.fd, watch_descriptor)
+
+    def read_events(self):
+        """Reads the pending events, returns a list of tuples (watch descriptor, mask, name)."""
+        try:
+            data = os.read(self.fd, _READ_BUFFER_SIZE)
+        except OSError:
+            return []   # no pending events (non-blocking descriptor)
+
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            watch_descriptor, mask, cookie, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0').decode(sys.getfilesystemencoding(), 'replace')
+            offset += name_length
+            events.append((watch_descriptor, mask, name))
+
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
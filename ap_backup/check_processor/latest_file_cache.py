@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+
+__author__ = 'Alexander Pikovsky'
+
+
+class LatestFileCache(object):
+    """
+    Persisted cache of the latest file modification times found per backup folder and file name pattern.
+
+    A cached value is valid as long as the modification time of the folder is unchanged, i.e. no file was added,
+    removed or renamed in it, so checking an unchanged folder costs a single stat. Files modified in place do not
+    change the folder modification time, which is fine for backup folders where every copy is a new file.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+        #dict: folder -> [folder modification time in ns, dict: pattern -> latest file modification time or None]
+        self._folders = {}
+        self._modified = False
+        self._lock = threading.Lock()
+
+        if os.path.exists(file_path):
+            try:
+                with open(file_path, 'r') as in_file:
+                    self._folders = json.load(in_file)['folders']
+            except (IOError, KeyError, TypeError, ValueError):
+                self._folders = {}  # damaged cache, all folders are scanned
+
+    def get(self, folder, pattern, folder_mtime_ns):
+        """Returns a tuple (latest file modification time or None) if cached for the folder state, None if not."""
+        with self._lock:
+            folder_data = self._folders.get(folder)
+            if folder_data is None or folder_data[0] != folder_mtime_ns or pattern not in folder_data[1]:
+                return None
+            return (folder_data[1][pattern],)
+
+    def put(self, folder, pattern, folder_mtime_ns, latest_mtime):
+        with self._lock:
+            folder_data = self._folders.get(folder)
+            if folder_data is None or folder_data[0] != folder_mtime_ns:
+                folder_data = [folder_mtime_ns, {}]
+                self._folders[folder] = folder_data
+            folder_data[1][pattern] = latest_mtime
+            self._modified = True
+
+    def save(self):
+        """Saves the cache if modified."""
+        with self._lock:
+            if not self._modified:
+                return
+
+            #write to a temporary file and rename it, so that the cache is never left half-written
+            tmp_file_path = self.file_path + ".tmp"
+            with open(tmp_file_path, 'w') as out_file:
+                json.dump({'folders': self._folders}, out_file)
+            os.rename(tmp_file_path, self.file_path)
+            self._modified = False
@@ -1,23 +1,95 @@
 from datetime import datetime, timedelta
+import fnmatch
 import glob
 import os
 from croniter import croniter
 
+from ap_backup.manifest import get_mtime_ns
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir     # backport for Python 2
+    except ImportError:
+        scandir = None
+
 __author__ = 'Alexander Pikovsky'
 
 
-def check_recent_file_exists(backup_folder, backup_file_name_pattern, schedule, accuracy_days, reporter) :
-    """Checks that the given folder contains at least one recent enough file with the given pattern."""
+def _scan_latest_file_mtime(backup_folder, backup_file_name_pattern):
+    """Returns the latest modification time (timestamp) of the matching files in a single folder pass, or None."""
+    if os.sep in backup_file_name_pattern:
+        #pattern with subfolders, glob it
+        file_paths = glob.glob(os.path.join(backup_folder, backup_file_name_pattern))
+        return max([os.path.getmtime(file_path) for file_path in file_paths]) if file_paths else None
+
+    match_hidden = backup_file_name_pattern.startswith('.')
+    latest_mtime = None
+    if scandir is not None:
+        #stat data of the directory entries is reused where the platform provides it
+        for entry in scandir(backup_folder):
+            if (match_hidden or not entry.name.startswith('.')) and \
+                    fnmatch.fnmatch(entry.name, backup_file_name_pattern):
+                mtime = entry.stat().st_mtime
+                if latest_mtime is None or latest_mtime < mtime:
+                    latest_mtime = mtime
+    else:
+        for name in os.listdir(backup_folder):
+            if (match_hidden or not name.startswith('.')) and fnmatch.fnmatch(name, backup_file_name_pattern):
+                mtime = os.stat(os.path.join(backup_folder, name)).st_mtime
+                if latest_mtime is None or latest_mtime < mtime:
+                    latest_mtime = mtime
+
+    return latest_mtime
+
+
+def find_latest_file_time(backup_folder, backup_file_name_pattern, cache=None):
+    """
+    Returns the latest modification time (datetime) of the files in the given folder matching the given pattern,
+    None if there is no such file.
+
+    :param cache: LatestFileCache; if specified, the folder is only scanned if the modification time of the folder
+                  containing the matching files (a subfolder if the pattern has one) changed since the cached scan
+    """
+    #the files of a pattern with subfolders are added to the subfolder, not changing the backup folder itself
+    pattern_folder = os.path.dirname(os.path.join(backup_folder, backup_file_name_pattern))
+    if glob.has_magic(pattern_folder):
+        cache = None    # files spread over several subfolders, no single folder modification time to check
+
+    folder_mtime_ns = None
+    if cache is not None:
+        try:
+            folder_mtime_ns = get_mtime_ns(os.stat(pattern_folder))
+        except OSError:
+            return None
+    elif not os.path.isdir(backup_folder):
+        return None
+
+    cached = cache.get(pattern_folder, backup_file_name_pattern, folder_mtime_ns) if cache is not None else None
+    if cached is not None:
+        latest_mtime = cached[0]
+    else:
+        latest_mtime = _scan_latest_file_mtime(backup_folder, backup_file_name_pattern)
+        if cache is not None:
+            cache.put(pattern_folder, backup_file_name_pattern, folder_mtime_ns, latest_mtime)
+
+    return datetime.fromtimestamp(latest_mtime) if latest_mtime is not None else None
+
+
+def check_recent_file_exists(backup_folder, backup_file_name_pattern, schedule, accuracy_days, reporter,
+                             cache=None, latest_file_time=None):
+    """
+    Checks that the given folder contains at least one recent enough file with the given pattern.
+
+    :param latest_file_time: latest file time already determined by find_latest_file_time(); None to determine it
+    """
 
     current_time = datetime.now()
 
-    latest_file_time = None
     backup_file_pattern = os.path.join(backup_folder, backup_file_name_pattern)
-    existing_backups = glob.glob(backup_file_pattern)
-    for existingBackup in existing_backups :
-        modification_time = datetime.fromtimestamp(os.path.getmtime(existingBackup))
-        if not latest_file_time or latest_file_time < modification_time:
-            latest_file_time = modification_time
+    if latest_file_time is None:
+        latest_file_time = find_latest_file_time(backup_folder, backup_file_name_pattern, cache)
 
     #check whether up-to-date
     if not latest_file_time:
@@ -32,4 +104,32 @@ def check_recent_file_exists(backup_folder, backup_file_name_pattern, schedule,
                        .format(backup_file_pattern, latest_file_time, min_time))
         return False
 
-    return True
\ No newline at end of file
+    return True
+
+
+def check_manifest_up_to_date(manifest, min_time, reporter, max_reported_files=10):
+    """
+    Checks the sources of the given backup manifest without reading any archive: a source file modified
+    (size, modification time or inode differ from its entry) before min_time is missing in the last backup.
+    Deleted source files are ignored.
+    """
+    stale_files = []
+    for entry in manifest.entries.values():
+        try:
+            stat_result = os.stat(entry.path)
+        except OSError:
+            continue
+
+        if not entry.matches(stat_result) and datetime.fromtimestamp(stat_result.st_mtime) < min_time:
+            stale_files.append(entry.path)
+
+    if stale_files:
+        stale_files.sort()
+        reporter.error("Backup OUT-OF-DATE: {0} source file(s) modified before {1} are not in the last backup "
+                       "manifest '{2}': {3}{4}"
+                       .format(len(stale_files), min_time, manifest.file_path,
+                               ", ".join(stale_files[:max_reported_files]),
+                               ", ..." if len(stale_files) > max_reported_files else ""))
+        return False
+
+    return True
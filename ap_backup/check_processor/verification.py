@@ -0,0 +1,140 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+from ap_backup.manifest import HASH_ALGORITHM, get_mtime_ns
+
+__author__ = 'Alexander Pikovsky'
+
+
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 7
+
+#result of CopyVerifier.verify() for files skipped because verified recently
+VERIFIED_RECENTLY = "verified recently"
+
+
+class VerificationCache(object):
+    """
+    Persisted record of the verified backup copies: path -> (inode, size, modification time, verification time).
+    A copy whose inode, size and modification time are unchanged since a recent verification is not read again.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+        #dict: file path -> [inode, size, modification time in ns, verification timestamp]
+        self._files = {}
+        self._modified = False
+        self._lock = threading.Lock()
+
+        if os.path.exists(file_path):
+            try:
+                with open(file_path, 'r') as in_file:
+                    self._files = json.load(in_file)['files']
+            except (IOError, KeyError, TypeError, ValueError):
+                self._files = {}  # damaged cache, all copies are verified
+
+    def get_verification_time(self, file_path, stat_result):
+        """Returns the time (timestamp) the file was verified in the given state, None if not verified."""
+        with self._lock:
+            file_data = self._files.get(file_path)
+            if file_data is None or file_data[:3] != [stat_result.st_ino, stat_result.st_size,
+                                                      get_mtime_ns(stat_result)]:
+                return None
+            return file_data[3]
+
+    def put(self, file_path, stat_result, verification_time):
+        with self._lock:
+            self._files[file_path] = [stat_result.st_ino, stat_result.st_size, get_mtime_ns(stat_result),
+                                      verification_time]
+            self._modified = True
+
+    def save(self):
+        """Saves the cache if modified, records of deleted files are dropped."""
+        with self._lock:
+            if not self._modified:
+                return
+
+            self._files = dict((file_path, file_data) for file_path, file_data in self._files.items()
+                               if os.path.exists(file_path))
+
+            #write to a temporary file and rename it, so that the cache is never left half-written
+            tmp_file_path = self.file_path + ".tmp"
+            with open(tmp_file_path, 'w') as out_file:
+                json.dump({'files': self._files}, out_file)
+            os.rename(tmp_file_path, self.file_path)
+            self._modified = False
+
+
+class CopyVerifier(object):
+    """
+    Verifies backup copies against their recorded checksums. Thread-safe.
+
+    Every thread reads into its own preallocated buffer, so the memory used is bounded by the number of threads
+    times buffer_size regardless of the file sizes. Where supported, the read pages are dropped from the page
+    cache, so that verifying large archives does not evict the working set of the host.
+    """
+
+    def __init__(self, cache=None, max_age_days=DEFAULT_MAX_AGE_DAYS, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        :param cache: VerificationCache; None to verify all copies
+        :param max_age_days: unchanged copies verified within this number of days are skipped
+        :param buffer_size: read buffer size per thread in bytes
+        """
+        self.cache = cache
+        self.max_age_days = max_age_days
+        self.buffer_size = buffer_size
+        self._thread_data = threading.local()
+
+    def verify(self, file_path, expected_size, expected_checksum):
+        """
+        Verifies the given file. Returns True if intact, VERIFIED_RECENTLY if skipped, otherwise an error message.
+        """
+        stat_result = os.stat(file_path)
+        if expected_size is not None and stat_result.st_size != expected_size:
+            return "size is {0} bytes, expected {1}".format(stat_result.st_size, expected_size)
+
+        if self.cache is not None:
+            verification_time = self.cache.get_verification_time(file_path, stat_result)
+            if verification_time is not None and time.time() - verification_time < self.max_age_days * 86400:
+                return VERIFIED_RECENTLY
+
+        checksum = self.compute_checksum(file_path)
+        if checksum != expected_checksum:
+            return "{0} is {1}, expected {2}".format(HASH_ALGORITHM, checksum, expected_checksum)
+
+        if self.cache is not None:
+            self.cache.put(file_path, stat_result, time.time())
+        return True
+
+    def compute_checksum(self, file_path):
+        buffer = getattr(self._thread_data, 'buffer', None)
+        if buffer is None:
+            buffer = self._thread_data.buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+
+        file_hash = hashlib.new(HASH_ALGORITHM)
+        with io.open(file_path, 'rb', buffering=0) as in_file:
+            _fadvise(in_file, 'POSIX_FADV_SEQUENTIAL')
+            while True:
+                length = in_file.readinto(buffer)
+                if not length:
+                    break
+                file_hash.update(view[:length])
+            _fadvise(in_file, 'POSIX_FADV_DONTNEED')
+
+        return file_hash.hexdigest()
+
+
+def _fadvise(in_file, advice_name):
+    fadvise = getattr(os, 'posix_fadvise', None)
+    advice = getattr(os, advice_name, None)
+    if fadvise is not None and advice is not None:
+        try:
+            fadvise(in_file.fileno(), 0, 0, advice)
+        except OSError:
+            pass    # advisory only
@@ -3,14 +3,38 @@ import glob
 import os
 from ap_utils.yaml_processor import YamlProcessor
 
+from ap_backup.throttle import parse_rate
+
 from .backup_config import BackupConfig
+from .config_cache import ConfigCache
+
+
+class AppConfig(object):
+    """
+    Loads and holds application configuration.
 
+    Backup configurations are loaded lazily on first access: backup_configs loads all of them,
+    get_backup_configs() only the requested ones.
+    """
 
-class AppConfig:
-    """Loads and holds application configuration."""
+    DEFAULT_STATUS_DB_FILE = '/var/lib/ap-backup/status.db'
 
     def __init__(self, config_file):
-        self.backup_configs = None   # list of BackupConfig objects
+        self.config_file = path.abspath(config_file)
+        self.backup_configs_folders = None   # list of absolute backup configuration folder paths
+        self.backup_config_files = None   # list of backup configuration file paths
+        self.config_cache_file = None   # file caching the parsed backup configurations (None if disabled)
+        self.checker_cache_file = None   # file caching backup folder scans of the checker (None if disabled)
+        self.verify_cache_file = None   # file recording the copies verified by the checker (None if disabled)
+        self.status_db_file = None   # SQLite database holding the backup statuses and attempts of all configs
+        self.read_rate_limit = None   # read rate limit of all backups together in bytes/s (None for unlimited)
+        self.write_rate_limit = None   # write rate limit of all backups together in bytes/s (None for unlimited)
+        self.metrics_textfile_folder = None   # folder of the Prometheus textfile collector (None if disabled)
+        self.metrics_json_folder = None   # folder of the JSON metrics files of every run (None if disabled)
+
+        #dict: backup config file path -> loaded BackupConfig
+        self._backup_config_by_file = {}
+        self._config_cache = None
 
         self._read_config(config_file)
 
@@ -29,16 +53,105 @@ class AppConfig:
         with YamlProcessor(config_file) as yaml_processor:
             main_section = yaml_processor.data
 
+        self.status_db_file = main_section.get_optional('status_db_file', self.DEFAULT_STATUS_DB_FILE)
+        if not path.isabs(self.status_db_file):
+            self.status_db_file = path.join(config_dir, self.status_db_file)
+
+        try:
+            self.read_rate_limit = parse_rate(main_section.get_optional('read_rate_limit', None))
+            self.write_rate_limit = parse_rate(main_section.get_optional('write_rate_limit', None))
+        except ValueError as ex:
+            raise Exception("{0} in configuration file '{1}'.".format(str(ex).rstrip('.'), config_file))
+
+        self.metrics_textfile_folder = main_section.get_optional('metrics_textfile_folder', None)
+        if self.metrics_textfile_folder and not path.isabs(self.metrics_textfile_folder):
+            self.metrics_textfile_folder = path.join(config_dir, self.metrics_textfile_folder)
+
+        self.metrics_json_folder = main_section.get_optional('metrics_json_folder', None)
+        if self.metrics_json_folder and not path.isabs(self.metrics_json_folder):
+            self.metrics_json_folder = path.join(config_dir, self.metrics_json_folder)
+
+        self.checker_cache_file = main_section.get_optional('checker_cache_file', None)
+        if self.checker_cache_file and not path.isabs(self.checker_cache_file):
+            self.checker_cache_file = path.join(config_dir, self.checker_cache_file)
+
+        self.verify_cache_file = main_section.get_optional('verify_cache_file', None)
+        if self.verify_cache_file and not path.isabs(self.verify_cache_file):
+            self.verify_cache_file = path.join(config_dir, self.verify_cache_file)
+
+        self.config_cache_file = main_section.get_optional('config_cache_file', None)
+        if self.config_cache_file and not path.isabs(self.config_cache_file):
+            self.config_cache_file = path.join(config_dir, self.config_cache_file)
+        if self.config_cache_file:
+            self._config_cache = ConfigCache(self.config_cache_file)
+
         #enumerate backup config folder sections
-        self.backup_configs = []
+        self.backup_configs_folders = []
+        self.backup_config_files = []
         for backup_configs_folder in main_section.backup_configs_folders:
             #get absolute backup-configs folder
             if not path.isabs(backup_configs_folder):
                 backup_configs_folder = path.join(config_dir, backup_configs_folder)
             if not path.exists(backup_configs_folder):
                 raise Exception("Backup configurations folder '{0}' does not exist.".format(backup_configs_folder))
+            self.backup_configs_folders.append(backup_configs_folder)
+
+            #discover backup configs, they are read on demand
+            if self._config_cache is not None:
+                backup_config_file_paths = self._config_cache.get_folder_files(backup_configs_folder,
+                                                                               _list_backup_config_files)
+            else:
+                backup_config_file_paths = _list_backup_config_files(backup_configs_folder)
+            self.backup_config_files.extend(backup_config_file_paths)
+
+    @property
+    def backup_configs(self):
+        """List of all BackupConfig objects."""
+        return self.get_backup_configs()
+
+    @staticmethod
+    def get_backup_config_name(backup_config_file):
+        return path.splitext(path.basename(backup_config_file))[0]
+
+    def get_backup_config_names(self):
+        """Returns the names of all backup configurations without loading them."""
+        return [self.get_backup_config_name(backup_config_file) for backup_config_file in self.backup_config_files]
+
+    def get_backup_configs(self, names=None):
+        """
+        Returns the BackupConfig objects of the given names (in the order of the configuration files), loading
+        only these configurations.
+
+        :param names: list of backup names; None for all backup configurations
+        """
+        backup_config_files = self.backup_config_files
+        if names is not None:
+            unknown_names = set(names) - set(self.get_backup_config_names())
+            if unknown_names:
+                raise Exception("Unknown backup configuration(s): {0}.".format(", ".join(sorted(unknown_names))))
+            backup_config_files = [backup_config_file for backup_config_file in backup_config_files
+                                   if self.get_backup_config_name(backup_config_file) in names]
+
+        backup_configs = [self._load_backup_config(backup_config_file) for backup_config_file in backup_config_files]
+        if self._config_cache is not None:
+            try:
+                self._config_cache.save()
+            except (IOError, OSError):
+                pass    # cache is an optimization only, e.g. the folder is not writable
+
+        return backup_configs
+
+    def _load_backup_config(self, backup_config_file):
+        backup_config = self._backup_config_by_file.get(backup_config_file)
+        if backup_config is None:
+            if self._config_cache is not None:
+                backup_config = self._config_cache.get_backup_config(backup_config_file, BackupConfig)
+            else:
+                backup_config = BackupConfig(backup_config_file)
+            self._backup_config_by_file[backup_config_file] = backup_config
+
+        return backup_config
+
 
-            #discover and read backup configs
-            backup_config_file_paths = glob.glob(path.join(backup_configs_folder, "*.yaml"))
-            for backup_config_file_path in backup_config_file_paths :
-                self.backup_configs.append(BackupConfig(backup_config_file_path))
+def _list_backup_config_files(backup_configs_folder):
+    return sorted(glob.glob(path.join(backup_configs_folder, "*.yaml")))
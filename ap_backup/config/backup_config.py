@@ -1,6 +1,8 @@
 from os import path
 from ap_utils.yaml_processor import YamlProcessor
 
+from ap_backup.throttle import parse_rate
+
 from .backup_objects import BackupObject
 from .check_objects import CheckObject
 from .work_object_manager import work_object_manager
@@ -11,9 +13,17 @@ class BackupDestination:
     def __init__(self, config_section):
         self.name = config_section.name
         self.folder = config_section.folder
-        self.num_copies = int(config_section.num_copies)
         self.schedule = config_section.schedule
 
+        #retention: number of last copies and number of daily, weekly and monthly copies to maintain
+        self.num_copies = int(config_section.get_optional('num_copies', 0))
+        self.keep_daily = int(config_section.get_optional('keep_daily', 0))
+        self.keep_weekly = int(config_section.get_optional('keep_weekly', 0))
+        self.keep_monthly = int(config_section.get_optional('keep_monthly', 0))
+        if not (self.num_copies or self.keep_daily or self.keep_weekly or self.keep_monthly):
+            raise ValueError("Destination '{0}' must define num_copies or keep_daily/keep_weekly/keep_monthly."
+                             .format(self.name))
+
 
 class BackupConfig:
 
@@ -22,8 +32,32 @@ class BackupConfig:
 
     BACKUP_TYPES = {BACKUP_TYPE_ARCHIVE, BACKUP_TYPE_CHECKER}
 
+    ARCHIVE_MODE_STAGED = "staged"
+    ARCHIVE_MODE_STREAMING = "streaming"
+
+    ARCHIVE_MODES = {ARCHIVE_MODE_STAGED, ARCHIVE_MODE_STREAMING}
+
+    ARCHIVE_FORMAT_ZIP = "zip"
+    ARCHIVE_FORMAT_TAR = "tar"
+    ARCHIVE_FORMAT_TAR_GZ = "tar.gz"
+    ARCHIVE_FORMAT_TAR_ZST = "tar.zst"
+
+    ARCHIVE_FORMATS = {ARCHIVE_FORMAT_ZIP, ARCHIVE_FORMAT_TAR, ARCHIVE_FORMAT_TAR_GZ, ARCHIVE_FORMAT_TAR_ZST}
+
     DEFAULT_CHECKER_ACCURACY_DAYS = 2
     DEFAULT_DATA_FOLDER = '/var/lib/ap-backup/{backup_name}'
+    DEFAULT_ARCHIVE_MODE = ARCHIVE_MODE_STAGED
+    DEFAULT_ARCHIVE_FORMAT = ARCHIVE_FORMAT_ZIP
+    DEFAULT_COMPRESSION_THREADS = 0
+    DEFAULT_MAX_PARALLEL_OBJECTS = 1
+    DEFAULT_CONCURRENCY_LIMITS = {'mysql': 1}
+
+    IONICE_CLASS_REALTIME = "realtime"
+    IONICE_CLASS_BEST_EFFORT = "best-effort"
+    IONICE_CLASS_IDLE = "idle"
+
+    #ionice classes by name (values are the ionice -c arguments)
+    IONICE_CLASSES = {IONICE_CLASS_REALTIME: 1, IONICE_CLASS_BEST_EFFORT: 2, IONICE_CLASS_IDLE: 3}
 
     def __init__(self, backup_config_file):
         # backup name
@@ -35,6 +69,56 @@ class BackupConfig:
         #folder where backup and status files will are located
         self.data_folder = None
 
+        # archive mode (see ARCHIVE_MODE_xxx constants): "staged" copies all objects to the last_backup folder
+        # and archives it afterwards, "streaming" writes objects directly into the archive.
+        # Optional, default is DEFAULT_ARCHIVE_MODE.
+        self.archive_mode = None
+
+        # archive format (see ARCHIVE_FORMAT_xxx constants), also used as archive file extension.
+        # Optional, default is DEFAULT_ARCHIVE_FORMAT.
+        self.archive_format = None
+
+        # compression level passed to the compressor, None for the compressor default. Not supported for zip.
+        self.compression_level = None
+
+        # number of compressor threads for compressed tar formats, 0 to use all cores.
+        # Optional, default is DEFAULT_COMPRESSION_THREADS.
+        self.compression_threads = None
+
+        # if True, a manifest of all backed up files (path, size, modification time, inode, content hash)
+        # is maintained in the data folder, see ap_backup.manifest.Manifest.
+        # Optional, default is False.
+        self.manifest = None
+
+        # if True, the archive of the last backup is reused instead of being recreated if the fingerprint of all
+        # sources (see BackupObjectProcessor.fingerprint()) did not change since it was created.
+        # Optional, default is False.
+        self.reuse_unchanged_archive = None
+
+        # maximum number of backup objects processed in parallel.
+        # Optional, default is DEFAULT_MAX_PARALLEL_OBJECTS (sequential processing).
+        self.max_parallel_objects = None
+
+        # dict: object type -> maximum number of objects of this type processed in parallel for the same
+        # concurrency group (e.g. the same database host), see BackupObject.get_concurrency_group().
+        # Optional, defaults are DEFAULT_CONCURRENCY_LIMITS.
+        self.concurrency_limits = None
+
+        # read and write rate limits of the backup in bytes per second (copying files and folders, archiving and
+        # copying the archive to the destinations), None for unlimited. Optional, default is unlimited.
+        self.read_rate_limit = None
+        self.write_rate_limit = None
+
+        # niceness adjustment (nice -n) of the mysqldump and svnadmin child processes, None to keep the priority.
+        # Optional, default is None.
+        self.nice = None
+
+        # I/O scheduling class (see IONICE_CLASSES) and priority level (0-7, for the realtime and best-effort classes)
+        # of the mysqldump and svnadmin child processes, None to keep the I/O priority.
+        # Optional, default is None.
+        self.ionice_class = None
+        self.ionice_level = None
+
         # Number of days ignored by the backup checker. Only relevant for backup checker configs.
         # Optional, default is DEFAULT_CHECKER_ACCURACY_DAYS.
         self.checker_accuracy_days = None
@@ -47,6 +131,10 @@ class BackupConfig:
 
         self._read_config(backup_config_file)
 
+    def get_archive_extension(self):
+        """Returns the archive file extension (including the dot), e.g. ".tar.zst"."""
+        return "." + self.archive_format
+
     def _read_config(self, backup_config_file):
 
         self.name = path.splitext(path.basename(backup_config_file))[0]
@@ -65,6 +153,60 @@ class BackupConfig:
         self.data_folder = main_section.get_optional('data_folder', self.DEFAULT_DATA_FOLDER)
         self.data_folder = self.data_folder.format(backup_name=self.name)
 
+        self.archive_mode = main_section.get_optional('archive_mode', self.DEFAULT_ARCHIVE_MODE)
+        if self.archive_mode not in self.ARCHIVE_MODES:
+            raise ValueError("Unsupported archive mode '{0}' in configuration file '{1}'."
+                             .format(self.archive_mode, backup_config_file))
+
+        self.archive_format = main_section.get_optional('archive_format', self.DEFAULT_ARCHIVE_FORMAT)
+        if self.archive_format not in self.ARCHIVE_FORMATS:
+            raise ValueError("Unsupported archive format '{0}' in configuration file '{1}'."
+                             .format(self.archive_format, backup_config_file))
+
+        compression_level = main_section.get_optional('compression_level', None)
+        self.compression_level = int(compression_level) if compression_level is not None else None
+
+        self.compression_threads = \
+            int(main_section.get_optional('compression_threads', self.DEFAULT_COMPRESSION_THREADS))
+
+        self.manifest = bool(main_section.get_optional('manifest', False))
+
+        self.reuse_unchanged_archive = bool(main_section.get_optional('reuse_unchanged_archive', False))
+
+        self.max_parallel_objects = \
+            int(main_section.get_optional('max_parallel_objects', self.DEFAULT_MAX_PARALLEL_OBJECTS))
+        if self.max_parallel_objects < 1:
+            raise ValueError("Invalid max_parallel_objects {0} in configuration file '{1}', must be at least 1."
+                             .format(self.max_parallel_objects, backup_config_file))
+
+        self.concurrency_limits = dict(self.DEFAULT_CONCURRENCY_LIMITS)
+        for limit_section in main_section.get_optional_list('concurrency_limits'):
+            max_parallel = int(limit_section.max_parallel)
+            if max_parallel < 1:
+                raise ValueError("Invalid max_parallel {0} for object type '{1}' in configuration file '{2}', "
+                                 "must be at least 1.".format(max_parallel, limit_section.type, backup_config_file))
+            self.concurrency_limits[limit_section.type] = max_parallel
+
+        try:
+            self.read_rate_limit = parse_rate(main_section.get_optional('read_rate_limit', None))
+            self.write_rate_limit = parse_rate(main_section.get_optional('write_rate_limit', None))
+        except ValueError as ex:
+            raise ValueError("{0} in configuration file '{1}'.".format(str(ex).rstrip('.'), backup_config_file))
+
+        nice = main_section.get_optional('nice', None)
+        self.nice = int(nice) if nice is not None else None
+
+        self.ionice_class = main_section.get_optional('ionice_class', None)
+        if self.ionice_class is not None and self.ionice_class not in self.IONICE_CLASSES:
+            raise ValueError("Unsupported ionice class '{0}' in configuration file '{1}'."
+                             .format(self.ionice_class, backup_config_file))
+
+        ionice_level = main_section.get_optional('ionice_level', None)
+        self.ionice_level = int(ionice_level) if ionice_level is not None else None
+        if self.ionice_level is not None and not 0 <= self.ionice_level <= 7:
+            raise ValueError("Invalid ionice_level {0} in configuration file '{1}', must be between 0 and 7."
+                             .format(self.ionice_level, backup_config_file))
+
         self.checker_accuracy_days = \
             int(main_section.get_optional('checker_accuracy_days', self.DEFAULT_CHECKER_ACCURACY_DAYS))
 
@@ -6,15 +6,44 @@ __author__ = 'Alexander Pikovsky'
 class BackupObject(object):
     """Base class for backup objects."""
 
+    # object type name, set by the work_object_class decorator
+    object_type = None
+
     def __init__(self, object_section):
         # target subfolder (of the backup folder)
         self.target_subfolder = object_section.target_subfolder
 
+    def __str__(self):
+        return "{0} object '{1}'".format(self.object_type, self.target_subfolder)
+
+    def get_concurrency_group(self):
+        """
+        Returns the resource this object shares with other objects of the same type (e.g. database host).
+        Concurrency limits of the backup config are applied per object type and concurrency group.
+        """
+        return None
+
+    def get_source_paths(self):
+        """Returns the local file system paths read by this object (used to find the source devices)."""
+        return []
+
 
 @work_object_class('mysql')
 class BackupObjectMySql(BackupObject):
     """MySql backup object."""
 
+    FINGERPRINT_UPDATE_TIME = "update_time"
+    FINGERPRINT_CHECKSUM = "checksum"
+    FINGERPRINT_NONE = "none"
+
+    FINGERPRINT_MODES = {FINGERPRINT_UPDATE_TIME, FINGERPRINT_CHECKSUM, FINGERPRINT_NONE}
+
+    COMPRESSION_NONE = "none"
+    COMPRESSION_GZIP = "gzip"
+    COMPRESSION_ZSTD = "zstd"
+
+    COMPRESSIONS = {COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_ZSTD}
+
     def __init__(self, object_section):
         super(BackupObjectMySql, self).__init__(object_section)
 
@@ -25,6 +54,34 @@ class BackupObjectMySql(BackupObject):
         self.host = object_section.get_optional('host', None)
         self.port = object_section.get_optional('port', None)
 
+        # how to detect database changes for the unchanged archive reuse (see FINGERPRINT_xxx constants)
+        self.fingerprint = object_section.get_optional('fingerprint', self.FINGERPRINT_UPDATE_TIME)
+        if self.fingerprint not in self.FINGERPRINT_MODES:
+            raise ValueError("Unsupported MySQL fingerprint mode '{0}'.".format(self.fingerprint))
+
+        # compression of the dump while it is written (see COMPRESSION_xxx constants), the compression extension
+        # is appended to the target file name
+        self.compression = object_section.get_optional('compression', self.COMPRESSION_NONE)
+        if self.compression not in self.COMPRESSIONS:
+            raise ValueError("Unsupported MySQL dump compression '{0}'.".format(self.compression))
+
+        # compression level; None for the compressor default
+        self.compression_level = object_section.get_optional('compression_level', None)
+
+        # if True, multiple-row INSERT statements are dumped (smaller and faster to restore)
+        self.extended_insert = bool(object_section.get_optional('extended_insert', False))
+
+        # if True, the database is dumped in a single transaction instead of locking all tables (consistent only
+        # for transactional tables like InnoDB)
+        self.single_transaction = bool(object_section.get_optional('single_transaction', False))
+
+        # number of connections dumping tables in parallel; if greater than 1, every table is dumped to a separate
+        # file in a consistent snapshot (see ParallelMySqlDump)
+        self.parallel_workers = int(object_section.get_optional('parallel_workers', 1))
+
+    def get_concurrency_group(self):
+        return "{0}:{1}".format(self.host or 'localhost', self.port or '')
+
 
 @work_object_class('svn')
 class BackupObjectSvn(BackupObject):
@@ -35,6 +92,17 @@ class BackupObjectSvn(BackupObject):
 
         self.repository_folder = object_section.repository_folder
 
+        # if True, only the revisions added since the last backup copied to a destination are dumped, with
+        # periodic full backups (hotcopy)
+        self.incremental = bool(object_section.get_optional('incremental', False))
+
+        # maximum number of days since the last full backup of a destination before a new full backup is made
+        # (incremental mode only)
+        self.full_backup_interval_days = int(object_section.get_optional('full_backup_interval_days', 7))
+
+    def get_source_paths(self):
+        return [self.repository_folder]
+
 
 @work_object_class('file')
 class BackupObjectFile(BackupObject):
@@ -50,6 +118,9 @@ class BackupObjectFile(BackupObject):
         # name of the target file or None to use source file name
         self.target_file_name = object_section.get_optional('target_file_name', None)
 
+    def get_source_paths(self):
+        return [self.src_file_path]
+
 
 @work_object_class('folder')
 class BackupObjectFolder(BackupObject):
@@ -61,3 +132,10 @@ class BackupObjectFolder(BackupObject):
         # full path to the folder to copy
         self.src_folder_path = object_section.src_folder_path
 
+        # if True, files unchanged since the previous backup are hard-linked from the previous backup folder
+        # instead of being copied (only relevant for the staged archive mode)
+        self.incremental = bool(object_section.get_optional('incremental', False))
+
+    def get_source_paths(self):
+        return [self.src_folder_path]
+
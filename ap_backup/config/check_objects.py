@@ -1,3 +1,5 @@
+import os
+
 from .work_object_manager import work_object_class
 
 __author__ = 'Alexander Pikovsky'
@@ -20,6 +22,9 @@ class CheckObjectRecentFileExists(CheckObject) :
         self.backup_folder = object_section.backup_folder
         self.backup_file_name_pattern = object_section.backup_file_name_pattern
 
+    def __str__(self):
+        return "recent_file_exists '{0}'".format(os.path.join(self.backup_folder, self.backup_file_name_pattern))
+
 
 @work_object_class('compare_file_to_src')
 class CheckObjectCompareFileToSrc(CheckObject) :
@@ -30,3 +35,6 @@ class CheckObjectCompareFileToSrc(CheckObject) :
 
         self.backup_file = object_section.backup_file
         self.src_file = object_section.src_file
+
+    def __str__(self):
+        return "compare_file_to_src '{0}'".format(self.backup_file)
@@ -0,0 +1,95 @@
+import os
+import pickle
+
+__author__ = 'Alexander Pikovsky'
+
+
+#version of the cache format and of the cached objects; increase whenever BackupConfig or a work object class
+#gets new attributes, so that caches written by older versions are discarded
+CACHE_VERSION = 2
+
+
+def _get_file_key(stat_result):
+    mtime_ns = getattr(stat_result, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat_result.st_mtime * 1000000000)
+    return [mtime_ns, stat_result.st_size]
+
+
+class ConfigCache(object):
+    """
+    Cache of parsed and validated backup configurations, so that unchanged configuration files are not parsed on
+    every run.
+
+    Every BackupConfig is stored pickled separately together with the modification time and size of its file,
+    so loading a cached configuration only unpickles that configuration. Folder listings are cached keyed on the
+    folder modification time. The cache holds the configuration content (including passwords) and is written
+    readable by the owner only.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+        #dict: config file path -> [modification time in ns, size, pickled BackupConfig]
+        self._configs = {}
+
+        #dict: folder -> [modification time in ns, size, sorted list of the config file paths in the folder]
+        self._folders = {}
+
+        self._modified = False
+
+        if os.path.exists(file_path):
+            try:
+                with open(file_path, 'rb') as in_file:
+                    data = pickle.load(in_file)
+                if data['version'] == CACHE_VERSION:
+                    self._configs = data['configs']
+                    self._folders = data['folders']
+            except Exception:
+                pass    # damaged cache, all configs are parsed
+
+    def get_folder_files(self, folder, list_files):
+        """Returns the cached config files of the folder if unchanged, otherwise list_files(folder) (cached)."""
+        key = _get_file_key(os.stat(folder))
+        folder_data = self._folders.get(folder)
+        if folder_data is not None and folder_data[:2] == key:
+            return folder_data[2]
+
+        files = sorted(list_files(folder))
+        self._folders[folder] = key + [files]
+        self._modified = True
+        return files
+
+    def get_backup_config(self, config_file, load_config):
+        """Returns the cached BackupConfig of the file if unchanged, otherwise load_config(config_file) (cached)."""
+        key = _get_file_key(os.stat(config_file))
+        config_data = self._configs.get(config_file)
+        if config_data is not None and config_data[:2] == key:
+            try:
+                return pickle.loads(config_data[2])
+            except Exception:
+                pass    # damaged entry, parsed again
+
+        backup_config = load_config(config_file)
+        self._configs[config_file] = key + [pickle.dumps(backup_config, pickle.HIGHEST_PROTOCOL)]
+        self._modified = True
+        return backup_config
+
+    def save(self):
+        """Saves the cache if modified, entries of deleted files are dropped."""
+        if not self._modified:
+            return
+
+        self._configs = dict((config_file, config_data) for config_file, config_data in self._configs.items()
+                             if os.path.exists(config_file))
+        self._folders = dict((folder, folder_data) for folder, folder_data in self._folders.items()
+                             if os.path.exists(folder))
+
+        #write to a temporary file and rename it, so that the cache is never left half-written,
+        #concurrent runs write different temporary files
+        tmp_file_path = "{0}.{1}.tmp".format(self.file_path, os.getpid())
+        with os.fdopen(os.open(tmp_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as out_file:
+            pickle.dump({'version': CACHE_VERSION, 'configs': self._configs, 'folders': self._folders}, out_file,
+                        pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file_path, self.file_path)
+        self._modified = False
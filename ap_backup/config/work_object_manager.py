@@ -57,6 +57,7 @@ class work_object_class(object):
 
     def __call__(self, cls):
         work_object_manager.register_object_class(cls, self._object_type)
+        cls.object_type = self._object_type
         return cls
 
 
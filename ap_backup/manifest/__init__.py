@@ -0,0 +1,3 @@
+__author__ = 'Alexander Pikovsky'
+
+from .manifest import Manifest, ManifestEntry, HASH_ALGORITHM, compute_file_hash, get_mtime_ns, update_file_hash
@@ -0,0 +1,146 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+__author__ = 'Alexander Pikovsky'
+
+
+HASH_ALGORITHM = 'sha256'
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def compute_file_hash(file_path):
+    """Computes the content hash (HASH_ALGORITHM, hex digest) of the given file."""
+    file_hash = hashlib.new(HASH_ALGORITHM)
+    update_file_hash(file_hash, file_path)
+    return file_hash.hexdigest()
+
+
+def update_file_hash(file_hash, file_path):
+    """Updates the given hashlib hash object with the content of the given file."""
+    with open(file_path, 'rb') as in_file:
+        while True:
+            data = in_file.read(HASH_BUFFER_SIZE)
+            if not data:
+                break
+            file_hash.update(data)
+
+
+def get_mtime_ns(stat_result):
+    """Returns the modification time of the given stat result in nanoseconds."""
+    mtime_ns = getattr(stat_result, 'st_mtime_ns', None)
+    return mtime_ns if mtime_ns is not None else int(stat_result.st_mtime * 1000000000)
+
+
+class ManifestEntry(object):
+    """Manifest record of a single backed up file."""
+
+    __slots__ = ('path', 'size', 'mtime_ns', 'inode', 'hash')
+
+    def __init__(self, path, size, mtime_ns, inode, hash):
+        self.path = path   # source file path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.hash = hash   # content hash, see HASH_ALGORITHM
+
+    def matches(self, stat_result):
+        """Checks whether the given stat result of the source file matches this entry (file is unchanged)."""
+        return self.size == stat_result.st_size and self.mtime_ns == get_mtime_ns(stat_result) and \
+            self.inode == stat_result.st_ino
+
+    def serialize(self):
+        return [self.path, self.size, self.mtime_ns, self.inode, self.hash]
+
+    @classmethod
+    def deserialize(cls, data):
+        return cls(*data)
+
+
+class Manifest(object):
+    """
+    Index of the files backed up by the last successful backup of a backup config, stored as a gzip compressed
+    file with one JSON record per line in the data folder.
+
+    During a backup the processors add the files they back up with add_file(), the new entries replace the
+    stored ones on commit(). Unchanged files (same size, modification time and inode as recorded) keep their
+    recorded hash, only changed files are hashed.
+    """
+
+    FILE_NAME = "manifest.jsonl.gz"
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+        #dict: source path -> ManifestEntry, entries of the last successful backup
+        self.entries = {}
+
+        #dict: source path -> ManifestEntry, entries added by the running backup
+        self._new_entries = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(file_path):
+            try:
+                self._load()
+            except (IOError, EOFError, TypeError, ValueError):
+                self.entries = {}   # damaged manifest, all files are treated as changed
+
+    @classmethod
+    def for_data_folder(cls, data_folder):
+        """Returns the manifest stored in the given backup data folder."""
+        return cls(os.path.join(data_folder, cls.FILE_NAME))
+
+    def get_unchanged_entry(self, path, stat_result):
+        """Returns the recorded entry for the given source file if the file is unchanged, None otherwise."""
+        entry = self.entries.get(path)
+        return entry if entry is not None and entry.matches(stat_result) else None
+
+    def add_file(self, path, stat_result, content_file_path=None):
+        """
+        Adds the given source file to the manifest of the running backup. Thread-safe.
+
+        :param path: source file path
+        :param stat_result: stat result of the source file taken before it was backed up
+        :param content_file_path: file to hash if the source file changed (e.g. the backed up copy, which is
+                                  likely in the page cache); default is the source file
+        :returns: the new entry
+        """
+        unchanged_entry = self.get_unchanged_entry(path, stat_result)
+        if unchanged_entry is not None:
+            file_hash = unchanged_entry.hash
+        else:
+            file_hash = compute_file_hash(content_file_path or path)
+
+        entry = ManifestEntry(path, stat_result.st_size, get_mtime_ns(stat_result), stat_result.st_ino, file_hash)
+        with self._lock:
+            self._new_entries[path] = entry
+
+        return entry
+
+    def commit(self):
+        """Replaces the recorded entries by the entries of the running backup and saves the manifest."""
+        with self._lock:
+            self.entries, self._new_entries = self._new_entries, {}
+            self._save()
+
+    def _load(self):
+        entries = {}
+        with gzip.open(self.file_path, 'rb') as in_file:
+            for line in in_file:
+                line = line.strip()
+                if line:
+                    entry = ManifestEntry.deserialize(json.loads(line.decode('utf-8')))
+                    entries[entry.path] = entry
+
+        self.entries = entries
+
+    def _save(self):
+        #write to a temporary file and rename it, so that the manifest is never left half-written
+        tmp_file_path = self.file_path + ".tmp"
+        with gzip.open(tmp_file_path, 'wb') as out_file:
+            for path in sorted(self.entries):
+                line = json.dumps(self.entries[path].serialize(), separators=(',', ':')) + "\n"
+                out_file.write(line.encode('utf-8'))
+        os.rename(tmp_file_path, self.file_path)
@@ -0,0 +1,4 @@
+__author__ = 'Alexander Pikovsky'
+
+from .metrics import RunMetrics, StageMetrics, BackupCopyState, read_io_counters
+from .exporters import export_run_metrics, export_checker_metrics, format_textfile
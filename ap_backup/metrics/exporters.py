@@ -0,0 +1,177 @@
+import json
+import numbers
+import os
+import re
+import time
+
+from .metrics import TIMESTAMP_FORMAT
+
+__author__ = 'Alexander Pikovsky'
+
+
+JSON_FILE_TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
+
+_INVALID_NAME_CHARACTERS = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def _to_timestamp(value):
+    return time.mktime(value.timetuple()) + value.microsecond / 1000000.0 if value is not None else None
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, numbers.Integral):
+        return str(value)
+    return repr(float(value))
+
+
+def format_textfile(metric_families):
+    """
+    Formats the given metrics in the Prometheus text exposition format (all metrics are gauges).
+
+    :param metric_families: list of tuples (metric name, help text, list of (dict: label -> value, value));
+                            samples with value None are skipped
+    """
+    lines = []
+    for name, help_text, samples in metric_families:
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            continue
+
+        lines.append("# HELP {0} {1}".format(name, help_text))
+        lines.append("# TYPE {0} gauge".format(name))
+        for labels, value in samples:
+            label_text = ",".join('{0}="{1}"'.format(label, _escape_label_value(label_value))
+                                  for label, label_value in sorted(labels.items()))
+            lines.append("{0}{{{1}}} {2}".format(name, label_text, _format_value(value)))
+
+    return "\n".join(lines) + "\n"
+
+
+def _write_file(file_path, content):
+    """Writes the file atomically (temporary file renamed), so that collectors never read a half-written file."""
+    folder = os.path.dirname(file_path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    tmp_file_path = "{0}.{1}.tmp".format(file_path, os.getpid())
+    with open(tmp_file_path, 'w') as out_file:
+        out_file.write(content)
+    os.rename(tmp_file_path, file_path)
+
+
+def _get_file_name(name):
+    return _INVALID_NAME_CHARACTERS.sub('_', name)
+
+
+def _write_metrics(app_config, textfile_name, json_folder, metric_families, json_data, time_value):
+    """Writes <metrics_textfile_folder>/<textfile_name> and <metrics_json_folder>/<json_folder>/<time>.json."""
+    if app_config.metrics_textfile_folder:
+        _write_file(os.path.join(app_config.metrics_textfile_folder, textfile_name), format_textfile(metric_families))
+
+    if app_config.metrics_json_folder:
+        _write_file(os.path.join(app_config.metrics_json_folder, json_folder,
+                                 time_value.strftime(JSON_FILE_TIME_FORMAT) + ".json"),
+                    json.dumps(json_data, indent=2, sort_keys=True))
+
+
+def get_run_metric_families(run_metrics):
+    """Returns the metric families (see format_textfile()) of the given RunMetrics."""
+    run_labels = {'backup': run_metrics.backup_name}
+
+    def stage_samples(attribute):
+        return [({'backup': run_metrics.backup_name, 'stage': stage_metrics.stage,
+                  'object': stage_metrics.object_name or ""}, getattr(stage_metrics, attribute))
+                for stage_metrics in run_metrics.stages]
+
+    return [
+        ('ap_backup_run_start_timestamp_seconds', "Start time of the last backup run.",
+         [(run_labels, _to_timestamp(run_metrics.start_time))]),
+        ('ap_backup_run_duration_seconds', "Wall time of the last backup run.",
+         [(run_labels, run_metrics.wall_time)]),
+        ('ap_backup_run_success', "1 if the last backup run succeeded, otherwise 0.",
+         [(run_labels, run_metrics.result != run_metrics.RESULT_FAILED)]),
+        ('ap_backup_run_updated_destinations', "Number of destinations updated by the last backup run.",
+         [(run_labels, run_metrics.updated_destinations)]),
+        ('ap_backup_archive_size_bytes', "Size of the archive of the last backup run.",
+         [(run_labels, run_metrics.archive_size)]),
+        ('ap_backup_stage_duration_seconds', "Wall time of the stage in the last backup run.",
+         stage_samples('wall_time')),
+        ('ap_backup_stage_cpu_seconds', "CPU time of the process and its children during the stage.",
+         stage_samples('cpu_time')),
+        ('ap_backup_stage_read_bytes', "Bytes read by the process during the stage.",
+         stage_samples('bytes_read')),
+        ('ap_backup_stage_written_bytes', "Bytes written by the process during the stage.",
+         stage_samples('bytes_written')),
+        ('ap_backup_stage_files', "Number of files processed by the stage.",
+         stage_samples('files')),
+    ]
+
+
+def export_run_metrics(app_config, run_metrics):
+    """
+    Writes the given RunMetrics to the Prometheus textfile <metrics_textfile_folder>/ap_backup_run_<backup>.prom
+    (replaced by every run) and to <metrics_json_folder>/runs/<backup>/<start time>.json, as configured in
+    app_config.
+    """
+    file_name = _get_file_name(run_metrics.backup_name)
+    _write_metrics(app_config, "ap_backup_run_{0}.prom".format(file_name), os.path.join("runs", file_name),
+                   get_run_metric_families(run_metrics), run_metrics.serialize(), run_metrics.start_time)
+
+
+def get_checker_metric_families(check_time, wall_time, backup_states, check_results):
+    """Returns the metric families (see format_textfile()) of a checker run."""
+    check_timestamp = _to_timestamp(check_time)
+
+    def state_samples(get_value):
+        return [({'backup': state.backup_name, 'location': state.location}, get_value(state))
+                for state in backup_states]
+
+    def get_age(state):
+        if state.last_backup_time is None:
+            return None
+        return max(check_timestamp - _to_timestamp(state.last_backup_time), 0)
+
+    return [
+        ('ap_backup_checker_run_timestamp_seconds', "Time of the last checker run.",
+         [({}, check_timestamp)]),
+        ('ap_backup_checker_duration_seconds', "Wall time of the last checker run.",
+         [({}, wall_time)]),
+        ('ap_backup_backup_last_timestamp_seconds', "Time of the latest backup found by the checker.",
+         state_samples(lambda state: _to_timestamp(state.last_backup_time))),
+        ('ap_backup_backup_age_seconds', "Age of the latest backup at the time of the check.",
+         state_samples(get_age)),
+        ('ap_backup_backup_size_bytes', "Size of the latest backup.",
+         state_samples(lambda state: state.size)),
+        ('ap_backup_backup_copies', "Number of backup copies in the destination.",
+         state_samples(lambda state: state.copies)),
+        ('ap_backup_check_success', "1 if the check passed in the last checker run, otherwise 0.",
+         [({'backup': result.backup_name, 'check': result.check_name}, not result.failed)
+          for result in check_results]),
+    ]
+
+
+def export_checker_metrics(app_config, check_time, wall_time, backup_states, check_results):
+    """
+    Writes the metrics of a checker run to the Prometheus textfile <metrics_textfile_folder>/ap_backup_checker.prom
+    and to <metrics_json_folder>/checker/<check time>.json, as configured in app_config.
+
+    :param check_time: start time of the checker run (datetime)
+    :param wall_time: duration of the checker run in seconds
+    :param backup_states: list of BackupCopyState objects collected by the checks
+    :param check_results: list of CheckResult objects
+    """
+    json_data = {'check_time': check_time.strftime(TIMESTAMP_FORMAT), 'wall_time': wall_time,
+                 'backups': [state.serialize() for state in backup_states],
+                 'checks': [{'backup_name': result.backup_name, 'check': result.check_name,
+                             'up_to_date': result.up_to_date, 'timed_out': result.timed_out, 'error': result.error}
+                            for result in check_results]}
+    _write_metrics(app_config, "ap_backup_checker.prom", "checker",
+                   get_checker_metric_families(check_time, wall_time, backup_states, check_results),
+                   json_data, check_time)
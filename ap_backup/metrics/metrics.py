@@ -0,0 +1,155 @@
+from datetime import datetime
+import os
+import threading
+import time
+
+__author__ = 'Alexander Pikovsky'
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+IO_COUNTERS_FILE = '/proc/self/io'
+
+
+def read_io_counters():
+    """
+    Returns the tuple (bytes read, bytes written) by this process so far: the data passed through read and write
+    system calls (including copy_file_range and sendfile, pipes and sockets; not reflink clones), see rchar and
+    wchar in /proc/<pid>/io. Returns (None, None) if not available (not Linux).
+    """
+    try:
+        with open(IO_COUNTERS_FILE, 'r') as in_file:
+            counters = dict(line.split(':', 1) for line in in_file if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (IOError, OSError, KeyError, ValueError):
+        return None, None
+
+
+def _get_cpu_time():
+    """Returns the CPU time (user + system) of this process and its terminated child processes in seconds."""
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+def _format_time(value):
+    return value.strftime(TIMESTAMP_FORMAT) if value is not None else None
+
+
+def _subtract(value, start_value):
+    return value - start_value if value is not None and start_value is not None else None
+
+
+class StageMetrics(object):
+    """
+    Metrics of a single stage of a backup run (e.g. creating the archive) or of a single backup object.
+
+    CPU time and bytes read and written are measured for the whole process (CPU time includes the child processes
+    like mysqldump or compressors), so the figures of stages running in parallel (objects processed in parallel)
+    overlap.
+    """
+
+    def __init__(self, stage, object_name=None):
+        self.stage = stage   # stage name
+        self.object_name = object_name   # target subfolder of the backup object; None for stages of the whole run
+        self.start_time = None   # datetime
+        self.wall_time = None   # seconds
+        self.cpu_time = None   # seconds
+        self.bytes_read = None   # None if not measurable
+        self.bytes_written = None   # None if not measurable
+        self.files = None   # number of files processed; None if not applicable
+        self.failed = False
+
+    def serialize(self):
+        return {'stage': self.stage, 'object': self.object_name, 'start_time': _format_time(self.start_time),
+                'wall_time': self.wall_time, 'cpu_time': self.cpu_time, 'bytes_read': self.bytes_read,
+                'bytes_written': self.bytes_written, 'files': self.files, 'failed': self.failed}
+
+
+class _StageMeasurement(object):
+    """Context manager measuring a stage, returns its StageMetrics on enter."""
+
+    def __init__(self, stage_metrics):
+        self.stage_metrics = stage_metrics
+
+    def __enter__(self):
+        self.stage_metrics.start_time = datetime.now()
+        self._start_wall_time = time.time()
+        self._start_cpu_time = _get_cpu_time()
+        self._start_bytes_read, self._start_bytes_written = read_io_counters()
+        return self.stage_metrics
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        bytes_read, bytes_written = read_io_counters()
+        self.stage_metrics.wall_time = time.time() - self._start_wall_time
+        self.stage_metrics.cpu_time = _get_cpu_time() - self._start_cpu_time
+        self.stage_metrics.bytes_read = _subtract(bytes_read, self._start_bytes_read)
+        self.stage_metrics.bytes_written = _subtract(bytes_written, self._start_bytes_written)
+        self.stage_metrics.failed = exc_type is not None
+
+
+class RunMetrics(object):
+    """Metrics of a single run of a backup configuration: the measured stages (in the order they started)."""
+
+    RESULT_SUCCEEDED = "succeeded"
+    RESULT_FAILED = "failed"
+    RESULT_SKIPPED = "skipped"
+
+    def __init__(self, backup_name):
+        self.backup_name = backup_name
+        self.start_time = datetime.now()
+        self.end_time = None
+        self.result = None   # one of RESULT_xxx constants, None while running
+        self.updated_destinations = 0
+        self.archive_size = None   # size of the archive copied to the destinations, None if not created
+
+        #list of StageMetrics objects
+        self.stages = []
+
+        self._start_wall_time = time.time()
+        self.wall_time = None
+        self._lock = threading.Lock()
+
+    def measure(self, stage, object_name=None):
+        """
+        Returns a context manager measuring the given stage (of the given object), which yields its StageMetrics,
+        e.g. `with run_metrics.measure("create_archive") as stage_metrics: ...`. Thread-safe.
+        """
+        stage_metrics = StageMetrics(stage, object_name)
+        with self._lock:
+            self.stages.append(stage_metrics)
+        return _StageMeasurement(stage_metrics)
+
+    def get_running_stages(self):
+        """Returns the names of the stages started but not yet finished, e.g. ["process_objects", "process_object[db]"].
+           Thread-safe."""
+        with self._lock:
+            stages = list(self.stages)
+        return [stage_metrics.stage if stage_metrics.object_name is None
+                else "{0}[{1}]".format(stage_metrics.stage, stage_metrics.object_name)
+                for stage_metrics in stages if stage_metrics.start_time is not None and stage_metrics.wall_time is None]
+
+    def finish(self, result):
+        self.result = result
+        self.end_time = datetime.now()
+        self.wall_time = time.time() - self._start_wall_time
+
+    def serialize(self):
+        return {'backup_name': self.backup_name, 'start_time': _format_time(self.start_time),
+                'end_time': _format_time(self.end_time), 'wall_time': self.wall_time, 'result': self.result,
+                'updated_destinations': self.updated_destinations, 'archive_size': self.archive_size,
+                'stages': [stage_metrics.serialize() for stage_metrics in self.stages]}
+
+
+class BackupCopyState(object):
+    """Latest backup found by the checker in a destination (or a folder checked by a checker config)."""
+
+    def __init__(self, backup_name, location, last_backup_time, size=None, copies=None):
+        self.backup_name = backup_name
+        self.location = location   # destination name or checked folder
+        self.last_backup_time = last_backup_time   # datetime; None if no backup found
+        self.size = size   # size of the latest copy in bytes; None if unknown
+        self.copies = copies   # number of copies in the destination; None if unknown
+
+    def serialize(self):
+        return {'backup_name': self.backup_name, 'location': self.location,
+                'last_backup_time': _format_time(self.last_backup_time), 'size': self.size, 'copies': self.copies}
@@ -1,3 +1,7 @@
 __author__ = 'Alexander Pikovsky'
 
-from .multicopy import multicopy
\ No newline at end of file
+from .catalog import CopyCatalog, CatalogEntry
+from .copy_engine import copy_file, copy_file_with_stat, copy_tree
+from .fanout import fanout_copy
+from .multicopy import multicopy, get_copy_path
+from .retention import RetentionPolicy
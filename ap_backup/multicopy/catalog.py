@@ -0,0 +1,178 @@
+from datetime import datetime
+import glob
+import json
+import os
+import shutil
+
+from .retention import RetentionPolicy
+
+__author__ = 'Alexander Pikovsky'
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+#date/time formats appended to the copy names by multicopy (see get_copy_path())
+COPY_NAME_TIME_FORMATS = (("%Y-%m-%d_%H-%M", 16), ("%Y-%m-%d", 10))
+
+#the catalog is outdated if the target folder was modified later than this after the catalog (in seconds), the
+#tolerance covers the precision lost when setting the catalog modification time
+CATALOG_MTIME_TOLERANCE = 0.00001
+
+
+def parse_copy_time(copy_time_str):
+    """Parses the date/time appended to a copy name (e.g. '2016-01-02_10-30'), returns None if invalid."""
+    for time_format, length in COPY_NAME_TIME_FORMATS:
+        if len(copy_time_str) == length:
+            try:
+                return datetime.strptime(copy_time_str, time_format)
+            except ValueError:
+                pass
+
+    return None
+
+
+class CatalogEntry(object):
+    """Catalog record of a single copy."""
+
+    def __init__(self, name, timestamp, size=None, checksum=None):
+        self.name = name   # file or folder name of the copy in the target folder
+        self.timestamp = timestamp   # datetime when the copy was made
+        self.size = size   # file size in bytes; None for folders
+        self.checksum = checksum   # sha256 hex digest of the file content; None if unknown
+
+    def serialize(self):
+        return {'name': self.name, 'timestamp': self.timestamp.strftime(TIMESTAMP_FORMAT), 'size': self.size,
+                'checksum': self.checksum}
+
+    @classmethod
+    def deserialize(cls, data):
+        return cls(data['name'], datetime.strptime(data['timestamp'], TIMESTAMP_FORMAT), data.get('size'),
+                   data.get('checksum'))
+
+
+class CopyCatalog(object):
+    """
+    Catalog of the copies of one file or folder in a target folder, made by multicopy or the backup processor.
+
+    The catalog is stored as a hidden JSON file in the target folder next to the copies and is rewritten
+    atomically on save(). Retention and the decision whether the last copy is new enough are made using the
+    catalog instead of reading the metadata of every copy. A missing or damaged catalog is rebuilt from the copies
+    found in the target folder.
+
+    save() sets the modification time of the catalog to the one of the target folder, so a target folder modified
+    later (e.g. by a copy written before a crash or an interrupted save()) marks the catalog as outdated. Only then
+    the target folder is listed on load and the copies missing in the catalog are added, so that the retention
+    deletes them as well. Only the names made of the base name and a copy time (see get_copy_path()) are taken
+    as copies, so the copies of another base name starting with this one are never deleted.
+    """
+
+    def __init__(self, target_dir, target_base_name, extension):
+        self.target_dir = target_dir
+        self.target_base_name = target_base_name
+        self.extension = extension
+        self.file_path = os.path.join(target_dir, "." + target_base_name + extension + ".catalog.json")
+
+        #list of CatalogEntry objects sorted by timestamp (oldest first)
+        self.entries = []
+
+        outdated = True
+        if os.path.exists(self.file_path):
+            try:
+                self._load()
+                outdated = self._is_outdated()
+            except (IOError, KeyError, TypeError, ValueError):
+                self.entries = []    # damaged catalog, rebuilt from the copies found in the target folder
+
+        if outdated:
+            self._add_uncataloged_copies()
+
+    def get_last_entry(self):
+        """Returns the entry of the newest existing copy, None if no copy exists."""
+        while self.entries:
+            entry = self.entries[-1]
+            if os.path.exists(self.get_copy_path(entry)):
+                return entry
+            self.entries.pop()   # copy was deleted outside of the catalog
+
+        return None
+
+    def get_copy_path(self, entry):
+        return os.path.join(self.target_dir, entry.name)
+
+    def add_copy(self, copy_path, timestamp, checksum=None):
+        """Adds (or replaces) the entry of the given copy, returns the new entry."""
+        name = os.path.basename(copy_path)
+        size = os.path.getsize(copy_path) if os.path.isfile(copy_path) else None
+        entry = CatalogEntry(name, timestamp, size, checksum)
+
+        self.entries = [existing_entry for existing_entry in self.entries if existing_entry.name != name]
+        self.entries.append(entry)
+        self.entries.sort(key=lambda catalog_entry: catalog_entry.timestamp)
+        return entry
+
+    def remove_old_copies(self, num_copies):
+        """Deletes the oldest copies to maintain at most num_copies copies, returns the deleted entries."""
+        return self.apply_retention(RetentionPolicy(num_copies=num_copies))
+
+    def apply_retention(self, retention_policy):
+        """Deletes all copies expired according to the given RetentionPolicy, returns the deleted entries."""
+        expired_entries = retention_policy.select_expired(self.entries)
+        expired_names = set(entry.name for entry in expired_entries)
+        self.entries = [entry for entry in self.entries if entry.name not in expired_names]
+
+        for entry in expired_entries:
+            copy_path = self.get_copy_path(entry)
+            if os.path.isdir(copy_path):
+                shutil.rmtree(copy_path)
+            elif os.path.exists(copy_path):
+                os.remove(copy_path)
+
+        return expired_entries
+
+    def save(self):
+        #write to a temporary file and rename it, so that the catalog is never left half-written
+        tmp_file_path = self.file_path + ".tmp"
+        with open(tmp_file_path, 'w') as out_file:
+            json.dump({'copies': [entry.serialize() for entry in self.entries]}, out_file, indent=1, sort_keys=True)
+        os.rename(tmp_file_path, self.file_path)
+
+        #the rename modified the target folder, the catalog records the folder state including it
+        try:
+            folder_stat = os.stat(self.target_dir)
+            os.utime(self.file_path, (folder_stat.st_atime, folder_stat.st_mtime))
+        except OSError:
+            pass    # the catalog stays outdated, the target folder is listed on the next load
+
+    def _load(self):
+        with open(self.file_path, 'r') as in_file:
+            data = json.load(in_file)
+
+        self.entries = sorted((CatalogEntry.deserialize(entry_data) for entry_data in data['copies']),
+                              key=lambda catalog_entry: catalog_entry.timestamp)
+
+    def _is_outdated(self):
+        """Returns True if the target folder was modified after the last save() of the catalog."""
+        try:
+            return os.path.getmtime(self.target_dir) > os.path.getmtime(self.file_path) + CATALOG_MTIME_TOLERANCE
+        except OSError:
+            return True
+
+    def _parse_copy_name(self, name):
+        """Returns the copy time of the given copy name (base name, '_', copy time, extension), None if not a copy."""
+        prefix = self.target_base_name + "_"
+        if not name.startswith(prefix) or not name.endswith(self.extension):
+            return None
+
+        return parse_copy_time(name[len(prefix):len(name) - len(self.extension)])
+
+    def _add_uncataloged_copies(self):
+        """Adds the entries of the copies found in the target folder but not in the catalog (lists the folder once)."""
+        cataloged_names = set(entry.name for entry in self.entries)
+        pattern = os.path.join(self.target_dir, self.target_base_name + "_*" + self.extension)
+        for copy_path in glob.glob(pattern):
+            name = os.path.basename(copy_path)
+            if name in cataloged_names:
+                continue
+            timestamp = self._parse_copy_name(name)
+            if timestamp is not None:
+                self.add_copy(copy_path, timestamp)
@@ -0,0 +1,172 @@
+import errno
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # not available on Windows
+
+__author__ = 'Alexander Pikovsky'
+
+
+COPY_STRATEGY_REFLINK = "reflink"
+COPY_STRATEGY_COPY_FILE_RANGE = "copy_file_range"
+COPY_STRATEGY_SENDFILE = "sendfile"
+COPY_STRATEGY_BUFFERED = "buffered"
+
+#Linux ioctl cloning a whole file (shares the data blocks on btrfs, XFS and other reflink capable filesystems)
+FICLONE = 0x40049409
+
+#errors meaning that a copy strategy is not supported for the given files
+_UNSUPPORTED_ERRNOS = frozenset(code for code in (getattr(errno, name, None) for name in (
+    'EBADF', 'EINVAL', 'ENOSYS', 'ENOTSUP', 'EOPNOTSUPP', 'ENOTTY', 'EXDEV', 'EPERM')) if code is not None)
+
+BUFFER_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024 * 1024
+
+#size of the chunks copied between two throttle checks, small enough to keep the rate smooth
+THROTTLED_CHUNK_SIZE = 1024 * 1024
+
+
+def _reflink(in_file, out_file, size, throttle):
+    if fcntl is None:
+        return False
+
+    fcntl.ioctl(out_file.fileno(), FICLONE, in_file.fileno())
+    return True
+
+
+def _copy_by_chunks(copy_chunk, size, throttle):
+    """Calls copy_chunk(offset, count) until size bytes are copied. Returns False if nothing could be copied."""
+    chunk_size = THROTTLED_CHUNK_SIZE if throttle is not None else CHUNK_SIZE
+    offset = 0
+    while offset < size:
+        count = min(chunk_size, size - offset)
+        if throttle is not None:
+            throttle.read(count)
+            throttle.write(count)
+        try:
+            copied = copy_chunk(offset, count)
+        except (IOError, OSError) as ex:
+            if offset == 0 and ex.errno in _UNSUPPORTED_ERRNOS:
+                return False
+            raise
+
+        if copied == 0:
+            if offset == 0:
+                return False    # e.g. pseudo files reporting a wrong size
+            break   # source file was truncated while being copied
+        offset += copied
+
+    return True
+
+
+def _copy_file_range(in_file, out_file, size, throttle):
+    if not hasattr(os, 'copy_file_range') or size == 0:
+        return False
+
+    in_fd, out_fd = in_file.fileno(), out_file.fileno()
+    return _copy_by_chunks(lambda offset, count: os.copy_file_range(in_fd, out_fd, count, offset, offset), size,
+                           throttle)
+
+
+def _sendfile(in_file, out_file, size, throttle):
+    if not hasattr(os, 'sendfile') or size == 0:
+        return False
+
+    in_fd, out_fd = in_file.fileno(), out_file.fileno()
+    return _copy_by_chunks(lambda offset, count: os.sendfile(out_fd, in_fd, offset, count), size, throttle)
+
+
+def _buffered_copy(in_file, out_file, size, throttle):
+    if throttle is None:
+        shutil.copyfileobj(in_file, out_file, BUFFER_SIZE)
+        return True
+
+    while True:
+        data = in_file.read(BUFFER_SIZE)
+        if not data:
+            return True
+        throttle.read(len(data))
+        throttle.write(len(data))
+        out_file.write(data)
+
+
+#copy strategies in the order of preference
+_COPY_STRATEGIES = (
+    (COPY_STRATEGY_REFLINK, _reflink),
+    (COPY_STRATEGY_COPY_FILE_RANGE, _copy_file_range),
+    (COPY_STRATEGY_SENDFILE, _sendfile),
+    (COPY_STRATEGY_BUFFERED, _buffered_copy),
+)
+
+
+def copy_file(src_file, dst_file, reflink_only=False, throttle=None):
+    """
+    Copies the file content like shutil.copyfile, using the fastest strategy supported for the given files:
+    reflink clone (no data is copied), copy_file_range and sendfile (data is copied in the kernel) or buffered
+    copy. os.copy_file_range (Python 3.8+) and os.sendfile (Python 3.3+) do not exist in Python 2.7, there only
+    the reflink clone and the buffered copy are used.
+
+    :param reflink_only: if True, only a reflink clone is tried
+    :param throttle: ap_backup.throttle.Throttle limiting the copy rate (clones are not limited); None for unlimited
+    :returns: the used strategy (one of COPY_STRATEGY_xxx constants); None if reflink_only is True and cloning
+              is not supported (dst_file is not created in this case)
+    """
+    with open(src_file, 'rb') as in_file:
+        size = os.fstat(in_file.fileno()).st_size
+        with open(dst_file, 'wb') as out_file:
+            for strategy, copy_function in _COPY_STRATEGIES:
+                try:
+                    if copy_function(in_file, out_file, size, throttle):
+                        return strategy
+                except (IOError, OSError) as ex:
+                    if strategy != COPY_STRATEGY_REFLINK or ex.errno not in _UNSUPPORTED_ERRNOS:
+                        raise
+
+                if reflink_only:
+                    break
+
+    os.remove(dst_file)
+    return None
+
+
+def copy_file_with_stat(src_file, dst_file, throttle=None):
+    """Copies the file content and metadata like shutil.copy2 (dst_file must be a file path). Returns the strategy."""
+    strategy = copy_file(src_file, dst_file, throttle=throttle)
+    shutil.copystat(src_file, dst_file)
+    return strategy
+
+
+def copy_tree(src_folder, dst_folder, throttle=None):
+    """
+    Copies the folder (deep) like shutil.copytree (symbolic links are followed, dst_folder must not exist)
+    using copy_file_with_stat(). Copy errors and folders which cannot be read are collected and raised as
+    shutil.Error after all other files are copied.
+    """
+    copied_dirs = []
+    errors = []
+    for dir_path, dir_names, file_names in os.walk(src_folder, followlinks=True,
+                                                    onerror=lambda ex: errors.append((ex.filename, None, str(ex)))):
+        target_dir = os.path.normpath(os.path.join(dst_folder, os.path.relpath(dir_path, src_folder)))
+        os.mkdir(target_dir)
+        copied_dirs.append((dir_path, target_dir))
+
+        for file_name in file_names:
+            src_file = os.path.join(dir_path, file_name)
+            target_file = os.path.join(target_dir, file_name)
+            try:
+                copy_file_with_stat(src_file, target_file, throttle)
+            except (IOError, OSError) as ex:
+                errors.append((src_file, target_file, str(ex)))
+
+    #set folder times after all files are created
+    for dir_path, target_dir in reversed(copied_dirs):
+        try:
+            shutil.copystat(dir_path, target_dir)
+        except OSError as ex:
+            errors.append((dir_path, target_dir, str(ex)))
+
+    if errors:
+        raise shutil.Error(errors)
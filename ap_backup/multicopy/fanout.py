@@ -0,0 +1,235 @@
+import collections
+import hashlib
+import os
+import threading
+
+from ap_backup.manifest import HASH_ALGORITHM
+
+from .copy_engine import copy_file
+
+__author__ = 'Alexander Pikovsky'
+
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+DEFAULT_MAX_QUEUED_BLOCKS = 16
+
+
+class _DeviceWriter(threading.Thread):
+    """
+    Writes the blocks read by the fan-out reader to all target files on one device.
+
+    The reader never waits for a writer: if the queue of the writer is full (the device is slower than the
+    others), the writer is detached. A detached writer writes the already queued blocks and then copies the rest
+    of the source file reading it on its own.
+
+    If an expected checksum is given, the written data is hashed and the writer fails if it does not match
+    (e.g. the source file was modified while being copied).
+
+    The reader accounts the reads and writes of the attached writers in the throttle, so that a throttled copy
+    does not detach writers; a detached writer accounts its own reads and writes.
+    """
+
+    def __init__(self, src_file, target_files, block_size, max_queued_blocks, expected_checksum=None,
+                 throttle=None):
+        super(_DeviceWriter, self).__init__()
+        self.daemon = True
+
+        self.src_file = src_file
+        self.target_files = target_files
+        self.block_size = block_size
+        self.max_queued_blocks = max_queued_blocks
+        self.expected_checksum = expected_checksum
+        self.throttle = throttle
+
+        #exception raised by the writer (None if succeeded)
+        self.error = None
+
+        #source offset the detached writer continues reading at (None if not detached)
+        self.detached_offset = None
+
+        self._blocks = collections.deque()
+        self._queued_bytes = 0
+        self._finished = False
+        self._condition = threading.Condition()
+
+    @property
+    def attached(self):
+        return self.detached_offset is None and self.error is None
+
+    def offer(self, block):
+        """Queues the given block, detaches the writer if the queue is full. Returns False if not attached."""
+        with self._condition:
+            if not self.attached:
+                return False
+
+            if len(self._blocks) >= self.max_queued_blocks:
+                self.detached_offset = self._queued_bytes
+                self._condition.notify()
+                return False
+
+            self._blocks.append(block)
+            self._queued_bytes += len(block)
+            self._condition.notify()
+            return True
+
+    def finish(self):
+        """Notifies the writer that the whole source file was queued."""
+        with self._condition:
+            self._finished = True
+            self._condition.notify()
+
+    def abort(self, error):
+        """Aborts the writer because reading the source file failed."""
+        with self._condition:
+            if self.error is None:
+                self.error = error
+            self._blocks.clear()
+            self._condition.notify()
+
+    def run(self):
+        out_files = []
+        file_hash = hashlib.new(HASH_ALGORITHM) if self.expected_checksum is not None else None
+        try:
+            for target_file in self.target_files:
+                out_files.append(open(target_file, 'wb'))
+
+            while True:
+                with self._condition:
+                    while not self._blocks and not self._finished and self.detached_offset is None \
+                            and self.error is None:
+                        self._condition.wait()
+
+                    if self.error is not None:
+                        raise self.error
+                    if self._blocks:
+                        block = self._blocks.popleft()
+                    else:
+                        break
+
+                if file_hash is not None:
+                    file_hash.update(block)
+                for out_file in out_files:
+                    out_file.write(block)
+
+            #catch up with the source file on our own
+            if self.detached_offset is not None:
+                with open(self.src_file, 'rb') as in_file:
+                    in_file.seek(self.detached_offset)
+                    while True:
+                        block = in_file.read(self.block_size)
+                        if not block:
+                            break
+                        if self.throttle is not None:
+                            self.throttle.read(len(block))
+                            self.throttle.write(len(block) * len(out_files))
+                        if file_hash is not None:
+                            file_hash.update(block)
+                        for out_file in out_files:
+                            out_file.write(block)
+
+            for out_file in out_files:
+                out_file.close()
+
+            if file_hash is not None and file_hash.hexdigest() != self.expected_checksum:
+                raise Exception("Checksum mismatch: written data has {0} {1}, expected {2}."
+                                .format(HASH_ALGORITHM, file_hash.hexdigest(), self.expected_checksum))
+
+        except Exception as ex:
+            with self._condition:
+                self.error = ex
+                self._blocks.clear()
+
+        finally:
+            for out_file in out_files:
+                if not out_file.closed:
+                    out_file.close()
+
+
+def fanout_copy(src_file, target_files, block_size=DEFAULT_BLOCK_SIZE, max_queued_blocks=DEFAULT_MAX_QUEUED_BLOCKS,
+                reporter=None, expected_checksum=None, throttle=None):
+    """
+    Copies the given file to all target files reading it only once. Target files on the source device are cloned
+    (reflink) if the filesystem supports it. The other target files are written by one writer thread per device,
+    so that a slow device (e.g. a network share) does not stall the others: a writer lagging behind by more than
+    max_queued_blocks blocks stops receiving blocks and reads the rest of the source file on its own.
+
+    :param src_file: file to copy
+    :param target_files: list of target file paths (target folders must exist)
+    :param block_size: read block size in bytes
+    :param max_queued_blocks: maximum number of blocks queued per device writer
+    :param reporter: reporter (prints output to console if not specified)
+    :param expected_checksum: HASH_ALGORITHM hex digest of the source file; if specified, the data written to
+                              every (not cloned) target file is hashed inline and must match it
+    :param throttle: ap_backup.throttle.Throttle limiting the read and write rate (clones are not limited);
+                     None for unlimited
+    :returns: dict: target file -> exception for every target file which could not be written (empty on success)
+    """
+
+    def log_info(message):
+        if reporter:
+            reporter.info(message)
+        else:
+            print(message)
+
+    errors = {}
+
+    #group target files by device, target files on the source device are cloned if the filesystem supports it
+    src_device = os.stat(src_file).st_dev
+    target_files_by_device = collections.OrderedDict()
+    for target_file in target_files:
+        device = os.stat(os.path.dirname(os.path.abspath(target_file))).st_dev
+        if device == src_device:
+            try:
+                if copy_file(src_file, target_file, reflink_only=True):
+                    log_info("Cloned '{0}' to '{1}' (reflink).".format(src_file, target_file))
+                    continue
+            except (IOError, OSError) as ex:
+                errors[target_file] = ex
+                continue
+
+        target_files_by_device.setdefault(device, []).append(target_file)
+
+    if not target_files_by_device:
+        return errors
+
+    log_info("Copying '{0}' to {1} target(s) on {2} device(s)..."
+             .format(src_file, len(target_files), len(target_files_by_device)))
+
+    writers = [_DeviceWriter(src_file, device_target_files, block_size, max_queued_blocks, expected_checksum,
+                             throttle)
+               for device_target_files in target_files_by_device.values()]
+    for writer in writers:
+        writer.start()
+
+    try:
+        with open(src_file, 'rb') as in_file:
+            attached_writers = list(writers)
+            while attached_writers:
+                block = in_file.read(block_size)
+                if not block:
+                    break
+                if throttle is not None:
+                    throttle.read(len(block))
+                    throttle.write(len(block) * sum(len(writer.target_files) for writer in attached_writers))
+                attached_writers = [writer for writer in attached_writers if writer.offer(block)]
+    except Exception as ex:
+        for writer in writers:
+            writer.abort(ex)
+        raise
+    finally:
+        for writer in writers:
+            writer.finish()
+        for writer in writers:
+            writer.join()
+
+    for writer in writers:
+        if writer.detached_offset is not None:
+            log_info("Writer of {0} lagged behind and read the source file on its own from offset {1}."
+                     .format(", ".join("'{0}'".format(target_file) for target_file in writer.target_files),
+                             writer.detached_offset))
+        if writer.error is not None:
+            for target_file in writer.target_files:
+                errors[target_file] = writer.error
+
+    log_info("Done")
+    return errors
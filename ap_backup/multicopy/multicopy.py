@@ -1,12 +1,52 @@
 import os.path
 from datetime import date, datetime
-from time import strptime
-import glob
 import shutil
 
+from ap_backup.manifest import compute_file_hash
+
+from .catalog import CopyCatalog
+from .copy_engine import copy_file, copy_tree
+from .retention import RetentionPolicy
+
+
+#multi-part file extensions kept together when constructing copy names
+COMPOUND_EXTENSIONS = ('.tar.gz', '.tar.bz2', '.tar.xz', '.tar.zst')
+
+
+def split_file_extension(file_name):
+    """Splits the file name into base name and extension, keeping compound extensions like '.tar.gz' together."""
+    for extension in COMPOUND_EXTENSIONS:
+        if file_name.endswith(extension) and len(file_name) > len(extension):
+            return file_name[:-len(extension)], extension
+
+    return os.path.splitext(file_name)
+
+
+def get_copy_path(src_file_or_dir, target_dir, target_base_name=None, append_time=True, copy_time=None):
+    """
+    Returns the path of the new copy of the given file or folder in the target folder (see multicopy()).
+
+    :param copy_time: date/time to append to the copy name; default is now
+    """
+    if os.path.isdir(src_file_or_dir):
+        src_file_or_dir_name, src_file_extension = os.path.basename(src_file_or_dir), ""
+    else:
+        src_file_or_dir_name, src_file_extension = split_file_extension(os.path.basename(src_file_or_dir))
+
+    if target_base_name is None:
+        target_base_name = src_file_or_dir_name
+    if copy_time is None:
+        copy_time = datetime.now()
+
+    date_time_str = copy_time.strftime("%Y-%m-%d")
+    if append_time:
+        date_time_str = date_time_str + "_" + copy_time.strftime("%H-%M")
+
+    return os.path.join(target_dir, target_base_name + "_" + date_time_str + src_file_extension)
+
 
 def multicopy(src_file_or_dir, target_dir, num_copies, min_period_days=0, target_base_name=None, append_time=True,
-               ignore_errors=False, reporter=None):
+               ignore_errors=False, reporter=None, retention_policy=None, throttle=None):
     """
     Copies the given file or folder to the target folder, whereby the file/folder name is constructed 
     by appending the current date (and possibly time) to the file/folder name. If another copies exist 
@@ -25,6 +65,8 @@ def multicopy(src_file_or_dir, target_dir, num_copies, min_period_days=0, target
                           if False, exception occurs on copy errors
                             
     :param reporter: reporter (prints output to console if not specified)
+    :param retention_policy: RetentionPolicy defining the copies to maintain; if specified, num_copies is ignored
+    :param throttle: ap_backup.throttle.Throttle limiting the copy rate; None for unlimited
     """
     
     def log_info(message):
@@ -40,7 +82,7 @@ def multicopy(src_file_or_dir, target_dir, num_copies, min_period_days=0, target
     MODE_DIR = "dir"
     if os.path.isfile(src_file_or_dir):
         mode = MODE_FILE
-        src_file_or_dir_name, src_file_extension = os.path.splitext(os.path.basename(src_file_or_dir))
+        src_file_or_dir_name, src_file_extension = split_file_extension(os.path.basename(src_file_or_dir))
     elif os.path.isdir(src_file_or_dir):
         mode = MODE_DIR
         src_file_or_dir_name, src_file_extension = os.path.basename(src_file_or_dir), ""
@@ -63,42 +105,20 @@ def multicopy(src_file_or_dir, target_dir, num_copies, min_period_days=0, target
         target_base_name = src_file_or_dir_name;
         
     #construct new file/folder name
-    date_time_str = current_date_time.strftime("%Y-%m-%d")
-    if append_time:
-        date_time_str = date_time_str + "_" + current_date_time.strftime("%H-%M")
-    
-    new_file_or_dir_name = target_base_name + "_" + date_time_str + src_file_extension
-    new_file_or_dir_path = os.path.join(target_dir, new_file_or_dir_name)
+    new_file_or_dir_path = get_copy_path(src_file_or_dir, target_dir, target_base_name, append_time, current_date_time)
 
-    #print(new_file_or_dir_name, new_file_or_dir_path)
+    #print(new_file_or_dir_path)
     
-    #get the list of all existing backup files or folders
-    #sort existing backups in date-reverse order (newer files/folders first)
-    existing_backups = glob.glob(os.path.join(target_dir, target_base_name + "_*" + src_file_extension))
-    existing_backups.sort()
-    existing_backups.reverse()
-    #print(existing_backups)
-
-    #get the last existing backup (if any), parse date (sets min_period_days = 0 if parse error or no existing backup)
-    if len(existing_backups) > 0:
-        if mode == MODE_FILE:
-            last_backup_name = os.path.splitext(os.path.basename(existing_backups[0]))[0]
-        elif os.path.isdir(src_file_or_dir):
-            last_backup_name = os.path.basename(existing_backups[0])
-        
-        last_backup_date_string = last_backup_name[-10:]
-        
-        try:
-            last_backup_date = date(*strptime(last_backup_date_string, "%Y_%m_%d")[0:3])
-        except ValueError:
-            #invalid format => set to today, but period to 0 (to force backup)
-            last_backup_date = current_date
-            min_period_days = 0
+    #get the last existing copy from the catalog of the target folder (sets min_period_days = 0 if no copy exists)
+    catalog = CopyCatalog(target_dir, target_base_name, src_file_extension)
+    last_copy = catalog.get_last_entry()
+    if last_copy is not None:
+        last_backup_date = last_copy.timestamp.date()
     else:
         last_backup_date = current_date
         min_period_days = 0
-            
-    #print last_backup_date_string, last_backup_date, min_period_days, (current_date - last_backup_date).days
+
+    #print last_backup_date, min_period_days, (current_date - last_backup_date).days
 
     #back up the file or folder, if needed
     if min_period_days == 0 or (current_date - last_backup_date).days >= min_period_days:
@@ -106,20 +126,24 @@ def multicopy(src_file_or_dir, target_dir, num_copies, min_period_days=0, target
             log_info("Copying '{0}' to '{1}'...".format(src_file_or_dir, new_file_or_dir_path))
             if os.path.isfile(new_file_or_dir_path):
                 os.remove(new_file_or_dir_path)
+            checksum = None
             try:
-                shutil.copyfile(src_file_or_dir, new_file_or_dir_path)
+                strategy = copy_file(src_file_or_dir, new_file_or_dir_path, throttle=throttle)
+                log_info("Copied using {0}.".format(strategy))
+                checksum = compute_file_hash(new_file_or_dir_path)
             except IOError:
                 if ignore_errors:
                     log_info("\n\nFollowing file could not be copied: '{0}'.".format(src_file_or_dir))
                 else:
                     raise
         else:
+            checksum = None
             log_info("Copying source folder to '" + new_file_or_dir_path + "'...")
             if os.path.isdir(new_file_or_dir_path):
                 shutil.rmtree(new_file_or_dir_path)
             
             try:
-                shutil.copytree(src_file_or_dir, new_file_or_dir_path)
+                copy_tree(src_file_or_dir, new_file_or_dir_path, throttle)
             except shutil.Error as err :
                 non_copied_files = err.args[0]
                 if ignore_errors:
@@ -129,7 +153,9 @@ def multicopy(src_file_or_dir, target_dir, num_copies, min_period_days=0, target
                         log_info("    " + non_copied_file_src)
                 else:
                     raise
-            
+
+        if os.path.exists(new_file_or_dir_path):
+            catalog.add_copy(new_file_or_dir_path, current_date_time, checksum)
         log_info("Done")
     else:
         log_info("Skiping backup because the last existing backup is new enough.")
@@ -137,19 +163,11 @@ def multicopy(src_file_or_dir, target_dir, num_copies, min_period_days=0, target
     #cleaning up existing backups
     log_info("Cleaning up existing copies...")
     
-    #again get the list of all existing backup files or folders (now includes the new backup)
-    #sort existing backups in date-reverse order (newer files/folders first)
-    existing_backups = glob.glob(os.path.join(target_dir, target_base_name + "_*" + src_file_extension))
-    existing_backups.sort()
-    existing_backups.reverse()
-    #print(existing_backups)
-        
-    #delete out-of-date files/folders (all starting at num_copies)
-    for existingBackup in existing_backups[num_copies:]:
-        if mode == MODE_FILE:
-            os.remove(existingBackup)
-        else:
-            shutil.rmtree(existingBackup)
-    
+    if retention_policy is None:
+        retention_policy = RetentionPolicy(num_copies=num_copies)
+    expired_copies = catalog.apply_retention(retention_policy)
+    catalog.save()
+    log_info("{0} expired copies deleted ({1}).".format(len(expired_copies), retention_policy))
+
     #Cleaning up done
     log_info("Done")
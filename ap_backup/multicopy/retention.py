@@ -0,0 +1,57 @@
+__author__ = 'Alexander Pikovsky'
+
+
+class RetentionPolicy(object):
+    """
+    Grandfather-father-son retention policy: keeps the last num_copies copies plus the newest copy of each of the
+    last `daily` days, `weekly` ISO weeks and `monthly` months that have copies. A copy kept by several rules is
+    counted by each of them. All copies made since keep_since are kept as well (e.g. a full backup and the
+    incremental backups depending on it).
+    """
+
+    def __init__(self, num_copies=0, daily=0, weekly=0, monthly=0, keep_since=None):
+        self.num_copies = num_copies
+        self.daily = daily
+        self.weekly = weekly
+        self.monthly = monthly
+        self.keep_since = keep_since
+
+    def __str__(self):
+        text = "last {0}, daily {1}, weekly {2}, monthly {3}".format(self.num_copies, self.daily, self.weekly,
+                                                                       self.monthly)
+        if self.keep_since is not None:
+            text += ", all since {0}".format(self.keep_since)
+        return text
+
+    def select_expired(self, entries):
+        """
+        Selects the copies not kept by any rule in a single pass over the given catalog entries.
+
+        :param entries: list of CatalogEntry objects (any order)
+        :returns: list of expired entries (oldest first)
+        """
+
+        #rules: (number of periods to keep, function returning the period of a timestamp)
+        rules = [
+            (self.daily, lambda timestamp: timestamp.date()),
+            (self.weekly, lambda timestamp: timestamp.isocalendar()[:2]),
+            (self.monthly, lambda timestamp: (timestamp.year, timestamp.month)),
+        ]
+        kept_periods = [set() for _ in rules]
+
+        expired_entries = []
+        for index, entry in enumerate(sorted(entries, key=lambda catalog_entry: catalog_entry.timestamp,
+                                             reverse=True)):
+            keep = index < self.num_copies or (self.keep_since is not None and entry.timestamp >= self.keep_since)
+            for (max_periods, get_period), periods in zip(rules, kept_periods):
+                period = get_period(entry.timestamp)
+                if len(periods) < max_periods and period not in periods:
+                    #newest copy of the period
+                    periods.add(period)
+                    keep = True
+
+            if not keep:
+                expired_entries.append(entry)
+
+        expired_entries.reverse()
+        return expired_entries
@@ -0,0 +1,3 @@
+__author__ = 'Alexander Pikovsky'
+
+from .profiler import Profiler, ProfileRun, DEFAULT_PROFILE_DIR, DEFAULT_TOP_FUNCTIONS, format_hot_functions
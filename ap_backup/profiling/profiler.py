@@ -0,0 +1,256 @@
+from collections import defaultdict
+from datetime import datetime
+import cProfile
+import os
+import pstats
+import sys
+import threading
+
+__author__ = 'Alexander Pikovsky'
+
+
+DEFAULT_PROFILE_DIR = '/var/lib/ap-backup/profiles'
+DEFAULT_TOP_FUNCTIONS = 20
+
+#date/time appended to the profile file names
+FILE_TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
+#maximum number of frames of a sampled stack (innermost frames are kept)
+MAX_SAMPLED_FRAMES = 100
+
+
+def _enable_profile(profile):
+    """Enables the given cProfile.Profile in the current thread, returns False if another profiler is active
+       (Python 3.12+ allows only one active profiler, which then profiles all threads)."""
+    try:
+        profile.enable()
+        return True
+    except ValueError:
+        return False
+
+
+def _get_frame_label(frame):
+    code = frame.f_code
+    return "{0}:{1}".format(os.path.basename(code.co_filename), code.co_name)
+
+
+def format_hot_functions(stats, top_functions):
+    """Returns the lines describing the top_functions functions of the given pstats.Stats with the highest own time."""
+    lines = ["{0:>10} {1:>10} {2:>10}  {3}".format("own s", "cumul. s", "calls", "function")]
+    hot_functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top_functions]
+    for function, (primitive_calls, calls, own_time, cumulative_time, callers) in hot_functions:
+        lines.append("{0:10.3f} {1:10.3f} {2:>10}  {3}".format(own_time, cumulative_time, calls,
+                                                              pstats.func_std_string(function)))
+    return lines
+
+
+class Profiler(object):
+    """
+    Profiles backup or checker runs with cProfile, one ProfileRun per backup configuration (see profile()).
+
+    Every run writes <profile_dir>/<name>_<time>.pstats (readable by pstats or e.g. snakeviz) and logs the functions
+    with the highest own time. If sample_interval is specified, the stacks of the threads of all running runs are
+    additionally sampled every sample_interval seconds and written as folded stacks (flame graph input) to
+    <name>_<time>.stacks.txt, prefixed by the stages running when sampled, so that long stages can be analyzed
+    even where the deterministic profile is distorted by its overhead.
+    """
+
+    def __init__(self, profile_dir=DEFAULT_PROFILE_DIR, top_functions=DEFAULT_TOP_FUNCTIONS, sample_interval=None):
+        self.profile_dir = profile_dir
+        self.top_functions = top_functions
+        self.sample_interval = sample_interval   # seconds; None to not sample the stacks
+
+        self._lock = threading.Lock()
+        self._active_runs = []
+        self._sampler_thread = None
+        self._sampler_stop = None   # threading.Event stopping the sampler thread
+
+    def profile(self, name, reporter, get_stages=None):
+        """
+        Returns the ProfileRun of the given name (e.g. the backup name). Use it as a context manager to profile the
+        calling thread and the threads started meanwhile, or profile_call() to profile calls in several threads.
+
+        :param reporter: reporter the summary is written to
+        :param get_stages: function without arguments returning the names of the running stages, used to label
+                           the sampled stacks; None for no labels
+        """
+        return ProfileRun(self, name, reporter, get_stages)
+
+    def _add_active_run(self, profile_run):
+        with self._lock:
+            self._active_runs.append(profile_run)
+            if self.sample_interval and self._sampler_thread is None:
+                self._sampler_stop = threading.Event()
+                self._sampler_thread = threading.Thread(target=self._sample_stacks, args=(self._sampler_stop,),
+                                                        name="profile-sampler")
+                self._sampler_thread.daemon = True
+                self._sampler_thread.start()
+
+    def _remove_active_run(self, profile_run):
+        """Removes the finished run, stops the sampler thread (and waits for it) when the last run finished."""
+        sampler_thread = None
+        with self._lock:
+            self._active_runs.remove(profile_run)
+            if not self._active_runs and self._sampler_thread is not None:
+                sampler_thread, self._sampler_thread = self._sampler_thread, None
+                self._sampler_stop.set()
+
+        if sampler_thread is not None:
+            sampler_thread.join()
+
+    def _sample_stacks(self, stop):
+        """Sampler thread: samples the stacks of the threads of the active runs every sample_interval seconds until
+           stopped."""
+        while not stop.wait(self.sample_interval):
+            with self._lock:
+                if not self._active_runs:
+                    continue
+                frames = sys._current_frames()
+                for profile_run in self._active_runs:
+                    profile_run.add_samples(frames)
+
+
+class ProfileRun(object):
+    """Profile of a single run (e.g. of a backup configuration), see Profiler."""
+
+    def __init__(self, profiler, name, reporter, get_stages=None):
+        self.profiler = profiler
+        self.name = name
+        self.reporter = reporter
+        self.get_stages = get_stages
+        self.start_time = None
+
+        #cProfile.Profile objects of the profiled threads (merged when saved)
+        self._profiles = []
+        self._thread_ids = set()
+        self._lock = threading.Lock()
+
+        #dict: folded stack -> number of samples
+        self._samples = defaultdict(int)
+
+        self._main_profile = None
+        self._thread_start = None
+
+    def __enter__(self):
+        self._start()
+        self._main_profile = cProfile.Profile()
+        if _enable_profile(self._main_profile):
+            self._add_profile(self._main_profile)
+
+        #threads started by the profiled code are profiled by their own profilers, enabled and disabled by the threads
+        #themselves (a profiler cannot be disabled from another thread)
+        self._thread_start = vars(threading.Thread)['start']
+        profile_run = self
+
+        def start(thread):
+            thread.run = profile_run._profile_thread(thread.run)
+            profile_run._thread_start(thread)
+
+        threading.Thread.start = start
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        threading.Thread.start = self._thread_start
+        self._main_profile.disable()
+        self.finish()
+
+    def _start(self):
+        self.start_time = datetime.now()
+        self.profiler._add_active_run(self)
+
+    def _add_profile(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+            self._thread_ids.add(threading.current_thread().ident)
+
+    def _profile_thread(self, run):
+        """Returns the run method of a thread started while profiling, profiling the thread until run returns (the
+           profiles of threads still running when the run finishes are not saved)."""
+        def profiled_run():
+            self.profile_call(run)
+
+        return profiled_run
+
+    def profile_call(self, function):
+        """Calls the function profiling the calling thread (e.g. a check run in a worker thread), returns its
+           result. The run must have been started (see start())."""
+        profile = cProfile.Profile()
+        if not _enable_profile(profile):
+            return function()
+        thread_id = threading.current_thread().ident
+        with self._lock:
+            self._thread_ids.add(thread_id)
+        try:
+            return function()
+        finally:
+            profile.disable()
+            with self._lock:
+                self._thread_ids.discard(thread_id)
+                self._profiles.append(profile)
+
+    def start(self):
+        """Starts a run whose calls are profiled by profile_call(), finish() saves it."""
+        self._start()
+
+    def add_samples(self, frames):
+        """Adds the stacks of the threads of this run to the samples (called by the sampler thread).
+
+        :param frames: dict: thread id -> current frame (see sys._current_frames())
+        """
+        with self._lock:
+            thread_ids = [thread_id for thread_id in self._thread_ids if thread_id in frames]
+        if not thread_ids:
+            return
+
+        stages = self.get_stages() if self.get_stages else []
+        prefix = [";".join(stages) if stages else "-"]
+        stacks = []
+        for thread_id in thread_ids:
+            labels = []
+            frame = frames[thread_id]
+            while frame is not None and len(labels) < MAX_SAMPLED_FRAMES:
+                labels.append(_get_frame_label(frame))
+                frame = frame.f_back
+            labels.reverse()
+            stacks.append(";".join(prefix + labels))
+
+        with self._lock:
+            for stack in stacks:
+                self._samples[stack] += 1
+
+    def finish(self):
+        """Stops the run, writes the profile files and logs the summary. Errors are reported, not raised."""
+        self.profiler._remove_active_run(self)
+        try:
+            self._save()
+        except Exception as ex:
+            self.reporter.error("Writing profile of '{0}' failed: {1}".format(self.name, str(ex)))
+
+    def _save(self):
+        with self._lock:
+            profiles = list(self._profiles)
+            samples = dict(self._samples)
+        if not profiles:
+            return
+
+        if not os.path.isdir(self.profiler.profile_dir):
+            os.makedirs(self.profiler.profile_dir)
+        base_path = os.path.join(self.profiler.profile_dir,
+                                 "{0}_{1}".format(self.name, self.start_time.strftime(FILE_TIME_FORMAT)))
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(base_path + ".pstats")
+
+        self.reporter.info("Profile of '{0}' written to '{1}' ({2} thread(s), {3:.3f} s profiled), hot functions:"
+                           .format(self.name, base_path + ".pstats", len(profiles), stats.total_tt))
+        for line in format_hot_functions(stats, self.profiler.top_functions):
+            self.reporter.info("    " + line)
+
+        if samples:
+            with open(base_path + ".stacks.txt", 'w') as out_file:
+                for stack, count in sorted(samples.items()):
+                    out_file.write("{0} {1}\n".format(stack, count))
+            self.reporter.info("{0} stack samples of '{1}' written to '{2}'."
+                               .format(sum(samples.values()), self.name, base_path + ".stacks.txt"))
@@ -4,7 +4,9 @@ import argparse
 from ap_backup.config import AppConfig
 from ap_backup.config.backup_config import BackupConfig
 from ap_backup.reporter import Reporter
-from ap_backup.backup_processor import BackupProcessor
+from ap_backup.backup_processor import BackupScheduler, run_backups
+
+from .profiling_arguments import add_profiling_arguments, create_profiler
 
 __author__ = 'Alexander Pikovsky'
 
@@ -18,6 +20,34 @@ def backup_main():
                         help="config file, default is '/etc/ap-backup/config.yaml'",
                         default='/etc/ap-backup/config.yaml')
 
+    parser.add_argument('-b', '--backup', type=str, metavar='NAME', action='append', default=None,
+                        help="processes only the given backup configuration (can be repeated), only these "
+                             "configurations are loaded; default is all")
+
+    parser.add_argument('-j', '--jobs', type=int, metavar='N', default=1,
+                        help="number of backup configurations processed in parallel (in separate processes), "
+                             "default is 1")
+
+    parser.add_argument('--group-by-device', action='store_true',
+                        help="never process backup configurations reading from the same source device in parallel")
+
+    parser.add_argument('-d', '--daemon', action='store_true',
+                        help="runs continuously and processes every backup configuration as soon as one of its "
+                             "destinations is due (instead of being started by cron), up to --jobs at a time")
+
+    parser.add_argument('--config-check-interval', type=float, metavar='SECONDS', default=60,
+                        help="daemon mode: interval of checking the configuration files for changes in seconds, "
+                             "default is 60")
+
+    parser.add_argument('--retry-interval', type=float, metavar='SECONDS', default=900,
+                        help="daemon mode: delay before a failed backup is retried in seconds, default is 900")
+
+    parser.add_argument('--run-timeout', type=float, metavar='SECONDS', default=86400,
+                        help="daemon mode: time after which a backup not completed is given up and retried "
+                             "(e.g. if its worker process was killed) in seconds, default is 86400")
+
+    add_profiling_arguments(parser)
+
     #parse arguments and call command function
     args = parser.parse_args()
 
@@ -26,36 +56,58 @@ def backup_main():
         parser.print_help()
         sys.exit()
 
+    profiler = create_profiler(parser, args)
     reporter = Reporter(logger_name='summary')
+
+    if args.daemon:
+        reporter.info("Starting backup daemon with configuration file '{0}'.".format(args.config), separator=True)
+        try:
+            BackupScheduler(args.config, reporter, jobs=args.jobs, backup_names=args.backup,
+                            config_check_interval=args.config_check_interval,
+                            retry_interval=args.retry_interval, profiler=profiler,
+                            run_timeout=args.run_timeout).run()
+        except KeyboardInterrupt:
+            reporter.info("Backup daemon stopped.", separator=True)
+            sys.exit(0)
+        except Exception as ex:
+            reporter.critical("Backup daemon failed: {0}".format(str(ex)), exc_info=True)
+            sys.exit(1)
+
     reporter.info("Starting backup.", separator=True)
 
     #load config
     reporter.info("Loading application configuration file '{0}'...".format(args.config), separator=True)
     app_config = AppConfig(args.config)
     reporter.info("Application configuration file loaded successfully, {0} backup configuration(s) found."
-                        .format(len(app_config.backup_configs)))
+                        .format(len(app_config.backup_config_files)))
 
     #process backup configs
     try:
         #process backup configs, don't abort if some of them fail
+        backup_configs = [backup_config for backup_config in app_config.get_backup_configs(args.backup)
+                          if backup_config.backup_type != BackupConfig.BACKUP_TYPE_CHECKER]
+        results = run_backups(app_config, backup_configs, reporter,
+                              jobs=args.jobs, group_by_device=args.group_by_device, profiler=profiler)
+
         updated_configs = 0
         up_to_date_configs = 0
         failed_configs = 0
-        for backup_config in app_config.backup_configs:
-            if backup_config.backup_type == BackupConfig.BACKUP_TYPE_CHECKER:
-                continue
-
-            try:
-                backup_processor = BackupProcessor(app_config, backup_config, reporter)
-                updated_destinations = backup_processor.process()
-                if updated_destinations > 0:
-                    updated_configs += 1
-                else:
-                    up_to_date_configs += 1
-
-            except Exception as ex:
-                reporter.critical("Backup {0} failed: {1}".format(backup_config.name, str(ex)), exc_info=True)
+        for result in results:
+            if result.failed:
                 failed_configs += 1
+            elif result.updated_destinations > 0:
+                updated_configs += 1
+            else:
+                up_to_date_configs += 1
+
+        #with parallel jobs the protocol is interleaved, so summarize per-config results
+        if args.jobs > 1:
+            for result in results:
+                if result.failed:
+                    reporter.error("Backup {0} failed: {1}".format(result.backup_name, result.error))
+                else:
+                    reporter.info("Backup {0}: {1} destination(s) updated."
+                                  .format(result.backup_name, result.updated_destinations))
 
         #complete
         if failed_configs == 0:
@@ -1,10 +1,15 @@
+from datetime import datetime
 import sys
 import argparse
+import time
 
 from ap_backup import AppConfig
-from ap_backup.check_processor import CheckProcessor
+from ap_backup.check_processor import CheckerDaemon, CopyVerifier, LatestFileCache, VerificationCache, run_checks
+from ap_backup.metrics import export_checker_metrics
 from ap_backup.reporter import Reporter
 
+from .profiling_arguments import add_profiling_arguments, create_profiler
+
 __author__ = 'Alexander Pikovsky'
 
 
@@ -17,6 +22,35 @@ def backup_checker_main():
                         help="config file, default is '/etc/ap-backup/config.yaml'",
                         default='/etc/ap-backup/config.yaml')
 
+    parser.add_argument('-b', '--backup', type=str, metavar='NAME', action='append', default=None,
+                        help="processes only the given backup configuration (can be repeated), only these "
+                             "configurations are loaded; default is all")
+
+    parser.add_argument('-j', '--jobs', type=int, metavar='N', default=1,
+                        help="number of checks run in parallel, default is 1")
+
+    parser.add_argument('-t', '--timeout', type=float, metavar='SECONDS', default=None,
+                        help="timeout of a single check in seconds (e.g. for hanging network mounts), "
+                             "default is no timeout")
+
+    parser.add_argument('--verify', action='store_true',
+                        help="verifies the backup copies in the destinations against the checksums recorded "
+                             "when they were written, instead of checking that the backups are up-to-date")
+
+    parser.add_argument('--verify-max-age', type=float, metavar='DAYS', default=7,
+                        help="verify mode: unchanged copies verified within this number of days are skipped "
+                             "(requires verify_cache_file in the configuration), default is 7")
+
+    parser.add_argument('-d', '--daemon', action='store_true',
+                        help="runs continuously, watches the backup folders (inotify) and reports backups "
+                             "as soon as they become out-of-date")
+
+    parser.add_argument('--rescan-interval', type=float, metavar='SECONDS', default=3600,
+                        help="daemon mode: interval of full backup folder rescans in seconds (needed for network "
+                             "mounts and platforms without inotify), default is 3600")
+
+    add_profiling_arguments(parser)
+
     #parse arguments and call command function
     args = parser.parse_args()
 
@@ -25,6 +59,9 @@ def backup_checker_main():
         parser.print_help()
         sys.exit()
 
+    profiler = create_profiler(parser, args)
+    if profiler is not None and args.daemon:
+        parser.error("profiling is not supported in daemon mode")
     reporter = Reporter(logger_name='summary')
     reporter.info("Checking backups...", separator=True)
 
@@ -32,25 +69,56 @@ def backup_checker_main():
     reporter.info("Loading application configuration file '{0}'...".format(args.config), separator=True)
     app_config = AppConfig(args.config)
     reporter.info("Application configuration file loaded successfully, {0} backup configuration(s) found.\n"
-                        .format(len(app_config.backup_configs)))
+                        .format(len(app_config.backup_config_files)))
+
+    if args.daemon:
+        try:
+            CheckerDaemon(app_config.get_backup_configs(args.backup), reporter,
+                          rescan_interval=args.rescan_interval).run()
+        except KeyboardInterrupt:
+            reporter.info("Checker daemon stopped.", separator=True)
+            sys.exit(0)
+        except Exception as ex:
+            reporter.critical("Checker daemon FAILED: {0}".format(str(ex)), exc_info=True)
+            sys.exit(2)
 
     try:
-        #process backup configs, don't abort if some of them fail
-        up_to_date_configs = 0
-        failed_configs = 0
-        for backup_config in app_config.backup_configs:
+        #run all checks of all backup configs, don't abort if some of them fail
+        backup_configs = app_config.get_backup_configs(args.backup)
+        latest_file_cache = LatestFileCache(app_config.checker_cache_file) if app_config.checker_cache_file else None
+        copy_verifier = None
+        if args.verify:
+            verification_cache = VerificationCache(app_config.verify_cache_file) \
+                if app_config.verify_cache_file else None
+            copy_verifier = CopyVerifier(verification_cache, max_age_days=args.verify_max_age)
+
+        #backup ages and sizes are collected by the regular checks if metrics are exported
+        export_metrics = (app_config.metrics_textfile_folder or app_config.metrics_json_folder) and not args.verify
+        backup_states = [] if export_metrics else None
+        check_time, start_time = datetime.now(), time.time()
+
+        results = run_checks(app_config, backup_configs, reporter, jobs=args.jobs, timeout=args.timeout,
+                             latest_file_cache=latest_file_cache, copy_verifier=copy_verifier,
+                             backup_states=backup_states, profiler=profiler)
+        if export_metrics:
             try:
-                checker = CheckProcessor(app_config, backup_config, reporter)
-                up_to_date = checker.check()
-                if up_to_date:
-                    up_to_date_configs += 1
-                else:
-                    failed_configs += 1
-
+                export_checker_metrics(app_config, check_time, time.time() - start_time, list(backup_states),
+                                       results)
             except Exception as ex:
-                reporter.critical("Backup checker failed for backup '{0}': {1}"
-                                  .format(backup_config.name, str(ex)), exc_info=True)
-                failed_configs += 1
+                reporter.error("Writing checker metrics failed: {0}".format(str(ex)))
+        if latest_file_cache is not None:
+            latest_file_cache.save()
+        if copy_verifier is not None and copy_verifier.cache is not None:
+            copy_verifier.cache.save()
+
+        failed_backup_names = set()
+        for result in results:
+            if result.failed:
+                reporter.error("Check FAILED: {0}".format(result))
+                failed_backup_names.add(result.backup_name)
+
+        failed_configs = len(failed_backup_names)
+        up_to_date_configs = len(backup_configs) - failed_configs
 
         #complete
         if failed_configs == 0:
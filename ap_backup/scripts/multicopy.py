@@ -1,6 +1,7 @@
 import argparse
 
-from ap_backup.multicopy import multicopy
+from ap_backup.multicopy import multicopy, RetentionPolicy
+from ap_backup.throttle import create_throttle, parse_rate
 
 __author__ = 'Alexander Pikovsky'
 
@@ -9,7 +10,8 @@ DESCRIPTION = """
 Copies the given file or folder to the target folder, whereby the file/folder
 name is constructed by appending the current date (and possibly time) to the
 file/folder name. If other copies exist in the given target folder, the old
-ones are deleted to maintain at most num-copies files/folders.
+ones are deleted to maintain at most num-copies files/folders, plus the newest
+copy of the last keep-daily days, keep-weekly weeks and keep-monthly months.
 
 The command creates a new copy only if at least min_period_days is elapsed since
 the last existing copy or there is no existing copies in the target folder.
@@ -31,6 +33,15 @@ def multicopy_main():
     parser.add_argument('-n', '--num-copies', dest='num_copies', default=5, type=int,
                         help='number of copies to maintain (including the new one); default is 5',
                         metavar='NUM_COPIES')
+    parser.add_argument('--keep-daily', dest='keep_daily', default=0, type=int,
+                        help='number of days for which the newest copy of the day is kept in addition to the last '
+                             'NUM_COPIES copies; default is 0', metavar='DAYS')
+    parser.add_argument('--keep-weekly', dest='keep_weekly', default=0, type=int,
+                        help='number of weeks for which the newest copy of the week is kept; default is 0',
+                        metavar='WEEKS')
+    parser.add_argument('--keep-monthly', dest='keep_monthly', default=0, type=int,
+                        help='number of months for which the newest copy of the month is kept; default is 0',
+                        metavar='MONTHS')
     parser.add_argument('-d', '--min-period-days', dest='min_period_days', default=0, type=int,
                         help='minimum number of days since last backup; 0 to force copy in any case; default is 0',
                         metavar='MIN_DAYS')
@@ -45,10 +56,19 @@ def multicopy_main():
                         action='store_true', dest='ignore_errors', default=False,
                         help='if specified, copy errors are ignored and the list of not copied files is printed; '
                              'otherwise exception occurs on copy errors')
+    parser.add_argument('--read-rate-limit', dest='read_rate_limit', default=None, type=parse_rate,
+                        help='maximum read rate in bytes per second, units K, M and G are supported (e.g. 20M); '
+                             'default is unlimited', metavar='RATE')
+    parser.add_argument('--write-rate-limit', dest='write_rate_limit', default=None, type=parse_rate,
+                        help='maximum write rate in bytes per second, units K, M and G are supported (e.g. 20M); '
+                             'default is unlimited', metavar='RATE')
 
     #parse arguments and call command function
     args = parser.parse_args()
 
+    retention_policy = RetentionPolicy(num_copies=args.num_copies, daily=args.keep_daily, weekly=args.keep_weekly,
+                                       monthly=args.keep_monthly)
+
     #run
     multicopy(
         args.src_file_or_dir,
@@ -57,7 +77,9 @@ def multicopy_main():
         target_base_name=args.target_base_name,
         min_period_days=args.min_period_days,
         append_time=args.append_time,
-        ignore_errors=args.ignore_errors)
+        ignore_errors=args.ignore_errors,
+        retention_policy=retention_policy,
+        throttle=create_throttle(args.read_rate_limit, args.write_rate_limit))
 
 
 if __name__ == '__main__':
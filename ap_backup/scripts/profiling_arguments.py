@@ -0,0 +1,34 @@
+from ap_backup.profiling import Profiler, DEFAULT_PROFILE_DIR, DEFAULT_TOP_FUNCTIONS
+
+__author__ = 'Alexander Pikovsky'
+
+
+def add_profiling_arguments(parser):
+    """Adds the profiling options shared by ap-backup and ap-backup-checker to the given argument parser."""
+    parser.add_argument('--profile', action='store_true',
+                        help="profiles every backup configuration (cProfile), writes <backup name>_<time>.pstats "
+                             "to the profile folder and logs the hot functions")
+
+    parser.add_argument('--profile-dir', type=str, metavar='FOLDER', default=None,
+                        help="folder of the profile files (implies --profile), default is '{0}'"
+                             .format(DEFAULT_PROFILE_DIR))
+
+    parser.add_argument('--profile-top', type=int, metavar='N', default=DEFAULT_TOP_FUNCTIONS,
+                        help="number of hot functions logged per profile, default is {0}"
+                             .format(DEFAULT_TOP_FUNCTIONS))
+
+    parser.add_argument('--profile-sample-interval', type=float, metavar='SECONDS', default=None,
+                        help="profiling: additionally samples the stacks every SECONDS seconds, labelled by the "
+                             "running stages, and writes them as folded stacks (flame graph input) to "
+                             "<backup name>_<time>.stacks.txt; default is no sampling")
+
+
+def create_profiler(parser, args):
+    """Returns the Profiler defined by the profiling options, None if profiling is not requested."""
+    if not args.profile and args.profile_dir is None:
+        return None
+
+    if args.profile_sample_interval is not None and args.profile_sample_interval <= 0:
+        parser.error("--profile-sample-interval must be positive")
+    profile_dir = args.profile_dir if args.profile_dir is not None else DEFAULT_PROFILE_DIR
+    return Profiler(profile_dir, top_functions=args.profile_top, sample_interval=args.profile_sample_interval)
@@ -0,0 +1,3 @@
+__author__ = 'Alexander Pikovsky'
+
+from .throttle import TokenBucket, Throttle, ThrottledReader, ThrottledWriter, create_throttle, parse_rate
@@ -0,0 +1,200 @@
+import multiprocessing
+import re
+import threading
+import time
+
+__author__ = 'Alexander Pikovsky'
+
+
+#monotonic clock (system-wide on Linux, so it can be shared by forked processes); wall clock on Python 2
+_clock = getattr(time, 'monotonic', time.time)
+
+_RATE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?(?:/s)?\s*$', re.IGNORECASE)
+_RATE_MULTIPLIERS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+#throttled wrappers account the transferred data in batches of at least this size, so that small reads and
+#writes (e.g. dump lines) do not lock the buckets on every call
+ACCOUNTING_BATCH_SIZE = 64 * 1024
+
+
+def parse_rate(value):
+    """
+    Parses a rate limit in bytes per second: a number optionally followed by a binary unit (K, M, G or T,
+    e.g. "512K", "20M", "1.5G", "20MB/s").
+
+    :returns: rate in bytes per second (float); None if value is None, empty or 0 (unlimited)
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        rate = float(value)
+    else:
+        match = _RATE_PATTERN.match(str(value))
+        if not match:
+            raise ValueError("Invalid rate limit '{0}', expected e.g. '512K', '20M' or '1G'.".format(value))
+        rate = float(match.group(1)) * _RATE_MULTIPLIERS[match.group(2).lower()]
+
+    if rate < 0:
+        raise ValueError("Invalid rate limit '{0}', must not be negative.".format(value))
+    return rate or None
+
+
+class TokenBucket(object):
+    """
+    Token bucket limiting a data rate: tokens (bytes) are added at the given rate up to burst, every transfer
+    consumes its size.
+
+    A consumer may take more tokens than available: the bucket goes into debt and the consumer sleeps until the
+    debt is paid off, so later consumers wait for it as well and the average rate never exceeds the limit.
+    A shared bucket keeps its state in shared memory and limits all processes forked after it was created.
+    Buckets are thread-safe.
+    """
+
+    def __init__(self, rate, burst=None, shared=False, clock=_clock, sleep=time.sleep):
+        """
+        :param rate: rate in bytes per second
+        :param burst: maximum number of bytes transferred without waiting after an idle period; default is rate
+                      (one second of transfer)
+        :param shared: if True, the bucket is shared with the processes forked after its creation
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._clock = clock
+        self._sleep = sleep
+
+        #[available tokens (negative if in debt), time of the last update]
+        if shared:
+            self._state = multiprocessing.RawArray('d', [self.burst, clock()])
+            self._lock = multiprocessing.Lock()
+        else:
+            self._state = [self.burst, clock()]
+            self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """Takes amount tokens, sleeps while the bucket is in debt. Returns the number of seconds slept."""
+        with self._lock:
+            now = self._clock()
+            tokens = min(self.burst, self._state[0] + (now - self._state[1]) * self.rate) - amount
+            self._state[0] = tokens
+            self._state[1] = now
+
+        if tokens >= 0:
+            return 0
+
+        delay = -tokens / self.rate
+        self._sleep(delay)
+        return delay
+
+
+class Throttle(object):
+    """
+    Read and write rate limits. A throttle may have a parent (e.g. the global limits of all backups), every
+    transfer is limited by the throttle and all its parents.
+    """
+
+    def __init__(self, read_rate=None, write_rate=None, parent=None, shared=False):
+        """
+        :param read_rate: read rate limit in bytes per second; None for unlimited
+        :param write_rate: write rate limit in bytes per second; None for unlimited
+        :param parent: parent Throttle; None if none
+        :param shared: if True, the limits are shared with the processes forked after the creation
+        """
+        self.read_bucket = TokenBucket(read_rate, shared=shared) if read_rate else None
+        self.write_bucket = TokenBucket(write_rate, shared=shared) if write_rate else None
+        self.parent = parent
+
+    def read(self, amount):
+        """Accounts amount bytes read, sleeps if a read limit is exceeded."""
+        if self.read_bucket is not None:
+            self.read_bucket.consume(amount)
+        if self.parent is not None:
+            self.parent.read(amount)
+
+    def write(self, amount):
+        """Accounts amount bytes written, sleeps if a write limit is exceeded."""
+        if self.write_bucket is not None:
+            self.write_bucket.consume(amount)
+        if self.parent is not None:
+            self.parent.write(amount)
+
+    def __str__(self):
+        limits = []
+        throttle = self
+        while throttle is not None:
+            limits.append("read {0}, write {1}".format(_format_bucket(throttle.read_bucket),
+                                                       _format_bucket(throttle.write_bucket)))
+            throttle = throttle.parent
+        return "; ".join(limits)
+
+
+def _format_bucket(bucket):
+    return "{0:.1f} MiB/s".format(bucket.rate / 1024 ** 2) if bucket is not None else "unlimited"
+
+
+def create_throttle(read_rate=None, write_rate=None, parent=None, shared=False):
+    """Returns a Throttle with the given limits and parent; the parent if no limit is given (None if no parent)."""
+    if not read_rate and not write_rate:
+        return parent
+    return Throttle(read_rate, write_rate, parent, shared)
+
+
+class ThrottledReader(object):
+    """
+    File-like object reading from the given file, the read data is accounted as read by the given throttle.
+    Only read() and close() are provided, so that consumers cannot bypass the throttle by using the file
+    descriptor. Data not accounted yet is accounted at the end of the file and by close() (closes the file), which
+    matters for consumers reading exactly the file size (e.g. tarfile).
+    """
+
+    def __init__(self, in_file, throttle):
+        self._in_file = in_file
+        self._throttle = throttle
+        self._pending = 0
+
+    def read(self, size=-1):
+        data = self._in_file.read(size)
+        self._pending += len(data)
+        if self._pending >= ACCOUNTING_BATCH_SIZE or not data:
+            self._account_pending()
+        return data
+
+    def close(self):
+        self._account_pending()
+        self._in_file.close()
+
+    def _account_pending(self):
+        if self._pending:
+            self._throttle.read(self._pending)
+            self._pending = 0
+
+
+class ThrottledWriter(object):
+    """
+    File-like object writing to the given file, the written data is accounted as written by the given throttle.
+    Only write(), flush() and close() are provided, so that consumers (e.g. sh) cannot bypass the throttle by using
+    the file descriptor. Data not accounted yet is accounted by flush() and close() (close() closes the file).
+    """
+
+    def __init__(self, out_file, throttle):
+        self._out_file = out_file
+        self._throttle = throttle
+        self._pending = 0
+
+    def write(self, data):
+        self._pending += len(data)
+        if self._pending >= ACCOUNTING_BATCH_SIZE:
+            self._account_pending()
+        return self._out_file.write(data)
+
+    def flush(self):
+        self._account_pending()
+        self._out_file.flush()
+
+    def close(self):
+        self._account_pending()
+        self._out_file.close()
+
+    def _account_pending(self):
+        if self._pending:
+            self._throttle.write(self._pending)
+            self._pending = 0
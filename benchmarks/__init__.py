@@ -0,0 +1,12 @@
+"""
+Benchmarks of the backup pipeline on reproducible synthetic data.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks --scale small --output results/master.json
+    python -m benchmarks --scale small --compare results/master.json
+
+See benchmark_main() in run.py for all options.
+"""
+
+__author__ = 'Alexander Pikovsky'
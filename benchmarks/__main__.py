@@ -0,0 +1,6 @@
+from .run import benchmark_main
+
+__author__ = 'Alexander Pikovsky'
+
+
+benchmark_main()
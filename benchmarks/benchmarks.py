@@ -0,0 +1,321 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import time
+
+from ap_backup.backup_processor import BackupProcessor
+from ap_backup.check_processor.latest_file_cache import LatestFileCache
+from ap_backup.check_processor.utils import check_recent_file_exists
+from ap_backup.config import AppConfig
+from ap_backup.multicopy import CopyCatalog, RetentionPolicy, multicopy
+
+from .fake_tools import install_fake_tools
+from .synthetic_data import create_small_files_tree, create_large_files_tree, create_svn_repository, \
+    create_backup_copies, write_file
+
+__author__ = 'Alexander Pikovsky'
+
+
+#parameters of the benchmark scales
+SCALES = {
+    'small': {
+        'small_files': 2000, 'small_file_size': 4 * 1024,
+        'large_files': 2, 'large_file_size': 16 * 1024 * 1024,
+        'incompressible_size': 16 * 1024 * 1024,
+        'svn_revisions': 500, 'svn_revision_size': 8 * 1024,
+        'dump_size': 16 * 1024 * 1024,
+        'retention_copies': 1000,
+        'check_files': 20000,
+    },
+    'medium': {
+        'small_files': 20000, 'small_file_size': 8 * 1024,
+        'large_files': 2, 'large_file_size': 256 * 1024 * 1024,
+        'incompressible_size': 256 * 1024 * 1024,
+        'svn_revisions': 5000, 'svn_revision_size': 16 * 1024,
+        'dump_size': 256 * 1024 * 1024,
+        'retention_copies': 5000,
+        'check_files': 100000,
+    },
+    'large': {
+        'small_files': 200000, 'small_file_size': 8 * 1024,
+        'large_files': 4, 'large_file_size': 1024 * 1024 * 1024,
+        'incompressible_size': 1024 * 1024 * 1024,
+        'svn_revisions': 20000, 'svn_revision_size': 32 * 1024,
+        'dump_size': 1024 * 1024 * 1024,
+        'retention_copies': 20000,
+        'check_files': 500000,
+    },
+}
+
+#retention of the multicopy benchmark: last 7 copies, 30 daily, 52 weekly and 120 monthly copies
+BENCHMARK_RETENTION_POLICY = RetentionPolicy(num_copies=7, daily=30, weekly=52, monthly=120)
+
+APP_CONFIG = """backup_configs_folders:
+   - backup-configs
+status_db_file: status.db
+"""
+
+BACKUP_CONFIG = """backup_type: archive
+data_folder: {data_folder}
+archive_mode: {archive_mode}
+archive_format: {archive_format}
+max_parallel_objects: {max_parallel_objects}
+
+destinations:
+
+    - name: first
+      folder: {destination_folder}/first
+      num_copies: 2
+      schedule: 0 0 * * *
+
+    - name: second
+      folder: {destination_folder}/second
+      num_copies: 2
+      schedule: 0 0 * * *
+
+objects:
+
+    - type: folder
+      target_subfolder: small-files
+      src_folder_path: {sources_folder}/small-files
+
+    - type: folder
+      target_subfolder: large-files
+      src_folder_path: {sources_folder}/large-files
+
+    - type: file
+      target_subfolder: incompressible
+      src_file_path: {sources_folder}/incompressible.bin
+
+    - type: mysql
+      target_subfolder: mysql
+      target_file_name: benchmark.sql
+      database: benchmark
+      user: benchmark
+      password: benchmark
+
+    - type: svn
+      target_subfolder: svn
+      repository_folder: {sources_folder}/svn-repository
+"""
+
+
+class BenchmarkReporter(object):
+    """Reporter (see ap_backup.reporter.Reporter) logging to the 'benchmark' logger, counts the reported errors."""
+
+    def __init__(self, logger_name='benchmark'):
+        self.logger = logging.getLogger(logger_name)
+        self.errors = []
+
+    def reporter(self, logger_name=None):
+        return self
+
+    def debug(self, msg, separator=False):
+        self.logger.debug(msg)
+
+    def info(self, line, separator=False):
+        self.logger.debug(line)
+
+    def error(self, msg, exc_info=False, separator=False):
+        self.errors.append(msg)
+        self.logger.error(msg, exc_info=exc_info)
+
+    def critical(self, msg, exc_info=False, separator=False):
+        self.errors.append(msg)
+        self.logger.critical(msg, exc_info=exc_info)
+
+
+def _measure_min(function, repeat):
+    """Calls the function repeat times, returns the tuple (minimum wall time in seconds, result of the last call)."""
+    wall_times = []
+    result = None
+    for _ in range(max(repeat, 1)):
+        start_time = time.time()
+        result = function()
+        wall_times.append(time.time() - start_time)
+    return min(wall_times), result
+
+
+def create_sources(sources_folder, scale, seed=0):
+    """
+    Creates the synthetic backup sources of the given scale (see SCALES) in the given folder: small-files (many
+    small compressible files), large-files (few huge compressible files), incompressible.bin and svn-repository.
+    Returns a dict with the sizes in bytes.
+    """
+    os.makedirs(sources_folder)
+    return {
+        'small_files': create_small_files_tree(os.path.join(sources_folder, "small-files"), scale['small_files'],
+                                               scale['small_file_size'], "{0}:small".format(seed)),
+        'large_files': create_large_files_tree(os.path.join(sources_folder, "large-files"), scale['large_files'],
+                                               scale['large_file_size'], "{0}:large".format(seed)),
+        'incompressible': _write_incompressible_file(os.path.join(sources_folder, "incompressible.bin"),
+                                                     scale['incompressible_size'], "{0}:random".format(seed)),
+        'svn_repository': create_svn_repository(os.path.join(sources_folder, "svn-repository"),
+                                                scale['svn_revisions'], scale['svn_revision_size'],
+                                                "{0}:svn".format(seed)),
+        'mysql_dump': scale['dump_size'],
+    }
+
+
+def _write_incompressible_file(file_path, size, seed):
+    write_file(file_path, size, seed, compressible=False)
+    return size
+
+
+def benchmark_backup(work_folder, sources_folder, archive_mode, archive_format, max_parallel_objects=1):
+    """
+    Runs a backup of the sources created by create_sources() (files, folders, fake MySQL dump and fake Subversion
+    repository) into two destinations and measures it stage by stage (see ap_backup.metrics.RunMetrics).
+    Fake mysqldump, svnadmin and svnlook must be installed (see install_fake_tools()).
+
+    :returns: dict with 'timings' (dict: metric name -> seconds) and 'details'
+    """
+    config_folder = os.path.join(work_folder, "config")
+    os.makedirs(os.path.join(config_folder, "backup-configs"))
+    with open(os.path.join(config_folder, "config.yaml"), 'w') as out_file:
+        out_file.write(APP_CONFIG)
+    with open(os.path.join(config_folder, "backup-configs", "benchmark.yaml"), 'w') as out_file:
+        out_file.write(BACKUP_CONFIG.format(data_folder=os.path.join(work_folder, "data"),
+                                            destination_folder=os.path.join(work_folder, "destinations"),
+                                            sources_folder=sources_folder, archive_mode=archive_mode,
+                                            archive_format=archive_format,
+                                            max_parallel_objects=max_parallel_objects))
+
+    app_config = AppConfig(os.path.join(config_folder, "config.yaml"))
+    backup_config = app_config.get_backup_configs(["benchmark"])[0]
+    reporter = BenchmarkReporter()
+    backup_processor = BackupProcessor(app_config, backup_config, reporter)
+
+    start_time = time.time()
+    updated_destinations = backup_processor.process()
+    wall_time = time.time() - start_time
+    if updated_destinations != len(backup_config.destination_by_name) or reporter.errors:
+        raise Exception("Benchmark backup failed: {0}".format("; ".join(reporter.errors)))
+
+    timings = {'total': wall_time}
+    for stage_metrics in backup_processor.metrics.stages:
+        if stage_metrics.object_name is None:
+            metric_name = stage_metrics.stage
+        else:
+            metric_name = "{0}[{1}]".format(stage_metrics.stage, stage_metrics.object_name)
+        timings[metric_name] = stage_metrics.wall_time
+        timings[metric_name + ".cpu"] = stage_metrics.cpu_time
+
+    return {'timings': timings, 'details': backup_processor.metrics.serialize()}
+
+
+def benchmark_multicopy(work_folder, num_copies, repeat=1):
+    """
+    Measures multicopy of a small file into a folder with num_copies existing daily copies, applying
+    BENCHMARK_RETENTION_POLICY: with the catalog rebuilt from the folder (first run, e.g. after an upgrade) and with
+    an existing catalog. The retention selection alone is measured as well.
+
+    :returns: dict with 'timings' (dict: metric name -> seconds) and 'details'
+    """
+    os.makedirs(work_folder)
+    src_file = os.path.join(work_folder, "archive.tar")
+    write_file(src_file, 1024 * 1024, "multicopy")
+    reporter = BenchmarkReporter()
+    end_time = datetime.now() - timedelta(days=1)
+
+    def prepare_target_folder(run_index, with_catalog):
+        target_folder = os.path.join(work_folder, "{0}-{1}".format("catalog" if with_catalog else "rebuild",
+                                                                   run_index))
+        create_backup_copies(target_folder, "archive", ".tar", num_copies, end_time, timedelta(days=1))
+        if with_catalog:
+            CopyCatalog(target_folder, "archive", ".tar").save()
+        return target_folder
+
+    timings = {}
+    details = {'copies': num_copies, 'retention_policy': str(BENCHMARK_RETENTION_POLICY)}
+    for with_catalog in (False, True):
+        metric_name = "with_catalog" if with_catalog else "rebuild_catalog"
+        wall_times = []
+        for run_index in range(max(repeat, 1)):
+            target_folder = prepare_target_folder(run_index, with_catalog)
+            start_time = time.time()
+            multicopy(src_file, target_folder, 0, reporter=reporter, retention_policy=BENCHMARK_RETENTION_POLICY)
+            wall_times.append(time.time() - start_time)
+            details[metric_name + "_kept_copies"] = len(CopyCatalog(target_folder, "archive", ".tar").entries)
+        timings[metric_name] = min(wall_times)
+
+    catalog = CopyCatalog(prepare_target_folder("retention", True), "archive", ".tar")
+    timings['select_expired'], expired_entries = \
+        _measure_min(lambda: BENCHMARK_RETENTION_POLICY.select_expired(catalog.entries), repeat)
+    details['expired_copies'] = len(expired_entries)
+
+    return {'timings': timings, 'details': details}
+
+
+def benchmark_check_recent_file_exists(work_folder, num_files, repeat=1):
+    """
+    Measures check_recent_file_exists on a folder with num_files hourly backup copies (plus 10% not matching files):
+    scanning the folder and with a warm LatestFileCache.
+
+    :returns: dict with 'timings' (dict: metric name -> seconds) and 'details'
+    """
+    backup_folder = os.path.join(work_folder, "backups")
+    create_backup_copies(backup_folder, "benchmark", ".tar", num_files, datetime.now() - timedelta(hours=1),
+                         timedelta(hours=1))
+    for file_index in range(num_files // 10):
+        open(os.path.join(backup_folder, "other{0:07d}.log".format(file_index)), 'w').close()
+
+    reporter = BenchmarkReporter()
+    pattern = "benchmark_*.tar"
+
+    def check(cache=None):
+        return check_recent_file_exists(backup_folder, pattern, "0 0 * * *", 2, reporter, cache=cache)
+
+    timings = {}
+    timings['scan'], up_to_date = _measure_min(check, repeat)
+
+    cache = LatestFileCache(os.path.join(work_folder, "checker-cache.json"))
+    check(cache)
+    timings['cached'], _ = _measure_min(lambda: check(cache), repeat)
+
+    return {'timings': timings, 'details': {'files': num_files, 'up_to_date': up_to_date}}
+
+
+def run_benchmarks(work_folder, scale, archive_modes, archive_formats, benchmark_names=None, repeat=1,
+                   max_parallel_objects=1, seed=0):
+    """
+    Runs the benchmarks in the given (empty) work folder.
+
+    :param scale: dict of scale parameters (see SCALES)
+    :param archive_modes: archive modes of the backup benchmarks
+    :param archive_formats: archive formats of the backup benchmarks
+    :param benchmark_names: list of the benchmark groups to run ('backup', 'multicopy', 'checker'); None for all
+    :param repeat: number of repetitions of the short benchmarks (the minimum is reported)
+    :returns: dict: benchmark name -> result (dict with 'timings' and 'details')
+    """
+    results = {}
+
+    if benchmark_names is None or 'backup' in benchmark_names:
+        sources_folder = os.path.join(work_folder, "sources")
+        start_time = time.time()
+        source_sizes = create_sources(sources_folder, scale, seed)
+        install_fake_tools(os.path.join(work_folder, "bin"), scale['dump_size'])
+        logging.getLogger('benchmark').info("Sources created in {0:.1f} s.".format(time.time() - start_time))
+
+        for archive_mode in archive_modes:
+            for archive_format in archive_formats:
+                benchmark_name = "backup[{0},{1}]".format(archive_mode, archive_format)
+                logging.getLogger('benchmark').info("Running {0}...".format(benchmark_name))
+                #no brackets in the folder name, the backup configurations folder is globbed
+                backup_work_folder = os.path.join(work_folder, "backup-{0}-{1}".format(archive_mode, archive_format))
+                result = benchmark_backup(backup_work_folder, sources_folder, archive_mode, archive_format,
+                                          max_parallel_objects)
+                result['details']['source_sizes'] = source_sizes
+                results[benchmark_name] = result
+
+    if benchmark_names is None or 'multicopy' in benchmark_names:
+        logging.getLogger('benchmark').info("Running multicopy...")
+        results['multicopy'] = benchmark_multicopy(os.path.join(work_folder, "multicopy"),
+                                                   scale['retention_copies'], repeat)
+
+    if benchmark_names is None or 'checker' in benchmark_names:
+        logging.getLogger('benchmark').info("Running check_recent_file_exists...")
+        results['check_recent_file_exists'] = \
+            benchmark_check_recent_file_exists(os.path.join(work_folder, "checker"), scale['check_files'], repeat)
+
+    return results
@@ -0,0 +1,86 @@
+import os
+import stat
+import sys
+
+__author__ = 'Alexander Pikovsky'
+
+
+#fake mysqldump: writes a reproducible dump of DUMP_SIZE bytes to stdout, ignores all arguments
+FAKE_MYSQLDUMP = '''#!{python}
+import random
+import sys
+
+DUMP_SIZE = {dump_size}
+
+out = getattr(sys.stdout, 'buffer', sys.stdout)
+out.write(b"-- fake mysqldump\\n")
+rng = random.Random(0)
+written = 0
+row = 0
+while written < DUMP_SIZE:
+    rows = []
+    for _ in range(100):
+        rows.append("({{0}},'{{1:032x}}',{{2}})".format(row, rng.getrandbits(128), rng.randint(0, 1000000)))
+        row += 1
+    line = ("INSERT INTO `benchmark` VALUES " + ",".join(rows) + ";\\n").encode('ascii')
+    out.write(line)
+    written += len(line)
+'''
+
+#fake svnadmin: "hotcopy <repository> <target>" copies the repository folder, "dump ..." writes the revision
+#files of the repository (last argument) to stdout
+FAKE_SVNADMIN = '''#!{python}
+import os
+import shutil
+import sys
+
+command = sys.argv[1]
+if command == 'hotcopy':
+    shutil.copytree(sys.argv[2], sys.argv[3])
+elif command == 'dump':
+    out = getattr(sys.stdout, 'buffer', sys.stdout)
+    for dir_path, dir_names, file_names in os.walk(os.path.join(sys.argv[-1], 'db', 'revs')):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            with open(os.path.join(dir_path, file_name), 'rb') as in_file:
+                shutil.copyfileobj(in_file, out)
+else:
+    sys.stderr.write("fake svnadmin: unsupported command '{{0}}'\\n".format(command))
+    sys.exit(1)
+'''
+
+#fake svnlook: "youngest <repository>" prints the number of revision files minus one
+FAKE_SVNLOOK = '''#!{python}
+import os
+import sys
+
+revs_folder = os.path.join(sys.argv[2], 'db', 'revs')
+revisions = sum(len(file_names) for dir_path, dir_names, file_names in os.walk(revs_folder))
+sys.stdout.write("{{0}}\\n".format(max(revisions - 1, 0)))
+'''
+
+
+def _write_script(file_path, content):
+    with open(file_path, 'w') as out_file:
+        out_file.write(content)
+    os.chmod(file_path, os.stat(file_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def install_fake_tools(bin_folder, dump_size):
+    """
+    Creates fake mysqldump, svnadmin and svnlook executables in the given folder and prepends it to PATH, so that
+    the MySQL and Subversion object processors run them instead of the real tools. The fake mysqldump writes a
+    reproducible dump of dump_size bytes, the fake svnadmin works on folders created by
+    synthetic_data.create_svn_repository(). Returns the previous PATH.
+    """
+    if not os.path.isdir(bin_folder):
+        os.makedirs(bin_folder)
+
+    _write_script(os.path.join(bin_folder, 'mysqldump'), FAKE_MYSQLDUMP.format(python=sys.executable,
+                                                                              dump_size=dump_size))
+    _write_script(os.path.join(bin_folder, 'svnadmin'), FAKE_SVNADMIN.format(python=sys.executable))
+    _write_script(os.path.join(bin_folder, 'svnlook'), FAKE_SVNLOOK.format(python=sys.executable))
+
+    previous_path = os.environ.get('PATH', '')
+    os.environ['PATH'] = bin_folder + os.pathsep + previous_path
+    return previous_path
@@ -0,0 +1,156 @@
+from datetime import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+
+__author__ = 'Alexander Pikovsky'
+
+
+#version of the results file format
+RESULTS_FORMAT_VERSION = 1
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+#timings shorter than this (in seconds) are not reported as regressions, they are dominated by noise
+MIN_COMPARED_TIME = 0.05
+
+
+def _get_git_revision():
+    """Returns the git revision of the working copy (with a '+' suffix if modified), None if unknown."""
+    repository_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        with open(os.devnull, 'w') as null_file:
+            revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=repository_folder,
+                                               stderr=null_file).decode('ascii').strip()
+            modified = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                               cwd=repository_folder, stderr=null_file).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return revision + ("+" if modified else "")
+
+
+def get_environment():
+    """Returns a dict describing the environment the benchmarks are run in."""
+    return {'git_revision': _get_git_revision(), 'python': sys.version.split()[0],
+            'platform': platform.platform(), 'cpus': multiprocessing.cpu_count()}
+
+
+def create_results(benchmark_results, scale_name, scale, label=None):
+    """Returns the results document (saved as JSON) of the given benchmark results."""
+    return {'format_version': RESULTS_FORMAT_VERSION, 'label': label,
+            'time': datetime.now().strftime(TIMESTAMP_FORMAT), 'environment': get_environment(),
+            'scale': scale_name, 'parameters': scale, 'benchmarks': benchmark_results}
+
+
+def save_results(file_path, results):
+    folder = os.path.dirname(os.path.abspath(file_path))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    with open(file_path, 'w') as out_file:
+        json.dump(results, out_file, indent=1, sort_keys=True)
+
+
+def load_results(file_path):
+    with open(file_path, 'r') as in_file:
+        results = json.load(in_file)
+
+    if results.get('format_version') != RESULTS_FORMAT_VERSION:
+        raise ValueError("Unsupported benchmark results format {0} in '{1}'."
+                         .format(results.get('format_version'), file_path))
+    return results
+
+
+class TimingComparison(object):
+    """Comparison of a single timing of two benchmark results."""
+
+    def __init__(self, benchmark_name, metric_name, baseline_time, current_time, threshold):
+        self.benchmark_name = benchmark_name
+        self.metric_name = metric_name
+        self.baseline_time = baseline_time   # seconds; None if not measured in the baseline
+        self.current_time = current_time   # seconds; None if not measured in the current results
+        self.threshold = threshold   # relative change reported as regression or improvement
+
+    @property
+    def ratio(self):
+        if self.baseline_time is None or self.current_time is None or self.baseline_time <= 0:
+            return None
+        return self.current_time / self.baseline_time
+
+    @property
+    def significant(self):
+        return self.ratio is not None and max(self.baseline_time, self.current_time) >= MIN_COMPARED_TIME
+
+    @property
+    def regression(self):
+        return self.significant and self.ratio > 1 + self.threshold
+
+    @property
+    def improvement(self):
+        return self.significant and self.ratio < 1 - self.threshold
+
+    def __str__(self):
+        def format_time(value):
+            return "{0:10.3f}".format(value) if value is not None else "{0:>10}".format("-")
+
+        if self.regression:
+            status = "REGRESSION"
+        elif self.improvement:
+            status = "improved"
+        else:
+            status = ""
+        ratio = "{0:7.2f}x".format(self.ratio) if self.ratio is not None else "{0:>8}".format("-")
+        return "{0:<60} {1} {2} {3}  {4}".format(self.benchmark_name + " " + self.metric_name,
+                                                 format_time(self.baseline_time), format_time(self.current_time),
+                                                 ratio, status)
+
+
+def compare_results(baseline_results, current_results, threshold=0.1):
+    """
+    Compares the timings of the benchmarks of two results documents.
+
+    :param threshold: relative change of a timing reported as regression (slower) or improvement (faster)
+    :returns: list of TimingComparison objects sorted by benchmark and metric name
+    """
+    comparisons = []
+    baseline_benchmarks = baseline_results['benchmarks']
+    current_benchmarks = current_results['benchmarks']
+    for benchmark_name in sorted(set(baseline_benchmarks) | set(current_benchmarks)):
+        baseline_timings = baseline_benchmarks.get(benchmark_name, {}).get('timings', {})
+        current_timings = current_benchmarks.get(benchmark_name, {}).get('timings', {})
+        for metric_name in sorted(set(baseline_timings) | set(current_timings)):
+            comparisons.append(TimingComparison(benchmark_name, metric_name, baseline_timings.get(metric_name),
+                                                current_timings.get(metric_name), threshold))
+
+    return comparisons
+
+
+def format_results(results):
+    """Returns the timings of the given results document as text."""
+    lines = []
+    for benchmark_name in sorted(results['benchmarks']):
+        for metric_name, value in sorted(results['benchmarks'][benchmark_name]['timings'].items()):
+            lines.append("{0:<60} {1:10.3f}".format(benchmark_name + " " + metric_name, value))
+    return "\n".join(lines)
+
+
+def format_comparison(baseline_results, current_results, comparisons):
+    """Returns the given comparisons (see compare_results()) as text."""
+    def describe(results):
+        environment = results['environment']
+        return "{0} (revision {1}, {2}, python {3})".format(results['label'] or results['time'],
+                                                             environment['git_revision'], results['scale'],
+                                                             environment['python'])
+
+    lines = ["Baseline: " + describe(baseline_results), "Current:  " + describe(current_results), ""]
+    if baseline_results['scale'] != current_results['scale'] or \
+            baseline_results['parameters'] != current_results['parameters']:
+        lines.extend(["WARNING: the results were measured with different parameters.", ""])
+
+    lines.append("{0:<60} {1:>10} {2:>10} {3:>8}".format("benchmark", "baseline", "current", "ratio"))
+    lines.extend(str(comparison) for comparison in comparisons)
+    return "\n".join(lines)
@@ -0,0 +1,99 @@
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+
+from .benchmarks import SCALES, run_benchmarks
+from .results import create_results, save_results, load_results, compare_results, format_results, \
+    format_comparison
+
+__author__ = 'Alexander Pikovsky'
+
+
+BENCHMARK_NAMES = ('backup', 'multicopy', 'checker')
+
+
+def _split_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def benchmark_main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='ap-backup benchmarks.')
+
+    parser.add_argument('-s', '--scale', choices=sorted(SCALES), default='small',
+                        help="size of the synthetic data, default is 'small'")
+
+    parser.add_argument('-b', '--benchmark', choices=BENCHMARK_NAMES, action='append', default=None,
+                        help="runs only the given benchmark (can be repeated); default is all")
+
+    parser.add_argument('--archive-modes', type=_split_list, metavar='MODES', default=['staged', 'streaming'],
+                        help="comma separated archive modes of the backup benchmarks, default is 'staged,streaming'")
+
+    parser.add_argument('--archive-formats', type=_split_list, metavar='FORMATS', default=['zip', 'tar'],
+                        help="comma separated archive formats of the backup benchmarks, default is 'zip,tar' "
+                             "(tar.gz and tar.zst require the compressors to be installed)")
+
+    parser.add_argument('--max-parallel-objects', type=int, metavar='N', default=1,
+                        help="max_parallel_objects of the backup benchmarks, default is 1")
+
+    parser.add_argument('-r', '--repeat', type=int, metavar='N', default=3,
+                        help="repetitions of the multicopy and checker benchmarks (the fastest is reported), "
+                             "default is 3")
+
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic data, default is 0")
+
+    parser.add_argument('-w', '--work-dir', type=str, metavar='FOLDER', default=None,
+                        help="empty or non-existent folder for the synthetic data (should be on the file system to "
+                             "benchmark); default is a temporary folder, which is deleted afterwards")
+
+    parser.add_argument('-o', '--output', type=str, metavar='FILE', default=None,
+                        help="writes the results to the given JSON file")
+
+    parser.add_argument('-l', '--label', type=str, default=None,
+                        help="label of the results (e.g. the version), stored in the results file")
+
+    parser.add_argument('-c', '--compare', type=str, metavar='FILE', default=None,
+                        help="compares the results with the given results file (baseline)")
+
+    parser.add_argument('--current', type=str, metavar='FILE', default=None,
+                        help="with --compare: compares the given results file instead of running the benchmarks")
+
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help="relative change of a timing reported as regression, default is 0.1 (10%%)")
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.current:
+        if not args.compare:
+            parser.error("--current requires --compare")
+        results = load_results(args.current)
+    else:
+        work_dir = args.work_dir or tempfile.mkdtemp(prefix='ap-backup-benchmark-')
+        try:
+            benchmark_results = run_benchmarks(work_dir, SCALES[args.scale], args.archive_modes,
+                                               args.archive_formats, args.benchmark, args.repeat,
+                                               args.max_parallel_objects, args.seed)
+        finally:
+            if not args.work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        results = create_results(benchmark_results, args.scale, SCALES[args.scale], args.label)
+        if args.output:
+            save_results(args.output, results)
+            print("Results written to '{0}'.".format(args.output))
+
+    if args.compare:
+        baseline_results = load_results(args.compare)
+        comparisons = compare_results(baseline_results, results, args.threshold)
+        print(format_comparison(baseline_results, results, comparisons))
+        if any(comparison.regression for comparison in comparisons):
+            sys.exit(1)
+    else:
+        print(format_results(results))
+
+
+if __name__ == "__main__":
+    benchmark_main()
@@ -0,0 +1,136 @@
+import binascii
+import hashlib
+import os
+import random
+import time
+
+__author__ = 'Alexander Pikovsky'
+
+
+#words the compressible file content is made of
+WORDS = ("backup", "archive", "destination", "schedule", "folder", "file", "copy", "database", "table", "revision",
+         "repository", "checksum", "manifest", "catalog", "retention", "daily", "weekly", "monthly", "lorem",
+         "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor")
+
+#words by byte value, used to turn random bytes into text
+WORD_BY_BYTE = [WORDS[byte % len(WORDS)].encode('ascii') for byte in range(256)]
+
+#size of the blocks large files are generated in
+BLOCK_SIZE = 1024 * 1024
+
+
+def create_random(seed):
+    """Returns a random.Random seeded reproducibly (independent of string hash randomization) by the given seed."""
+    return random.Random(int(hashlib.md5(str(seed).encode('utf-8')).hexdigest(), 16))
+
+
+def random_bytes(rng, size):
+    """Returns size random (incompressible) bytes generated by the given random.Random."""
+    if size <= 0:
+        return b""
+    return binascii.unhexlify('{0:0{1}x}'.format(rng.getrandbits(size * 8), size * 2))
+
+
+def text_bytes(rng, size):
+    """Returns size bytes of random text made of WORDS (compresses like source code or logs)."""
+    text = b""
+    while len(text) < size:
+        #words are at least 2 characters long (plus separator), so size // 3 + 1 words are enough
+        text += b" ".join(WORD_BY_BYTE[byte] for byte in bytearray(random_bytes(rng, size // 3 + 1))) + b"\n"
+    return text[:size]
+
+
+def write_file(file_path, size, seed, compressible=True):
+    """
+    Writes a file with reproducible content: the same size and seed always produce the same file. Compressible
+    files contain random text, incompressible files random bytes. Large files are written block by block, every
+    block is generated from its own seed, so that the file does not repeat (and cannot be deduplicated by
+    compressors with a large window).
+    """
+    generate = text_bytes if compressible else random_bytes
+    with open(file_path, 'wb') as out_file:
+        block_index = 0
+        while block_index * BLOCK_SIZE < size:
+            rng = create_random("{0}:{1}".format(seed, block_index))
+            out_file.write(generate(rng, min(BLOCK_SIZE, size - block_index * BLOCK_SIZE)))
+            block_index += 1
+
+
+def create_small_files_tree(folder, num_files, mean_file_size, seed, files_per_folder=100):
+    """
+    Creates a tree of num_files compressible files (like a source code checkout) with sizes distributed
+    exponentially around mean_file_size, files_per_folder files per folder. Returns the total size in bytes.
+    """
+    rng = create_random(seed)
+    total_size = 0
+    for file_index in range(num_files):
+        folder_index = file_index // files_per_folder
+        sub_folder = os.path.join(folder, "d{0:03d}".format(folder_index // 100), "d{0:05d}".format(folder_index))
+        if file_index % files_per_folder == 0 and not os.path.isdir(sub_folder):
+            os.makedirs(sub_folder)
+
+        size = int(rng.expovariate(1.0 / mean_file_size)) if mean_file_size else 0
+        write_file(os.path.join(sub_folder, "f{0:07d}.txt".format(file_index)), size,
+                   "{0}:{1}".format(seed, file_index))
+        total_size += size
+
+    return total_size
+
+
+def create_large_files_tree(folder, num_files, file_size, seed, compressible=True):
+    """Creates a folder with num_files files of file_size bytes each. Returns the total size in bytes."""
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    for file_index in range(num_files):
+        write_file(os.path.join(folder, "large{0:03d}.bin".format(file_index)), file_size,
+                   "{0}:{1}".format(seed, file_index), compressible)
+
+    return num_files * file_size
+
+
+def create_svn_repository(folder, num_revisions, mean_revision_size, seed):
+    """
+    Creates a folder looking like a Subversion FSFS repository (format file, db/revs/<shard>/<revision>) for the
+    fake svnadmin and svnlook (see fake_tools). Returns the total size in bytes.
+    """
+    rng = create_random(seed)
+    os.makedirs(os.path.join(folder, "db", "revs"))
+    with open(os.path.join(folder, "format"), 'w') as out_file:
+        out_file.write("5\n")
+
+    total_size = 0
+    for revision in range(num_revisions):
+        shard_folder = os.path.join(folder, "db", "revs", str(revision // 1000))
+        if revision % 1000 == 0:
+            os.makedirs(shard_folder)
+        size = int(rng.expovariate(1.0 / mean_revision_size))
+        write_file(os.path.join(shard_folder, str(revision)), size, "{0}:{1}".format(seed, revision))
+        total_size += size
+
+    return total_size
+
+
+def create_backup_copies(folder, base_name, extension, num_copies, end_time, interval, copy_size=0):
+    """
+    Creates num_copies backup copies <base_name>_<date>_<time><extension> (as created by multicopy) in the given
+    folder, the newest at end_time and the older ones every interval (timedelta) before. The modification time of
+    every copy is set to its copy time. Returns the list of the created file paths (oldest first).
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    file_paths = []
+    content = b"x" * copy_size
+    for copy_index in range(num_copies - 1, -1, -1):
+        copy_time = end_time - interval * copy_index
+        file_path = os.path.join(folder, "{0}_{1}{2}".format(base_name, copy_time.strftime("%Y-%m-%d_%H-%M"),
+                                                             extension))
+        with open(file_path, 'wb') as out_file:
+            out_file.write(content)
+        timestamp = time.mktime(copy_time.timetuple())
+        os.utime(file_path, (timestamp, timestamp))
+        file_paths.append(file_path)
+
+    return file_paths
+
@@ -1,11 +1,25 @@
 import sys
 import unittest
 
+import test_backup_processor
+import test_check_processor
 import test_config
+import test_manifest
+import test_metrics
+import test_multicopy
+import test_profiling
+import test_throttle
 
 
 def suite():
-    suites = ( test_config.suite(),
+    suites = ( test_backup_processor.suite(),
+               test_check_processor.suite(),
+               test_config.suite(),
+               test_manifest.suite(),
+               test_metrics.suite(),
+               test_multicopy.suite(),
+               test_profiling.suite(),
+               test_throttle.suite(),
              )
     return unittest.TestSuite(suites)
 
@@ -0,0 +1,30 @@
+import sys
+import unittest
+
+import test_archive_writer
+import test_backup_object_processors
+import test_backup_processor
+import test_backup_runner
+import test_backup_scheduler
+import test_compressors
+import test_mysql_parallel_dump
+import test_object_processor_pool
+import test_status_store
+
+
+def suite():
+    suites = ( test_archive_writer.suite(),
+               test_backup_object_processors.suite(),
+               test_backup_processor.suite(),
+               test_backup_runner.suite(),
+               test_backup_scheduler.suite(),
+               test_compressors.suite(),
+               test_mysql_parallel_dump.suite(),
+               test_object_processor_pool.suite(),
+               test_status_store.suite(),
+             )
+    return unittest.TestSuite(suites)
+
+if __name__ == '__main__':
+    result = unittest.TextTestRunner(verbosity=2).run(suite())
+    sys.exit(0 if result.wasSuccessful() else 100)
@@ -0,0 +1,113 @@
+from datetime import datetime
+import os
+import yaml
+
+from ap_backup.backup_processor.backup_status import BackupStatus
+from ap_backup.backup_processor.status_store import StatusStore
+from ap_backup.config import AppConfig
+
+__author__ = 'Alexander Pikovsky'
+
+
+APP_CONFIG = """backup_configs_folders:
+   - backup-configs
+status_db_file: status.db
+"""
+
+
+class Reporter(object):
+    """Reporter (see ap_backup.reporter.Reporter) collecting the reported messages."""
+
+    def __init__(self):
+        self.infos = []
+        self.errors = []
+
+    def reporter(self, logger_name=None):
+        return self
+
+    def debug(self, message, **kwargs):
+        pass
+
+    def info(self, message, **kwargs):
+        self.infos.append(message)
+
+    def error(self, message, **kwargs):
+        self.errors.append(message)
+
+    def critical(self, message, **kwargs):
+        self.errors.append(message)
+
+
+def get_config_folder(work_folder):
+    return os.path.join(work_folder, "config")
+
+
+def get_data_folder(work_folder, backup_name):
+    return os.path.join(work_folder, "data", backup_name)
+
+
+def get_destination_folder(work_folder, backup_name, destination_name="local"):
+    return os.path.join(work_folder, "destinations", backup_name, destination_name)
+
+
+def write_backup_config(work_folder, backup_name, objects, destinations=None, **options):
+    """
+    Writes the backup configuration of the given name into the config folder of the given work folder (the app
+    config is created if it does not exist).
+
+    :param objects: list of backup object sections (dicts)
+    :param destinations: list of destination sections (dicts); None for a daily destination "local"
+    :param options: other settings of the backup config
+    """
+    backup_configs_folder = os.path.join(get_config_folder(work_folder), "backup-configs")
+    if not os.path.isdir(backup_configs_folder):
+        os.makedirs(backup_configs_folder)
+        with open(os.path.join(get_config_folder(work_folder), "config.yaml"), 'w') as out_file:
+            out_file.write(APP_CONFIG)
+
+    if destinations is None:
+        destinations = [{'name': "local", 'folder': get_destination_folder(work_folder, backup_name),
+                         'num_copies': 2, 'schedule': "0 0 * * *"}]
+
+    config = {'backup_type': "archive", 'data_folder': get_data_folder(work_folder, backup_name),
+              'destinations': destinations, 'objects': objects}
+    config.update(options)
+    with open(os.path.join(backup_configs_folder, backup_name + ".yaml"), 'w') as out_file:
+        out_file.write(yaml.safe_dump(config, default_flow_style=False))
+
+
+def load_app_config(work_folder):
+    return AppConfig(os.path.join(get_config_folder(work_folder), "config.yaml"))
+
+
+def expire_destinations(app_config, backup_name, backup_time=datetime(2000, 1, 1)):
+    """Sets the last successful backup time of all destinations of the given backup, so that they are updated by
+       the next run."""
+    status_store = StatusStore(app_config.status_db_file)
+    try:
+        backup_status = BackupStatus(backup_name, status_store)
+        for destination_status in backup_status.destination_statuses.values():
+            destination_status.last_successful_backup_time = backup_time
+        backup_status.save()
+    finally:
+        status_store.close()
+
+
+def set_object_states(app_config, backup_name, destination_name, object_states):
+    """Records the given object states (dict of target subfolder -> state) for the given destination."""
+    status_store = StatusStore(app_config.status_db_file)
+    try:
+        backup_status = BackupStatus(backup_name, status_store)
+        backup_status.get_or_create_destination_status(destination_name).object_states = object_states
+        backup_status.save()
+    finally:
+        status_store.close()
+
+
+def get_object_states(app_config, backup_name, destination_name):
+    """Returns the object states recorded for the given destination."""
+    status_store = StatusStore(app_config.status_db_file)
+    try:
+        return BackupStatus(backup_name, status_store).get_or_create_destination_status(destination_name).object_states
+    finally:
+        status_store.close()
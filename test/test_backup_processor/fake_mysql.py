@@ -0,0 +1,88 @@
+import os
+import stat
+import sys
+
+__author__ = 'Alexander Pikovsky'
+
+
+#name and tables of the fake database
+FAKE_DATABASE = "db"
+FAKE_TABLES = ["articles", "comments", "users"]
+
+#fake mysqldump: "[options] <database> [tables]" dumps the given tables (all FAKE_TABLES by default) in the format
+#of mysqldump (other databases fail), --no-data dumps the schema only, --skip-comments and --compact omit the
+#comments (including the table data markers). The arguments of every call are appended to mysqldump.calls.
+FAKE_MYSQLDUMP = '''#!{python}
+import os
+import sys
+
+with open(os.path.join({folder!r}, "mysqldump.calls"), 'a') as calls_file:
+    calls_file.write(" ".join(sys.argv[1:]) + "\\n")
+
+options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+names = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+if names[0] != {database!r}:
+    sys.stderr.write("mysqldump: Got error: 1049: Unknown database '{{0}}'\\n".format(names[0]))
+    sys.exit(2)
+tables = names[1:] or {tables!r}
+comments = '--skip-comments' not in options and '--compact' not in options
+
+out = getattr(sys.stdout, 'buffer', sys.stdout)
+if comments:
+    out.write(b"-- MySQL dump 10.13\\n--\\n-- Host: localhost    Database: " + names[0].encode('ascii') + b"\\n")
+out.write(b"/*!40101 SET NAMES utf8 */;\\n")
+for table in tables:
+    if '--no-data' in options:
+        out.write("CREATE TABLE `{{0}}` (`id` int);\\n".format(table).encode('ascii'))
+        continue
+    if comments:
+        out.write("--\\n-- Dumping data for table `{{0}}`\\n--\\n\\n".format(table).encode('ascii'))
+    for row in range(3):
+        out.write("INSERT INTO `{{0}}` VALUES ({{1}},'{{0}} row {{1}}');\\n".format(table, row).encode('ascii'))
+'''
+
+#fake mysql client: "-e <query>" prints the FAKE_TABLES with their sizes (the table size query of the parallel
+#dump), without -e it reads statements from stdin and answers "SELECT 'locked';" (the global read lock)
+FAKE_MYSQL = '''#!{python}
+import sys
+
+if '-e' in sys.argv:
+    for index, table in enumerate({tables!r}):
+        sys.stdout.write("{{0}}\\t{{1}}\\n".format(table, (index + 1) * 1000))
+    sys.exit(0)
+
+for line in iter(sys.stdin.readline, ''):
+    if line.strip() == "SELECT 'locked';":
+        sys.stdout.write("locked\\n")
+        sys.stdout.flush()
+'''
+
+
+def _write_script(file_path, content):
+    with open(file_path, 'w') as out_file:
+        out_file.write(content)
+    os.chmod(file_path, os.stat(file_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def install_fake_mysql(bin_folder):
+    """
+    Creates fake mysql and mysqldump executables in the given folder and prepends it to PATH, so that the MySQL
+    object processor runs them instead of the real tools. Returns the previous PATH.
+    """
+    if not os.path.isdir(bin_folder):
+        os.makedirs(bin_folder)
+
+    _write_script(os.path.join(bin_folder, "mysqldump"),
+                  FAKE_MYSQLDUMP.format(python=sys.executable, folder=bin_folder, database=FAKE_DATABASE,
+                                        tables=FAKE_TABLES))
+    _write_script(os.path.join(bin_folder, "mysql"), FAKE_MYSQL.format(python=sys.executable, tables=FAKE_TABLES))
+
+    previous_path = os.environ.get('PATH', '')
+    os.environ['PATH'] = bin_folder + os.pathsep + previous_path
+    return previous_path
+
+
+def get_mysqldump_calls(bin_folder):
+    """Returns the argument lists of the fake mysqldump calls."""
+    with open(os.path.join(bin_folder, "mysqldump.calls")) as in_file:
+        return [line.split() for line in in_file]
@@ -0,0 +1,77 @@
+import os
+import stat
+import sys
+
+__author__ = 'Alexander Pikovsky'
+
+
+#fake svnadmin: "hotcopy <repository> <target>" copies the repository folder, "dump ... -r <from>:<to> <repository>"
+#writes the revision files of the given range to stdout
+FAKE_SVNADMIN = '''#!{python}
+import os
+import shutil
+import sys
+
+command = sys.argv[1]
+if command == 'hotcopy':
+    shutil.copytree(sys.argv[2], sys.argv[3])
+elif command == 'dump':
+    from_revision, to_revision = [int(revision) for revision in sys.argv[sys.argv.index('-r') + 1].split(':')]
+    out = getattr(sys.stdout, 'buffer', sys.stdout)
+    for revision in range(from_revision, to_revision + 1):
+        with open(os.path.join(sys.argv[-1], 'db', 'revs', str(revision)), 'rb') as in_file:
+            shutil.copyfileobj(in_file, out)
+else:
+    sys.stderr.write("fake svnadmin: unsupported command '{{0}}'\\n".format(command))
+    sys.exit(1)
+'''
+
+#fake svnlook: "youngest <repository>" prints the number of revision files minus one
+FAKE_SVNLOOK = '''#!{python}
+import os
+import sys
+
+revisions = len(os.listdir(os.path.join(sys.argv[2], 'db', 'revs')))
+sys.stdout.write("{{0}}\\n".format(max(revisions - 1, 0)))
+'''
+
+
+def _write_script(file_path, content):
+    with open(file_path, 'w') as out_file:
+        out_file.write(content)
+    os.chmod(file_path, os.stat(file_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def install_fake_svn(bin_folder):
+    """
+    Creates fake svnadmin and svnlook executables in the given folder and prepends it to PATH, so that the
+    Subversion object processor runs them instead of the real tools. Returns the previous PATH.
+    """
+    if not os.path.isdir(bin_folder):
+        os.makedirs(bin_folder)
+
+    _write_script(os.path.join(bin_folder, "svnadmin"), FAKE_SVNADMIN.format(python=sys.executable))
+    _write_script(os.path.join(bin_folder, "svnlook"), FAKE_SVNLOOK.format(python=sys.executable))
+
+    previous_path = os.environ.get('PATH', '')
+    os.environ['PATH'] = bin_folder + os.pathsep + previous_path
+    return previous_path
+
+
+def add_revisions(repository_folder, youngest_revision):
+    """Adds revision files to the fake repository (created if it does not exist) up to the given revision."""
+    revs_folder = os.path.join(repository_folder, "db", "revs")
+    if not os.path.isdir(revs_folder):
+        os.makedirs(revs_folder)
+
+    for revision in range(youngest_revision + 1):
+        file_path = os.path.join(revs_folder, str(revision))
+        if not os.path.exists(file_path):
+            with open(file_path, 'w') as out_file:
+                out_file.write("revision {0}\n".format(revision))
+
+
+def read_dump(file_path):
+    """Returns the revision numbers contained in the given dump of the fake svnadmin."""
+    with open(file_path) as in_file:
+        return [int(line.split()[1]) for line in in_file]
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from ap_backup.backup_processor.archive_writer import create_archive_writer
+
+__author__ = 'Alexander Pikovsky'
+
+
+class _RecordingThrottle(object):
+    """Throttle (see ap_backup.throttle.Throttle) recording the accounted data."""
+
+    def __init__(self):
+        self.read_bytes = 0
+        self.written_bytes = 0
+
+    def read(self, amount):
+        self.read_bytes += amount
+
+    def write(self, amount):
+        self.written_bytes += amount
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_folder = os.path.join(self.tmp_dir, "src")
+        self.files = {
+            "root.txt": b"root file",
+            "a/file1.txt": b"first file" * 1000,
+            "a/b/file2.bin": os.urandom(10000),
+        }
+        for rel_path, content in self.files.items():
+            file_path = os.path.join(self.src_folder, rel_path)
+            if not os.path.isdir(os.path.dirname(file_path)):
+                os.makedirs(os.path.dirname(file_path))
+            with open(file_path, 'wb') as out_file:
+                out_file.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_archive(self, archive_format, file_hash=None, throttle=None):
+        archive_file = os.path.join(self.tmp_dir, "archive." + archive_format)
+        with create_archive_writer(archive_file, archive_format, file_hash=file_hash, throttle=throttle) \
+                as archive_writer:
+            self.assertEqual(archive_writer.add_folder(self.src_folder, "folder"), len(self.files))
+            archive_writer.add_file(os.path.join(self.src_folder, "root.txt"), "single/root.txt")
+        return archive_file
+
+    def _read_tar(self, archive_file):
+        contents = {}
+        with tarfile.open(archive_file, 'r:*') as tar_file:
+            for tar_info in tar_file.getmembers():
+                if tar_info.isreg():
+                    contents[tar_info.name] = tar_file.extractfile(tar_info).read()
+        return contents
+
+    def _expected_contents(self):
+        contents = dict(("folder/" + rel_path, content) for rel_path, content in self.files.items())
+        contents["single/root.txt"] = self.files["root.txt"]
+        return contents
+
+    def test_zip(self):
+        archive_file = self._write_archive('zip')
+        with zipfile.ZipFile(archive_file) as zip_file:
+            contents = dict((name, zip_file.read(name)) for name in zip_file.namelist() if not name.endswith('/'))
+            self.assertIn("folder/a/b/", zip_file.namelist())
+        self.assertEqual(contents, self._expected_contents())
+
+    def test_tar(self):
+        self.assertEqual(self._read_tar(self._write_archive('tar')), self._expected_contents())
+
+    def test_tar_throttled(self):
+        throttle = _RecordingThrottle()
+        archive_file = self._write_archive('tar', throttle=throttle)
+        self.assertEqual(self._read_tar(archive_file), self._expected_contents())
+
+        #the whole stream is accounted, including the end of the archive written on close
+        self.assertEqual(throttle.written_bytes, os.path.getsize(archive_file))
+        self.assertEqual(throttle.read_bytes, sum(len(content) for content in self._expected_contents().values()))
+
+    def test_tar_gz(self):
+        file_hash = hashlib.sha256()
+        archive_file = self._write_archive('tar.gz', file_hash)
+        self.assertEqual(self._read_tar(archive_file), self._expected_contents())
+
+        with open(archive_file, 'rb') as in_file:
+            self.assertEqual(file_hash.hexdigest(), hashlib.sha256(in_file.read()).hexdigest())
+
+    def test_missing_file(self):
+        archive_file = os.path.join(self.tmp_dir, "archive.tar")
+        with create_archive_writer(archive_file, 'tar') as archive_writer:
+            self.assertRaises(EnvironmentError, archive_writer.add_file,
+                              os.path.join(self.src_folder, "missing.txt"), "missing.txt")
+
+    def test_unreadable_folder(self):
+        #folder "a" disappears after the root folder is listed, so it cannot be read by the walk
+        def remove_folder(src_file):
+            shutil.rmtree(os.path.join(self.src_folder, "a"), ignore_errors=True)
+
+        archive_file = os.path.join(self.tmp_dir, "archive.tar")
+        with create_archive_writer(archive_file, 'tar') as archive_writer:
+            with self.assertRaises(shutil.Error) as context:
+                archive_writer.add_folder(self.src_folder, "", file_callback=remove_folder)
+
+        self.assertEqual([error[0] for error in context.exception.args[0]], [os.path.join(self.src_folder, "a")])
+        self.assertEqual(list(self._read_tar(archive_file).keys()), ["root.txt"])
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
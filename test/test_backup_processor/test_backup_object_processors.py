@@ -0,0 +1,311 @@
+from datetime import datetime, timedelta
+import gzip
+import mock
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from ap_backup.backup_processor import backup_object_processors
+from ap_backup.backup_processor.backup_object_processors import BackupObjectFolderProcessor, \
+    BackupObjectMySqlProcessor, BackupObjectSvnProcessor
+from ap_backup.backup_processor.compressors import find_executable
+
+from .backup_configs import Reporter, write_backup_config, load_app_config
+from .fake_mysql import FAKE_DATABASE, install_fake_mysql, get_mysqldump_calls
+from .fake_svn import install_fake_svn, add_revisions, read_dump
+
+__author__ = 'Alexander Pikovsky'
+
+
+class _BackupProcessor(object):
+    """Parent backup processor of the tested object processors (see BackupProcessor)."""
+
+    def __init__(self, data_folder):
+        self.reporter = Reporter()
+        self.last_backup_folder = os.path.join(data_folder, "last_backup")
+        self.prev_backup_folder = os.path.join(data_folder, "prev_backup")
+        self.manifest = None
+        self.throttle = None
+        self.command_prefix = []
+
+        #object states of the updated destinations, see get_destination_object_states()
+        self.object_states = []
+
+    def get_destination_object_states(self, backup_object):
+        return self.object_states
+
+    def next_run(self):
+        """Moves the last_backup folder to prev_backup like BackupProcessor._prepare_folders()."""
+        if os.path.exists(self.prev_backup_folder):
+            shutil.rmtree(self.prev_backup_folder)
+        os.rename(self.last_backup_folder, self.prev_backup_folder)
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_folder = os.path.join(self.tmp_dir, "src")
+        self.backup_processor = _BackupProcessor(os.path.join(self.tmp_dir, "data"))
+        self.bin_folder = os.path.join(self.tmp_dir, "bin")
+        self.previous_path = os.environ.get('PATH', '')
+
+        self._write_src_file("root.txt", "root")
+        self._write_src_file("a/file1.txt", "first")
+        self._write_src_file("a/b/file2.txt", "second")
+
+    def tearDown(self):
+        os.environ['PATH'] = self.previous_path
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_src_file(self, rel_path, content):
+        file_path = os.path.join(self.src_folder, rel_path)
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, 'w') as out_file:
+            out_file.write(content)
+
+    def _create_backup_object(self, object_section):
+        write_backup_config(self.tmp_dir, "backup", [object_section])
+        return load_app_config(self.tmp_dir).backup_configs[0].backup_objects[0]
+
+    def _create_folder_processor(self, **options):
+        object_section = {'type': "folder", 'target_subfolder': "folder", 'src_folder_path': self.src_folder}
+        object_section.update(options)
+        return BackupObjectFolderProcessor(self._create_backup_object(object_section), self.backup_processor)
+
+    def _read_target_file(self, rel_path):
+        with open(os.path.join(self.backup_processor.last_backup_folder, "folder", rel_path)) as in_file:
+            return in_file.read()
+
+    def _remove_folder_on_first_copy(self, rel_path):
+        """Returns the replacement of copy_file_with_stat removing the given source folder before the first copy,
+           so that the folder cannot be read when the walk reaches it."""
+        copy_file_with_stat = backup_object_processors.copy_file_with_stat
+
+        def copy_and_remove(src_file, target_file, throttle=None):
+            shutil.rmtree(os.path.join(self.src_folder, rel_path), ignore_errors=True)
+            return copy_file_with_stat(src_file, target_file, throttle)
+
+        return copy_and_remove
+
+    def test_folder_copy(self):
+        self._create_folder_processor().process()
+        self.assertEqual(self._read_target_file("root.txt"), "root")
+        self.assertEqual(self._read_target_file("a/b/file2.txt"), "second")
+
+    def test_unreadable_folder(self):
+        folder_processor = self._create_folder_processor()
+        with mock.patch.object(backup_object_processors, 'copy_file_with_stat',
+                               self._remove_folder_on_first_copy("a")):
+            with self.assertRaises(shutil.Error) as context:
+                folder_processor.process()
+
+        self.assertEqual([error[0] for error in context.exception.args[0]], [os.path.join(self.src_folder, "a")])
+        self.assertEqual(self._read_target_file("root.txt"), "root")
+
+    def _get_inodes(self, folder):
+        return dict((rel_path, os.stat(os.path.join(folder, "folder", rel_path)).st_ino)
+                    for rel_path in ("root.txt", "a/file1.txt", "a/b/file2.txt"))
+
+    def test_incremental(self):
+        self._create_folder_processor(incremental=True).process()
+        self.backup_processor.next_run()
+
+        #changed content and changed modification time (same size) are copied, unchanged files are linked
+        self._write_src_file("a/file1.txt", "changed content")
+        file2 = os.path.join(self.src_folder, "a/b/file2.txt")
+        os.utime(file2, (os.stat(file2).st_atime, os.stat(file2).st_mtime - 10))
+        self._create_folder_processor(incremental=True).process()
+
+        prev_inodes = self._get_inodes(self.backup_processor.prev_backup_folder)
+        last_inodes = self._get_inodes(self.backup_processor.last_backup_folder)
+        self.assertEqual(last_inodes["root.txt"], prev_inodes["root.txt"])
+        self.assertNotEqual(last_inodes["a/file1.txt"], prev_inodes["a/file1.txt"])
+        self.assertNotEqual(last_inodes["a/b/file2.txt"], prev_inodes["a/b/file2.txt"])
+        self.assertEqual(self._read_target_file("a/file1.txt"), "changed content")
+        self.assertTrue(any(info.startswith("Done: 1 files linked from previous backup, 2 files copied")
+                            for info in self.backup_processor.reporter.infos))
+
+    def test_incremental_without_previous_backup(self):
+        self._create_folder_processor(incremental=True).process()
+        self.assertEqual(self._read_target_file("a/file1.txt"), "first")
+        self.assertEqual(os.stat(os.path.join(self.backup_processor.last_backup_folder, "folder", "root.txt"))
+                         .st_nlink, 1)
+
+    def test_not_incremental(self):
+        self._create_folder_processor().process()
+        self.backup_processor.next_run()
+        self._create_folder_processor().process()
+        prev_inodes = self._get_inodes(self.backup_processor.prev_backup_folder)
+        last_inodes = self._get_inodes(self.backup_processor.last_backup_folder)
+        self.assertFalse(set(prev_inodes.values()) & set(last_inodes.values()))
+
+    def test_incremental_unreadable_folder(self):
+        self._create_folder_processor(incremental=True).process()
+        self.backup_processor.next_run()
+
+        folder_processor = self._create_folder_processor(incremental=True)
+        with mock.patch.object(backup_object_processors, 'copy_file_with_stat',
+                               self._remove_folder_on_first_copy("a/b")):
+            self._write_src_file("a/file1.txt", "changed content")
+            with self.assertRaises(shutil.Error) as context:
+                folder_processor.process()
+
+        self.assertEqual([error[0] for error in context.exception.args[0]], [os.path.join(self.src_folder, "a/b")])
+
+    def _process_mysql(self, num_calls=1, **options):
+        """Backs up the fake database with the given options, returns the arguments of the mysqldump call."""
+        install_fake_mysql(self.bin_folder)
+        object_section = {'type': "mysql", 'target_subfolder': "mysql", 'target_file_name': "db.sql",
+                          'database': FAKE_DATABASE, 'user': "user", 'password': "secret"}
+        object_section.update(options)
+        BackupObjectMySqlProcessor(self._create_backup_object(object_section), self.backup_processor).process()
+        calls = get_mysqldump_calls(self.bin_folder)
+        self.assertEqual(len(calls), num_calls)
+        return calls[0]
+
+    def _read_dump(self, file_name, open_function=open):
+        with open_function(os.path.join(self.backup_processor.last_backup_folder, "mysql", file_name), 'rb') \
+                as in_file:
+            return in_file.read()
+
+    def _check_dump(self, dump):
+        self.assertTrue(dump.startswith(b"-- MySQL dump 10.13\n"))
+        for table in (b"articles", b"comments", b"users"):
+            self.assertIn(b"-- Dumping data for table `" + table + b"`\n", dump)
+            self.assertIn(b"INSERT INTO `" + table + b"` VALUES (2,'" + table + b" row 2');\n", dump)
+
+    def test_mysql_dump(self):
+        arguments = self._process_mysql()
+        self.assertEqual(os.listdir(os.path.join(self.backup_processor.last_backup_folder, "mysql")), ["db.sql"])
+        self._check_dump(self._read_dump("db.sql"))
+        self.assertIn(FAKE_DATABASE, arguments)
+        for option in ("--opt", "--lock-tables", "--skip-extended-insert", "--user=user", "--password=secret"):
+            self.assertIn(option, arguments)
+
+    def test_mysql_dump_options(self):
+        arguments = self._process_mysql(single_transaction=True, extended_insert=True)
+        self.assertIn("--single-transaction", arguments)
+        self.assertIn("--skip-lock-tables", arguments)
+        self.assertNotIn("--lock-tables", arguments)
+        self.assertNotIn("--skip-extended-insert", arguments)
+
+    def test_mysql_dump_gzip(self):
+        self._process_mysql(compression="gzip", compression_level=1)
+        self.assertEqual(os.listdir(os.path.join(self.backup_processor.last_backup_folder, "mysql")),
+                         ["db.sql.gz"])
+        self._check_dump(self._read_dump("db.sql.gz", gzip.open))
+
+    def test_mysql_dump_zstd(self):
+        if not find_executable('zstd'):
+            self.skipTest("zstd is not installed")
+
+        self._process_mysql(compression="zstd")
+        dump_file = os.path.join(self.backup_processor.last_backup_folder, "mysql", "db.sql.zst")
+        self._check_dump(subprocess.check_output(['zstd', '-d', '-c', dump_file]))
+
+    def test_mysql_dump_parallel(self):
+        #schema and data of the 3 tables in two workers
+        self._process_mysql(num_calls=3, parallel_workers=2, compression="gzip")
+        self.assertEqual(sorted(os.listdir(os.path.join(self.backup_processor.last_backup_folder, "mysql"))),
+                         ["db-schema.sql.gz", "db.articles.sql.gz", "db.comments.sql.gz", "db.users.sql.gz"])
+        self.assertIn(b"CREATE TABLE `articles`", self._read_dump("db-schema.sql.gz", gzip.open))
+        for table in ("articles", "comments", "users"):
+            dump = self._read_dump("db.{0}.sql.gz".format(table), gzip.open)
+            self.assertIn("INSERT INTO `{0}` VALUES (2,'{0} row 2');\n".format(table).encode('ascii'), dump)
+
+    def test_mysql_dump_failure(self):
+        with self.assertRaises(Exception) as context:
+            self._process_mysql(database="missing")
+        self.assertIn("MySQL backup for database 'missing' failed", str(context.exception))
+        self.assertIn("Unknown database 'missing'", str(context.exception))
+
+    def _create_svn_processor(self, object_states, youngest_revision=3, **options):
+        """Returns the processor of the fake repository, object_states are the states of the updated destinations."""
+        install_fake_svn(self.bin_folder)
+        repository_folder = os.path.join(self.tmp_dir, "repository")
+        add_revisions(repository_folder, youngest_revision)
+        self.backup_processor.object_states = object_states
+
+        object_section = {'type': "svn", 'target_subfolder': "svn", 'repository_folder': repository_folder,
+                          'incremental': True}
+        object_section.update(options)
+        return BackupObjectSvnProcessor(self._create_backup_object(object_section), self.backup_processor)
+
+    def _get_svn_backup_files(self):
+        return sorted(os.listdir(os.path.join(self.backup_processor.last_backup_folder, "svn")))
+
+    def test_svn_full_backup(self):
+        svn_processor = self._create_svn_processor([None])
+        svn_processor.process()
+        self.assertEqual(self._get_svn_backup_files(), ["db"])
+        self.assertEqual(svn_processor.last_revision, 3)
+
+        state = svn_processor.get_destination_state(None)
+        self.assertEqual(state['last_revision'], 3)
+        self.assertLess(datetime.now() - state['last_full_backup_time'], timedelta(minutes=1))
+        self.assertEqual(svn_processor.get_retained_since(state), state['last_full_backup_time'])
+
+    def test_svn_incremental_backup(self):
+        full_backup_time = datetime.now() - timedelta(days=6)
+        previous_state = {'last_revision': 1, 'last_full_backup_time': full_backup_time}
+        svn_processor = self._create_svn_processor([previous_state])
+        svn_processor.process()
+        self.assertEqual(self._get_svn_backup_files(), ["incremental-r2-r3.svndump"])
+        self.assertEqual(read_dump(os.path.join(self.backup_processor.last_backup_folder, "svn",
+                                                "incremental-r2-r3.svndump")), [2, 3])
+
+        #the incremental backup depends on the full backup of the destination
+        state = svn_processor.get_destination_state(previous_state)
+        self.assertEqual(state, {'last_revision': 3, 'last_full_backup_time': full_backup_time})
+        self.assertEqual(svn_processor.get_retained_since(state), full_backup_time)
+
+    def test_svn_incremental_backup_of_destinations(self):
+        #revisions missing in the destination with the oldest revision are dumped
+        full_backup_time = datetime.now() - timedelta(days=1)
+        svn_processor = self._create_svn_processor([{'last_revision': 2, 'last_full_backup_time': full_backup_time},
+                                                    {'last_revision': 0, 'last_full_backup_time': full_backup_time}],
+                                                   youngest_revision=4)
+        svn_processor.process()
+        self.assertEqual(self._get_svn_backup_files(), ["incremental-r1-r4.svndump"])
+
+    def test_svn_full_backup_of_destinations(self):
+        #a destination without state or with a full backup older than full_backup_interval_days gets a full backup
+        recent_state = {'last_revision': 2, 'last_full_backup_time': datetime.now() - timedelta(days=1)}
+        for other_state in (None, {'last_revision': 2, 'last_full_backup_time': datetime.now() - timedelta(days=3)}):
+            svn_processor = self._create_svn_processor([recent_state, other_state], full_backup_interval_days=3)
+            svn_processor.process()
+            self.assertEqual(self._get_svn_backup_files(), ["db"])
+
+            #all updated destinations get the new full backup
+            full_backup_time = svn_processor.get_destination_state(recent_state)['last_full_backup_time']
+            self.assertEqual(svn_processor.get_destination_state(other_state)['last_full_backup_time'],
+                             full_backup_time)
+            self.assertGreater(full_backup_time, recent_state['last_full_backup_time'])
+            shutil.rmtree(self.backup_processor.last_backup_folder)
+
+    def test_svn_no_new_revisions(self):
+        previous_state = {'last_revision': 3, 'last_full_backup_time': datetime.now()}
+        svn_processor = self._create_svn_processor([previous_state])
+        svn_processor.process()
+        self.assertEqual(self._get_svn_backup_files(), [])
+        self.assertEqual(svn_processor.get_destination_state(previous_state)['last_revision'], 3)
+        self.assertIn("No revisions added since the last backup.", self.backup_processor.reporter.infos)
+
+    def test_svn_not_incremental(self):
+        svn_processor = self._create_svn_processor([], incremental=False)
+        self.assertEqual(svn_processor.fingerprint(), "r3")
+        svn_processor.process()
+        self.assertEqual(self._get_svn_backup_files(), ["db"])
+        self.assertIsNone(svn_processor.get_destination_state(None))
+        self.assertIsNone(svn_processor.get_retained_since({'last_revision': 1,
+                                                            'last_full_backup_time': datetime.now()}))
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
@@ -0,0 +1,190 @@
+from datetime import datetime, timedelta
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from ap_backup.backup_processor import BackupProcessor
+
+from .backup_configs import Reporter, get_data_folder, get_destination_folder, write_backup_config, \
+    load_app_config, expire_destinations, set_object_states, get_object_states
+from .fake_svn import install_fake_svn, add_revisions
+
+__author__ = 'Alexander Pikovsky'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_folder = os.path.join(self.tmp_dir, "src")
+        self._write_src_file("root.txt", "root")
+        self._write_src_file("a/file1.txt", "first")
+        self.object_section = {'type': "folder", 'target_subfolder': "folder", 'src_folder_path': self.src_folder}
+        self.destinations = None
+        self.previous_path = None
+
+    def tearDown(self):
+        if self.previous_path is not None:
+            os.environ['PATH'] = self.previous_path
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_src_file(self, rel_path, content):
+        file_path = os.path.join(self.src_folder, rel_path)
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, 'w') as out_file:
+            out_file.write(content)
+
+    def _process(self, **options):
+        """Runs the backup of the source folder, returns the reporter of the run."""
+        write_backup_config(self.tmp_dir, "backup", [self.object_section], self.destinations, **options)
+        app_config = load_app_config(self.tmp_dir)
+        expire_destinations(app_config, "backup")
+        reporter = Reporter()
+        updated_destinations = BackupProcessor(app_config, app_config.backup_configs[0], reporter).process()
+        self.assertEqual(reporter.errors, [])
+        self.assertEqual(updated_destinations, len(self.destinations) if self.destinations else 1)
+        return reporter
+
+    def _get_archive_file(self):
+        return os.path.join(get_data_folder(self.tmp_dir, "backup"), "last_backup.zip")
+
+    def _get_copies(self):
+        return sorted(os.path.basename(copy_path) for copy_path in
+                      glob.glob(os.path.join(get_destination_folder(self.tmp_dir, "backup"), "backup_*.zip")))
+
+    def _read_latest_copy(self):
+        copies = sorted(glob.glob(os.path.join(get_destination_folder(self.tmp_dir, "backup"), "backup_*.zip")))
+        with zipfile.ZipFile(copies[-1]) as zip_file:
+            return dict((name, zip_file.read(name).decode('utf-8')) for name in zip_file.namelist()
+                        if not name.endswith('/'))
+
+    def _is_reused(self, reporter):
+        return any(info.startswith("Sources unchanged since the last backup") for info in reporter.infos)
+
+    def _check_process(self, **options):
+        reporter = self._process(**options)
+        self.assertFalse(self._is_reused(reporter))
+        self.assertEqual(self._read_latest_copy(), {"folder/root.txt": "root", "folder/a/file1.txt": "first"})
+
+        #every run creates the archive again
+        archive_inode = os.stat(self._get_archive_file()).st_ino
+        self._write_src_file("a/file1.txt", "changed")
+        reporter = self._process(**options)
+        self.assertFalse(self._is_reused(reporter))
+        self.assertNotEqual(os.stat(self._get_archive_file()).st_ino, archive_inode)
+        self.assertEqual(self._read_latest_copy(), {"folder/root.txt": "root", "folder/a/file1.txt": "changed"})
+
+    def test_process_staged(self):
+        self._check_process()
+
+    def test_process_streaming(self):
+        self._check_process(archive_mode="streaming")
+
+    def test_process_incremental(self):
+        self.object_section['incremental'] = True
+        self._check_process()
+
+    def test_reuse_unchanged_archive(self):
+        reporter = self._process(reuse_unchanged_archive=True)
+        self.assertFalse(self._is_reused(reporter))
+        archive_stat = os.stat(self._get_archive_file())
+
+        #unchanged sources: the archive is copied again without being recreated
+        reporter = self._process(reuse_unchanged_archive=True)
+        self.assertTrue(self._is_reused(reporter))
+        self.assertEqual(os.stat(self._get_archive_file()).st_ino, archive_stat.st_ino)
+        self.assertEqual(os.stat(self._get_archive_file()).st_mtime, archive_stat.st_mtime)
+        self.assertEqual(self._read_latest_copy(), {"folder/root.txt": "root", "folder/a/file1.txt": "first"})
+
+        #changed source: the archive is recreated
+        self._write_src_file("a/file2.txt", "second")
+        reporter = self._process(reuse_unchanged_archive=True)
+        self.assertFalse(self._is_reused(reporter))
+        self.assertEqual(self._read_latest_copy(), {"folder/root.txt": "root", "folder/a/file1.txt": "first",
+                                                    "folder/a/file2.txt": "second"})
+
+    def test_reuse_unchanged_archive_streaming(self):
+        self._process(reuse_unchanged_archive=True, archive_mode="streaming")
+        self.assertTrue(self._is_reused(self._process(reuse_unchanged_archive=True, archive_mode="streaming")))
+
+        #changed archive settings invalidate the archive
+        self.assertFalse(self._is_reused(self._process(reuse_unchanged_archive=True)))
+
+    def _init_svn_backup(self, destination_names):
+        """Backs up a fake incremental Subversion repository with 4 revisions to destinations keeping 1 copy."""
+        self.previous_path = install_fake_svn(os.path.join(self.tmp_dir, "bin"))
+        repository_folder = os.path.join(self.tmp_dir, "repository")
+        add_revisions(repository_folder, 3)
+        self.object_section = {'type': "svn", 'target_subfolder': "svn", 'repository_folder': repository_folder,
+                               'incremental': True}
+        self.destinations = [{'name': name, 'folder': get_destination_folder(self.tmp_dir, "backup", name),
+                              'num_copies': 1, 'schedule': "0 0 * * *"} for name in destination_names]
+
+        write_backup_config(self.tmp_dir, "backup", [self.object_section], self.destinations)
+        return load_app_config(self.tmp_dir)
+
+    def _create_copy(self, copy_time):
+        """Creates a copy made at the given time in the destination (found by the catalog as an uncataloged copy)."""
+        name = "backup_{0}.zip".format(copy_time.strftime("%Y-%m-%d_%H-%M"))
+        with open(os.path.join(get_destination_folder(self.tmp_dir, "backup"), name), 'w'):
+            pass
+        return name
+
+    def test_svn_incremental_retention(self):
+        app_config = self._init_svn_backup(["local"])
+        os.makedirs(get_destination_folder(self.tmp_dir, "backup"))
+        now = datetime.now()
+        full_backup_time = now - timedelta(days=2)
+        old_copy = self._create_copy(now - timedelta(days=3))
+        full_backup_copy = self._create_copy(full_backup_time + timedelta(minutes=1))
+        incremental_copy = self._create_copy(now - timedelta(days=1))
+        set_object_states(app_config, "backup", "local",
+                          {'svn': {'last_revision': 2, 'last_full_backup_time': full_backup_time}})
+
+        #the full backup and the incremental backups depending on it are kept
+        self._process()
+        self.assertEqual(self._read_latest_copy(), {"svn/incremental-r3-r3.svndump": "revision 3\n"})
+        copies = self._get_copies()
+        self.assertEqual(copies[:2], [full_backup_copy, incremental_copy])
+        self.assertEqual(len(copies), 3)
+        self.assertNotIn(old_copy, copies)
+        self.assertEqual(get_object_states(app_config, "backup", "local"),
+                         {'svn': {'last_revision': 3, 'last_full_backup_time': full_backup_time}})
+
+        #a new full backup releases the previous chain
+        set_object_states(app_config, "backup", "local",
+                          {'svn': {'last_revision': 3, 'last_full_backup_time': now - timedelta(days=8)}})
+        self._process()
+        self.assertEqual(self._get_copies(), copies[2:])
+        self.assertIn("svn/db/revs/3", self._read_latest_copy())
+
+    def test_svn_destination_states(self):
+        app_config = self._init_svn_backup(["local", "remote"])
+        full_backup_time = datetime.now() - timedelta(days=1)
+        set_object_states(app_config, "backup", "local",
+                          {'svn': {'last_revision': 3, 'last_full_backup_time': full_backup_time}})
+
+        #the destination without state needs a full backup, which is recorded for both destinations
+        self._process()
+        local_state = get_object_states(app_config, "backup", "local")['svn']
+        self.assertEqual(get_object_states(app_config, "backup", "remote")['svn'], local_state)
+        self.assertEqual(local_state['last_revision'], 3)
+        self.assertGreater(local_state['last_full_backup_time'], full_backup_time)
+        self.assertIn("svn/db/revs/0", self._read_latest_copy())
+
+        #both destinations are up to date
+        add_revisions(self.object_section['repository_folder'], 4)
+        self._process()
+        self.assertEqual(self._read_latest_copy(), {"svn/incremental-r4-r4.svndump": "revision 4\n"})
+        self.assertEqual(get_object_states(app_config, "backup", "remote")['svn'],
+                         {'last_revision': 4, 'last_full_backup_time': local_state['last_full_backup_time']})
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.backup_processor.backup_runner import group_backup_configs_by_device, run_backups
+
+from .backup_configs import Reporter, write_backup_config, load_app_config
+
+__author__ = 'Alexander Pikovsky'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        src_folder = os.path.join(self.tmp_dir, "src")
+        os.makedirs(src_folder)
+        with open(os.path.join(src_folder, "file.txt"), 'w') as out_file:
+            out_file.write("content")
+
+        #backup-b fails, its source folder does not exist
+        for backup_name, folder_name in (("backup-a", "src"), ("backup-b", "missing"), ("backup-c", "src")):
+            write_backup_config(self.tmp_dir, backup_name,
+                                [{'type': "folder", 'target_subfolder': "folder",
+                                  'src_folder_path': os.path.join(self.tmp_dir, folder_name)}])
+        self.app_config = load_app_config(self.tmp_dir)
+        self.backup_configs = self.app_config.backup_configs
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _summarize(self, results):
+        return [(result.backup_name, result.updated_destinations, result.failed) for result in results]
+
+    def test_parallel_results(self):
+        reporter = Reporter()
+        results = run_backups(self.app_config, self.backup_configs, reporter, jobs=3)
+        self.assertEqual(self._summarize(results),
+                         [("backup-a", 1, False), ("backup-b", 0, True), ("backup-c", 1, False)])
+        self.assertIn("does not exist", results[1].error)
+
+        #second run: updated configs are up-to-date, the failed one is retried
+        results = run_backups(self.app_config, self.backup_configs, reporter, jobs=3)
+        self.assertEqual(self._summarize(results),
+                         [("backup-a", 0, False), ("backup-b", 0, True), ("backup-c", 0, False)])
+
+    def test_parallel_same_as_sequential(self):
+        parallel_results = run_backups(self.app_config, self.backup_configs, Reporter(), jobs=2,
+                                       group_by_device=True)
+        shutil.rmtree(os.path.join(self.tmp_dir, "data"))
+        shutil.rmtree(os.path.join(self.tmp_dir, "destinations"))
+        os.remove(self.app_config.status_db_file)
+        sequential_results = run_backups(self.app_config, self.backup_configs, Reporter(), jobs=1)
+        self.assertEqual(self._summarize(parallel_results), self._summarize(sequential_results))
+
+    def test_group_by_device(self):
+        #backup-a and backup-c read from the same device, backup-b has no existing source
+        self.assertEqual(sorted(group_backup_configs_by_device(self.backup_configs)), [[0, 2], [1]])
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
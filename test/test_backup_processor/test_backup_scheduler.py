@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+import mock
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.backup_processor import backup_scheduler
+from ap_backup.backup_processor.backup_runner import BackupResult
+from ap_backup.backup_processor.backup_scheduler import BackupScheduler, get_next_due_time
+
+from .backup_configs import Reporter, get_config_folder, write_backup_config
+
+__author__ = 'Alexander Pikovsky'
+
+
+class _Destination(object):
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+
+
+class _AsyncResult(object):
+    """AsyncResult (see multiprocessing.pool.AsyncResult) of a run that failed without a result or never completes."""
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def ready(self):
+        return self.error is not None
+
+    def successful(self):
+        return False
+
+    def get(self, timeout=None):
+        raise self.error
+
+
+class _Pool(object):
+    """Pool recording the started runs without running them."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.callbacks = []
+
+    def apply_async(self, func, args, callback=None, error_callback=None):
+        self.callbacks.append(callback)
+        return _AsyncResult(self.error)
+
+
+def _raise_error(*args):
+    raise RuntimeError("backup crashed")
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        write_backup_config(self.tmp_dir, "backup", [])
+        self.reporter = Reporter()
+        self.scheduler = BackupScheduler(os.path.join(get_config_folder(self.tmp_dir), "config.yaml"), self.reporter,
+                                         retry_interval=600, run_timeout=60)
+        self.scheduler._reload_config()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _get_due_times(self):
+        """Returns the current due times of the destinations of the backup."""
+        generation = self.scheduler._generation_by_name["backup"]
+        return [due_time for due_time, sequence, backup_name, entry_generation, destination_name
+                in self.scheduler._due_times if entry_generation == generation]
+
+    def _check_retry(self, error):
+        self.assertNotIn("backup", self.scheduler._running)
+        self.assertEqual(self.reporter.errors, ["Backup backup failed: {0}, retrying in 600 seconds.".format(error)])
+        due_times = self._get_due_times()
+        self.assertEqual(len(due_times), 1)
+        self.assertGreater(due_times[0], datetime.now() + timedelta(seconds=590))
+
+    def test_never_backed_up(self):
+        now = datetime(2016, 1, 2, 10, 0)
+        self.assertEqual(get_next_due_time(_Destination("0 2 * * *"), None, now), now)
+
+    def test_schedule_passed(self):
+        now = datetime(2016, 1, 2, 10, 0)
+        self.assertEqual(get_next_due_time(_Destination("0 2 * * *"), datetime(2016, 1, 1, 2, 5), now), now)
+
+    def test_up_to_date(self):
+        now = datetime(2016, 1, 2, 10, 0)
+        self.assertEqual(get_next_due_time(_Destination("0 2 * * *"), datetime(2016, 1, 2, 2, 5), now),
+                         datetime(2016, 1, 3, 2, 0))
+
+    def test_failed_backup(self):
+        #the worker returns a result carrying the name for any error (the worker is forked with the patches)
+        with mock.patch.object(backup_scheduler, 'run_backup', _raise_error), \
+                mock.patch.object(backup_scheduler, '_worker_reporter', Reporter()):
+            pool = multiprocessing.Pool(1, maxtasksperchild=1)
+            try:
+                self.scheduler._dispatch(pool, "backup")
+                run_id, result = self.scheduler._completed.get(timeout=60)
+            finally:
+                pool.close()
+                pool.join()
+
+        self.assertEqual(result.backup_name, "backup")
+        self.scheduler._handle_result(run_id, result)
+        self._check_retry("backup crashed")
+
+    def test_failed_worker(self):
+        self.scheduler._dispatch(_Pool(RuntimeError("result cannot be pickled")), "backup")
+        self.scheduler._reap_runs(datetime.now())
+        self._check_retry("worker failed: result cannot be pickled")
+
+    def test_lost_worker(self):
+        pool = _Pool()
+        self.scheduler._dispatch(pool, "backup")
+        self.scheduler._reap_runs(datetime.now())
+        self.assertIn("backup", self.scheduler._running)
+
+        self.scheduler._reap_runs(datetime.now() + timedelta(seconds=61))
+        self._check_retry("not completed within 60 seconds, given up (worker process lost?)")
+
+        #a late result of the given up run does not complete the next run
+        self.scheduler._dispatch(pool, "backup")
+        pool.callbacks[0](BackupResult("backup", updated_destinations=1))
+        self.scheduler._handle_result(*self.scheduler._completed.get(timeout=0))
+        self.assertIn("backup", self.scheduler._running)
+
+        pool.callbacks[1](BackupResult("backup", updated_destinations=1))
+        self.scheduler._handle_result(*self.scheduler._completed.get(timeout=0))
+        self.assertNotIn("backup", self.scheduler._running)
+        self.assertIn("Backup backup: 1 destination(s) updated.", self.reporter.infos)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    unittest.main()
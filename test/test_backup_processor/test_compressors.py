@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from ap_backup.backup_processor.archive_writer import create_archive_writer, ZipArchiveWriter, TarArchiveWriter, \
+    TarGzArchiveWriter, TarZstdArchiveWriter
+from ap_backup.backup_processor.compressors import find_executable, open_compressed_output, PipedCompressorOutput, \
+    COMPRESSION_GZIP
+from ap_backup.config.backup_config import BackupConfig
+
+from .backup_configs import get_config_folder, write_backup_config, load_app_config
+
+__author__ = 'Alexander Pikovsky'
+
+
+#fake pigz: gzip-compresses stdin to stdout, records its arguments
+FAKE_PIGZ = '''#!{python}
+import gzip
+import sys
+
+with open({arguments_file!r}, 'w') as out_file:
+    out_file.write(" ".join(sys.argv[1:]))
+out = getattr(sys.stdout, 'buffer', sys.stdout)
+gzip_file = gzip.GzipFile('', 'wb', 9, fileobj=out)
+gzip_file.write(getattr(sys.stdin, 'buffer', sys.stdin).read())
+gzip_file.close()
+'''
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bin_folder = os.path.join(self.tmp_dir, "bin")
+        os.makedirs(self.bin_folder)
+        self.previous_path = os.environ.get('PATH', '')
+        self.content = b"compressed content\n" * 1000
+
+    def tearDown(self):
+        os.environ['PATH'] = self.previous_path
+        shutil.rmtree(self.tmp_dir)
+
+    def _install_fake_pigz(self):
+        file_path = os.path.join(self.bin_folder, "pigz")
+        with open(file_path, 'w') as out_file:
+            out_file.write(FAKE_PIGZ.format(python=sys.executable,
+                                            arguments_file=os.path.join(self.tmp_dir, "pigz-arguments")))
+        os.chmod(file_path, os.stat(file_path).st_mode | stat.S_IXUSR)
+
+    def _write_gzip(self, **kwargs):
+        file_path = os.path.join(self.tmp_dir, "output.gz")
+        out_file = open_compressed_output(file_path, COMPRESSION_GZIP, **kwargs)
+        try:
+            out_file.write(self.content)
+            out_file.flush()
+        finally:
+            out_file.close()
+
+        with gzip.open(file_path, 'rb') as in_file:
+            self.assertEqual(in_file.read(), self.content)
+        return out_file, file_path
+
+    def test_gzip_without_pigz(self):
+        os.environ['PATH'] = self.bin_folder
+        out_file, file_path = self._write_gzip(level=1)
+        self.assertNotIsInstance(out_file, PipedCompressorOutput)
+
+    def test_gzip_without_pigz_hashed(self):
+        os.environ['PATH'] = self.bin_folder
+        file_hash = hashlib.sha256()
+        out_file, file_path = self._write_gzip(file_hash=file_hash)
+        with open(file_path, 'rb') as in_file:
+            self.assertEqual(file_hash.hexdigest(), hashlib.sha256(in_file.read()).hexdigest())
+
+    def test_gzip_with_pigz(self):
+        self._install_fake_pigz()
+        os.environ['PATH'] = self.bin_folder
+        file_hash = hashlib.sha256()
+        out_file, file_path = self._write_gzip(level=3, threads=2, file_hash=file_hash)
+        self.assertIsInstance(out_file, PipedCompressorOutput)
+        with open(os.path.join(self.tmp_dir, "pigz-arguments")) as in_file:
+            self.assertEqual(in_file.read(), "-c -p2 -3")
+        with open(file_path, 'rb') as in_file:
+            self.assertEqual(file_hash.hexdigest(), hashlib.sha256(in_file.read()).hexdigest())
+
+    def test_zstd_requires_executable(self):
+        os.environ['PATH'] = self.bin_folder
+        self.assertRaises(Exception, open_compressed_output, os.path.join(self.tmp_dir, "output.zst"), "zstd")
+
+    def test_archive_writer_classes(self):
+        for archive_format, writer_class in (('zip', ZipArchiveWriter), ('tar', TarArchiveWriter),
+                                             ('tar.gz', TarGzArchiveWriter), ('tar.zst', TarZstdArchiveWriter)):
+            if archive_format == 'tar.zst' and not find_executable('zstd'):
+                continue
+            archive_writer = create_archive_writer(os.path.join(self.tmp_dir, "archive." + archive_format),
+                                                   archive_format)
+            archive_writer.close()
+            self.assertIs(type(archive_writer), writer_class)
+
+        self.assertRaises(Exception, create_archive_writer, os.path.join(self.tmp_dir, "archive.rar"), 'rar')
+
+    def test_archive_format_config(self):
+        write_backup_config(self.tmp_dir, "backup-1", [], archive_format="tar.zst")
+        write_backup_config(self.tmp_dir, "backup-2", [])
+        backup_config_1, backup_config_2 = load_app_config(self.tmp_dir).backup_configs
+        self.assertEqual(backup_config_1.get_archive_extension(), ".tar.zst")
+        self.assertEqual(backup_config_2.archive_format, BackupConfig.DEFAULT_ARCHIVE_FORMAT)
+        self.assertEqual(backup_config_2.get_archive_extension(), ".zip")
+
+        write_backup_config(self.tmp_dir, "backup-3", [], archive_format="rar")
+        self.assertRaises(ValueError, BackupConfig,
+                          os.path.join(get_config_folder(self.tmp_dir), "backup-configs", "backup-3.yaml"))
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
@@ -0,0 +1,135 @@
+import gzip
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.backup_processor import mysql_parallel_dump
+from ap_backup.backup_processor.mysql_parallel_dump import distribute_tables, ParallelMySqlDump, _DumpWorker
+from ap_backup.throttle import Throttle
+
+from .backup_configs import Reporter
+from .fake_mysql import FAKE_DATABASE, FAKE_TABLES, install_fake_mysql, get_mysqldump_calls
+
+__author__ = 'Alexander Pikovsky'
+
+
+#header written by the fake mysqldump before the first table data marker
+DUMP_HEADER = (b"-- MySQL dump 10.13\n--\n-- Host: localhost    Database: db\n/*!40101 SET NAMES utf8 */;\n--\n")
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bin_folder = os.path.join(self.tmp_dir, "bin")
+        self.dump_folder = os.path.join(self.tmp_dir, "dump")
+        os.makedirs(self.dump_folder)
+        self.previous_path = install_fake_mysql(self.bin_folder)
+
+    def tearDown(self):
+        os.environ['PATH'] = self.previous_path
+        shutil.rmtree(self.tmp_dir)
+
+    def _get_table_file_path(self, table_name):
+        return os.path.join(self.dump_folder, "db.{0}.sql".format(table_name))
+
+    def _read_table_file(self, table_name, open_function=open):
+        with open_function(self._get_table_file_path(table_name), 'rb') as in_file:
+            return in_file.read()
+
+    def _run_worker(self, tables, options=(), database=FAKE_DATABASE, compression=None, throttle=None):
+        worker = _DumpWorker(['mysqldump'] + list(options) + [database], tables, self._get_table_file_path,
+                             compression, None, throttle)
+        worker.start()
+        worker.join()
+        self.assertTrue(worker.snapshot_started.is_set())
+        return worker
+
+    def _check_table_dump(self, dump, table_name):
+        self.assertTrue(dump.startswith(DUMP_HEADER + b"-- Dumping data for table `" + table_name.encode('ascii')))
+        for other_table_name in FAKE_TABLES:
+            inserts = "INSERT INTO `{0}`".format(other_table_name).encode('ascii')
+            self.assertEqual(dump.count(inserts), 3 if other_table_name == table_name else 0)
+
+    def test_distribute_tables(self):
+        table_sizes = [("small", 10), ("large", 100), ("medium", 50), ("medium-large", 60)]
+        self.assertEqual(distribute_tables(table_sizes, 2), [["large", "small"], ["medium-large", "medium"]])
+        self.assertEqual(distribute_tables(table_sizes, 1), [["large", "medium-large", "medium", "small"]])
+
+    def test_distribute_tables_more_workers_than_tables(self):
+        self.assertEqual(distribute_tables([("a", 0), ("b", 0)], 4), [["a"], ["b"]])
+        self.assertEqual(distribute_tables([], 4), [])
+
+    def test_worker_split(self):
+        worker = self._run_worker(["articles", "users"])
+        self.assertIsNone(worker.error)
+        self.assertEqual(sorted(os.listdir(self.dump_folder)), ["db.articles.sql", "db.users.sql"])
+        self._check_table_dump(self._read_table_file("articles"), "articles")
+        self._check_table_dump(self._read_table_file("users"), "users")
+
+    def test_worker_split_gzip(self):
+        worker = self._run_worker(["comments"], compression="gzip")
+        self.assertIsNone(worker.error)
+        self.assertEqual(os.listdir(self.dump_folder), ["db.comments.sql"])
+        self._check_table_dump(self._read_table_file("comments", gzip.open), "comments")
+
+    def test_worker_throttled(self):
+        #all written data is accounted, also the tables smaller than the accounting batch
+        throttle = Throttle(write_rate=10 ** 9)
+        with mock.patch.object(throttle, 'write') as write:
+            worker = self._run_worker(["articles", "users"], throttle=throttle)
+        self.assertIsNone(worker.error)
+        self.assertEqual(sum(call[0][0] for call in write.call_args_list),
+                         sum(os.path.getsize(self._get_table_file_path(table_name))
+                             for table_name in ("articles", "users")))
+
+    def test_worker_without_markers(self):
+        worker = self._run_worker(["articles", "users"], options=['--skip-comments'])
+        self.assertIn("no table data marker for tables articles, users", str(worker.error))
+        self.assertEqual(os.listdir(self.dump_folder), [])
+
+    def test_worker_header_limit(self):
+        with mock.patch.object(mysql_parallel_dump, 'MAX_HEADER_SIZE', 100):
+            worker = self._run_worker(["articles"], options=['--compact'])
+        self.assertIn("mysqldump wrote more than 100 bytes without a table data marker", str(worker.error))
+        self.assertEqual(os.listdir(self.dump_folder), [])
+
+    def test_worker_failure(self):
+        worker = self._run_worker(["articles"], database="missing")
+        self.assertIn("mysqldump failed with exit code 2", str(worker.error))
+        self.assertIn("Unknown database 'missing'", str(worker.error))
+
+    def _dump(self, mysqldump_options=()):
+        parallel_dump = ParallelMySqlDump(['mysql'], ['mysqldump'] + list(mysqldump_options), FAKE_DATABASE,
+                                          Reporter())
+        parallel_dump.dump([(table_name, 1000) for table_name in FAKE_TABLES], 2,
+                           os.path.join(self.dump_folder, "db-schema.sql"), self._get_table_file_path)
+
+    def test_parallel_dump(self):
+        self._dump()
+        self.assertEqual(sorted(os.listdir(self.dump_folder)),
+                         ["db-schema.sql", "db.articles.sql", "db.comments.sql", "db.users.sql"])
+        for table_name in FAKE_TABLES:
+            self._check_table_dump(self._read_table_file(table_name), table_name)
+        with open(os.path.join(self.dump_folder, "db-schema.sql"), 'rb') as in_file:
+            self.assertIn(b"CREATE TABLE `users`", in_file.read())
+
+        #two data workers and the schema dump
+        calls = get_mysqldump_calls(self.bin_folder)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sorted(table_name for call in calls if '--no-create-info' in call
+                                for table_name in call[call.index(FAKE_DATABASE) + 1:]), FAKE_TABLES)
+
+    def test_parallel_dump_without_markers(self):
+        with self.assertRaises(Exception) as context:
+            self._dump(['--skip-comments'])
+        self.assertIn("Parallel dump of database 'db' failed", str(context.exception))
+        self.assertIn("no table data marker", str(context.exception))
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
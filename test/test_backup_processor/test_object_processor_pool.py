@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+
+from ap_backup.backup_processor.object_processor_pool import ObjectProcessorPool
+
+__author__ = 'Alexander Pikovsky'
+
+
+class _Reporter(object):
+
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message, **kwargs):
+        self.errors.append(message)
+
+
+class _BackupObject(object):
+
+    def __init__(self, name, object_type, group):
+        self.name = name
+        self.object_type = object_type
+        self.group = group
+
+    def get_concurrency_group(self):
+        return self.group
+
+    def __str__(self):
+        return self.name
+
+
+class _ObjectProcessor(object):
+
+    def __init__(self, name, object_type='folder', group=None):
+        self.backup_object = _BackupObject(name, object_type, group)
+
+
+class _ConcurrencyRecorder(object):
+    """Action recording the maximum number of objects running at the same time, per object group."""
+
+    def __init__(self, duration=0.05):
+        self.duration = duration
+        self.processed = []
+        self.max_running = {}
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, object_processor):
+        key = object_processor.backup_object.group
+        with self._lock:
+            self._running[key] = self._running.get(key, 0) + 1
+            self.max_running[key] = max(self.max_running.get(key, 0), self._running[key])
+        time.sleep(self.duration)
+        with self._lock:
+            self._running[key] -= 1
+            self.processed.append(object_processor.backup_object.name)
+
+
+class Test(unittest.TestCase):
+
+    def test_concurrency_groups(self):
+        object_processors = [_ObjectProcessor("db{0}".format(i), 'mysql', "host1") for i in range(3)] + \
+                            [_ObjectProcessor("db{0}".format(i), 'mysql', "host2") for i in range(3, 6)] + \
+                            [_ObjectProcessor("folder{0}".format(i)) for i in range(3)]
+        recorder = _ConcurrencyRecorder()
+        pool = ObjectProcessorPool(4, {'mysql': 1}, _Reporter())
+        self.assertEqual(pool.run(object_processors, recorder), [])
+
+        self.assertEqual(sorted(recorder.processed),
+                         sorted(object_processor.backup_object.name for object_processor in object_processors))
+        self.assertEqual(recorder.max_running["host1"], 1)
+        self.assertEqual(recorder.max_running["host2"], 1)
+        self.assertGreater(recorder.max_running[None], 1)   # objects without limits run in parallel
+
+    def test_group_limit(self):
+        object_processors = [_ObjectProcessor("db{0}".format(i), 'mysql', "host1") for i in range(6)]
+        recorder = _ConcurrencyRecorder()
+        ObjectProcessorPool(6, {'mysql': 2}, _Reporter()).run(object_processors, recorder)
+        self.assertEqual(recorder.max_running["host1"], 2)
+
+    def test_failures(self):
+        object_processors = [_ObjectProcessor("folder{0}".format(i)) for i in range(5)]
+        processed = []
+
+        def action(object_processor):
+            if object_processor.backup_object.name in ("folder1", "folder3"):
+                raise Exception("{0} failed".format(object_processor.backup_object.name))
+            processed.append(object_processor.backup_object.name)
+
+        reporter = _Reporter()
+        failures = ObjectProcessorPool(2, {}, reporter).run(object_processors, action)
+
+        #failures do not stop the other objects
+        self.assertEqual(sorted(processed), ["folder0", "folder2", "folder4"])
+        self.assertEqual(sorted((object_processor.backup_object.name, str(ex)) for object_processor, ex in failures),
+                         [("folder1", "folder1 failed"), ("folder3", "folder3 failed")])
+        self.assertEqual(len(reporter.errors), 2)
+
+    def test_failure_releases_group(self):
+        object_processors = [_ObjectProcessor("db{0}".format(i), 'mysql', "host1") for i in range(3)]
+
+        def action(object_processor):
+            raise Exception("failed")
+
+        failures = ObjectProcessorPool(3, {'mysql': 1}, _Reporter()).run(object_processors, action)
+        self.assertEqual(len(failures), 3)
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
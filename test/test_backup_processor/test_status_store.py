@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.backup_processor.backup_status import BackupStatus
+from ap_backup.backup_processor.status_store import BackupAttempt, StatusStore
+
+__author__ = 'Alexander Pikovsky'
+
+
+LEGACY_STATUS = """destination_statuses:
+  local:
+    destination_name: local
+    last_backup_attempt_time: 2016-01-02 03:04:05.123456
+    last_backup_result: succeded
+    last_successful_backup_time: 2016-01-02 03:04:05.123456
+source_fingerprint: null
+"""
+
+
+def _open_store(db_file):
+    StatusStore(db_file).close()
+    return True
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = StatusStore(os.path.join(self.tmp_dir, "status.db"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_save_load(self):
+        backup_time = datetime(2016, 1, 2, 3, 4, 5, 123456)
+        status = BackupStatus("backup-1", self.store)
+        status.archive_checksum = "abc"
+        destination_status = status.get_or_create_destination_status("local")
+        destination_status.last_successful_backup_time = backup_time
+        destination_status.object_states['svn'] = {'last_revision': 10, 'last_full_backup_time': backup_time}
+        status.save()
+
+        status = BackupStatus("backup-1", self.store)
+        self.assertEqual(status.archive_checksum, "abc")
+        destination_status = status.destination_statuses["local"]
+        self.assertEqual(destination_status.last_successful_backup_time, backup_time)
+        self.assertEqual(destination_status.object_states['svn']['last_full_backup_time'], backup_time)
+        self.assertEqual([backup_name for backup_name, destination_name, data in self.store.get_destination_statuses()],
+                         ["backup-1"])
+
+    def test_attempts(self):
+        start_time = datetime(2016, 1, 2, 3, 4, 5)
+        self.store.add_attempt(BackupAttempt("backup-1", "local", start_time, start_time + timedelta(seconds=90),
+                                             "succeded", bytes_written=1000))
+        self.store.add_attempt(BackupAttempt("backup-1", "remote", start_time, start_time + timedelta(seconds=1),
+                                             "failed", error="disk full"))
+
+        attempts = self.store.get_attempts(backup_name="backup-1", destination_name="local")
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(attempts[0].duration, 90)
+        self.assertEqual(attempts[0].bytes_written, 1000)
+        self.assertEqual(len(self.store.get_attempts(limit=1)), 1)
+
+    def test_migrate_bstat_file(self):
+        legacy_file = os.path.join(self.tmp_dir, "backup-1.bstat")
+        with open(legacy_file, 'w') as out_file:
+            out_file.write(LEGACY_STATUS)
+
+        status = BackupStatus("backup-1", self.store, legacy_status_dir=self.tmp_dir)
+        self.assertEqual(status.destination_statuses["local"].last_successful_backup_time,
+                         datetime(2016, 1, 2, 3, 4, 5, 123456))
+        self.assertFalse(os.path.exists(legacy_file))
+        self.assertIsNotNone(self.store.load_backup_status("backup-1"))
+
+
+    def test_concurrent_create(self):
+        #processes creating a new database at the same time must not fail
+        for run in range(5):
+            db_file = os.path.join(self.tmp_dir, "concurrent{0}.db".format(run))
+            pool = multiprocessing.Pool(4)
+            try:
+                self.assertEqual(pool.map(_open_store, [db_file] * 8), [True] * 8)
+            finally:
+                pool.close()
+                pool.join()
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    unittest.main()
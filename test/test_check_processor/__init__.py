@@ -0,0 +1,18 @@
+import sys
+import unittest
+
+import test_checker_daemon
+import test_utils
+import test_verification
+
+
+def suite():
+    suites = ( test_utils.suite(),
+               test_checker_daemon.suite(),
+               test_verification.suite(),
+             )
+    return unittest.TestSuite(suites)
+
+if __name__ == '__main__':
+    result = unittest.TextTestRunner(verbosity=2).run(suite())
+    sys.exit(0 if result.wasSuccessful() else 100)
@@ -0,0 +1,119 @@
+from datetime import datetime
+import os
+import select
+import shutil
+import tempfile
+import time
+import unittest
+
+from ap_backup.check_processor import inotify
+from ap_backup.check_processor.checker_daemon import CheckerDaemon, FreshnessWatch
+
+__author__ = 'Alexander Pikovsky'
+
+
+class _Reporter(object):
+
+    def __init__(self):
+        self.errors = []
+        self.infos = []
+
+    def info(self, message, **kwargs):
+        self.infos.append(message)
+
+    def error(self, message, **kwargs):
+        self.errors.append(message)
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_deadline(self):
+        watch = FreshnessWatch("backup", self.tmp_dir, "backup_*.zip", "0 2 * * *", 1)
+        watch.update()
+        self.assertIsNone(watch.get_deadline())
+
+        file_path = os.path.join(self.tmp_dir, "backup_1.zip")
+        open(file_path, 'w').close()
+        mtime = time.mktime(datetime(2020, 1, 10, 2, 5).timetuple())
+        os.utime(file_path, (mtime, mtime))
+        watch.update()
+        #first scheduled time more than one day after the latest file
+        self.assertEqual(watch.get_deadline(), datetime(2020, 1, 12, 2, 0))
+
+    def test_stale_reported_once(self):
+        reporter = _Reporter()
+        daemon = CheckerDaemon([], reporter)
+        watch = FreshnessWatch("backup", self.tmp_dir, "backup_*.zip", "0 2 * * *", 1)
+        daemon._rescan([watch])
+        daemon._rescan([watch])
+        self.assertEqual(len(reporter.errors), 1)
+
+        open(os.path.join(self.tmp_dir, "backup_1.zip"), 'w').close()
+        daemon._rescan([watch])
+        self.assertFalse(watch.stale)
+        self.assertEqual(len(reporter.infos), 1)
+        self.assertEqual(len(daemon._deadlines), 1)
+
+    def test_watched_folders(self):
+        watch = FreshnessWatch("backup", self.tmp_dir, "backup_*.zip", "0 2 * * *", 1)
+        self.assertEqual(watch.get_watched_folders(), [self.tmp_dir])
+
+        watch = FreshnessWatch("backup", self.tmp_dir, os.path.join("sub", "backup_*.zip"), "0 2 * * *", 1)
+        self.assertEqual(watch.get_watched_folders(), [os.path.join(self.tmp_dir, "sub")])
+
+        #existing subfolders matching the wildcards and the folder in which new ones are created
+        for name in ("2020", "2021"):
+            os.makedirs(os.path.join(self.tmp_dir, "sub", name))
+        watch = FreshnessWatch("backup", self.tmp_dir, os.path.join("sub", "*", "backup_*.zip"), "0 2 * * *", 1)
+        self.assertEqual(watch.get_watched_folders(), [os.path.join(self.tmp_dir, "sub"),
+                                                       os.path.join(self.tmp_dir, "sub", "2020"),
+                                                       os.path.join(self.tmp_dir, "sub", "2021")])
+
+    def _handle_events(self, daemon):
+        while select.select([daemon._inotify.fd], [], [], 0.1)[0]:
+            daemon._handle_events(daemon._inotify.read_events())
+
+    @unittest.skipUnless(inotify.is_available(), "inotify is not available")
+    def test_subfolder_pattern_events(self):
+        sub_dir = os.path.join(self.tmp_dir, "sub")
+        os.mkdir(sub_dir)
+        reporter = _Reporter()
+        daemon = CheckerDaemon([], reporter)
+        watch = FreshnessWatch("backup", self.tmp_dir, os.path.join("sub", "backup_*.zip"), "0 2 * * *", 1)
+        wildcard_watch = FreshnessWatch("other", self.tmp_dir, os.path.join("*", "other_*.zip"), "0 2 * * *", 1)
+        daemon.watches = [watch, wildcard_watch]
+        try:
+            daemon._add_folder_watches()
+            daemon._rescan(daemon.watches)
+            self.assertIsNone(watch.latest_file_time)
+
+            #a new file in the subfolder is seen without a rescan of all folders
+            open(os.path.join(sub_dir, "backup_1.zip"), 'w').close()
+            self._handle_events(daemon)
+            self.assertIsNotNone(watch.latest_file_time)
+            self.assertFalse(watch.stale)
+
+            #a new subfolder matching the wildcards is watched as well
+            new_dir = os.path.join(self.tmp_dir, "new")
+            os.mkdir(new_dir)
+            self._handle_events(daemon)
+            self.assertIsNone(wildcard_watch.latest_file_time)
+            open(os.path.join(new_dir, "other_1.zip"), 'w').close()
+            self._handle_events(daemon)
+            self.assertIsNotNone(wildcard_watch.latest_file_time)
+        finally:
+            daemon._inotify.close()
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    unittest.main()
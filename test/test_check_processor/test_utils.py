@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.check_processor.latest_file_cache import LatestFileCache
+from ap_backup.check_processor.utils import find_latest_file_time
+
+__author__ = 'Alexander Pikovsky'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.backup_dir = os.path.join(self.tmp_dir, "backups")
+        os.mkdir(self.backup_dir)
+        for name, mtime in (("backup_1.zip", 1000000000), ("backup_2.zip", 1100000000), ("other.zip", 1200000000),
+                            (".backup_3.zip", 1300000000)):
+            file_path = os.path.join(self.backup_dir, name)
+            open(file_path, 'w').close()
+            os.utime(file_path, (mtime, mtime))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_latest_file_time(self):
+        self.assertEqual(find_latest_file_time(self.backup_dir, "backup_*.zip"), datetime.fromtimestamp(1100000000))
+        self.assertIsNone(find_latest_file_time(self.backup_dir, "missing_*.zip"))
+        self.assertIsNone(find_latest_file_time(os.path.join(self.tmp_dir, "missing"), "backup_*.zip"))
+
+    def test_cache(self):
+        cache_file = os.path.join(self.tmp_dir, "cache.json")
+        cache = LatestFileCache(cache_file)
+        self.assertEqual(find_latest_file_time(self.backup_dir, "backup_*.zip", cache),
+                         datetime.fromtimestamp(1100000000))
+        cache.save()
+
+        #cached value is used while the folder is unchanged
+        cache = LatestFileCache(cache_file)
+        os.utime(os.path.join(self.backup_dir, "backup_1.zip"), (1150000000, 1150000000))
+        self.assertEqual(find_latest_file_time(self.backup_dir, "backup_*.zip", cache),
+                         datetime.fromtimestamp(1100000000))
+
+        #a new file changes the folder modification time
+        new_file = os.path.join(self.backup_dir, "backup_4.zip")
+        open(new_file, 'w').close()
+        os.utime(new_file, (1160000000, 1160000000))
+        os.utime(self.backup_dir, (1170000000, 1170000000))
+        self.assertEqual(find_latest_file_time(self.backup_dir, "backup_*.zip", cache),
+                         datetime.fromtimestamp(1160000000))
+
+    def _add_file(self, folder, name, mtime):
+        file_path = os.path.join(folder, name)
+        open(file_path, 'w').close()
+        os.utime(file_path, (mtime, mtime))
+
+    def test_cache_subfolder_pattern(self):
+        sub_dir = os.path.join(self.backup_dir, "sub")
+        os.mkdir(sub_dir)
+        self._add_file(sub_dir, "backup_1.zip", 1000000000)
+        os.utime(sub_dir, (1010000000, 1010000000))
+        os.utime(self.backup_dir, (1010000000, 1010000000))
+
+        cache = LatestFileCache(os.path.join(self.tmp_dir, "cache.json"))
+        pattern = os.path.join("sub", "backup_*.zip")
+        self.assertEqual(find_latest_file_time(self.backup_dir, pattern, cache), datetime.fromtimestamp(1000000000))
+
+        #a new file in the subfolder changes the subfolder modification time only
+        self._add_file(sub_dir, "backup_2.zip", 1100000000)
+        os.utime(sub_dir, (1110000000, 1110000000))
+        os.utime(self.backup_dir, (1010000000, 1010000000))
+        self.assertEqual(find_latest_file_time(self.backup_dir, pattern, cache), datetime.fromtimestamp(1100000000))
+
+        #a pattern matching several subfolders is not cached
+        other_dir = os.path.join(self.backup_dir, "other")
+        os.mkdir(other_dir)
+        pattern = os.path.join("*", "backup_*.zip")
+        self.assertEqual(find_latest_file_time(self.backup_dir, pattern, cache), datetime.fromtimestamp(1100000000))
+        self._add_file(other_dir, "backup_3.zip", 1200000000)
+        self.assertEqual(find_latest_file_time(self.backup_dir, pattern, cache), datetime.fromtimestamp(1200000000))
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
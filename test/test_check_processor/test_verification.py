@@ -0,0 +1,55 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.check_processor.verification import CopyVerifier, VerificationCache, VERIFIED_RECENTLY
+
+__author__ = 'Alexander Pikovsky'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.copy_file = os.path.join(self.tmp_dir, "backup_2020-01-01.zip")
+        self.content = os.urandom(100000)
+        with open(self.copy_file, 'wb') as out_file:
+            out_file.write(self.content)
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_verify(self):
+        verifier = CopyVerifier(buffer_size=1000)
+        self.assertIs(verifier.verify(self.copy_file, len(self.content), self.checksum), True)
+        self.assertIsNot(verifier.verify(self.copy_file, len(self.content) + 1, self.checksum), True)
+        self.assertIsNot(verifier.verify(self.copy_file, len(self.content), hashlib.sha256(b"").hexdigest()), True)
+
+    def test_cache(self):
+        cache_file = os.path.join(self.tmp_dir, "verify-cache.json")
+        verifier = CopyVerifier(VerificationCache(cache_file), buffer_size=1000)
+        self.assertIs(verifier.verify(self.copy_file, len(self.content), self.checksum), True)
+        verifier.cache.save()
+
+        #unchanged copy is skipped
+        verifier = CopyVerifier(VerificationCache(cache_file), buffer_size=1000)
+        self.assertEqual(verifier.verify(self.copy_file, len(self.content), self.checksum), VERIFIED_RECENTLY)
+
+        #modified copy is verified again
+        os.utime(self.copy_file, (1000000000, 1000000000))
+        self.assertIs(verifier.verify(self.copy_file, len(self.content), self.checksum), True)
+
+        #verification expired
+        verifier = CopyVerifier(VerificationCache(cache_file), max_age_days=0, buffer_size=1000)
+        self.assertIs(verifier.verify(self.copy_file, len(self.content), self.checksum), True)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    unittest.main()
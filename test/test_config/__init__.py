@@ -2,10 +2,12 @@ import sys
 import unittest
 
 import test_config
+import test_config_cache
 
 
 def suite():
     suites = ( test_config.suite(),
+               test_config_cache.suite(),
              )
     return unittest.TestSuite(suites)
 
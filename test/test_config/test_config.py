@@ -20,6 +20,15 @@ class Test(unittest.TestCase):
         config = AppConfig(config_file)
         pass
 
+    def test_archive_config(self):
+        config_file = path.join(self.data_dir, "config.yaml")
+        config = AppConfig(config_file)
+
+        backup_config = [c for c in config.backup_configs if c.name == 'backup-1'][0]
+        self.assertEqual(backup_config.archive_format, 'tar.gz')
+        self.assertEqual(backup_config.get_archive_extension(), '.tar.gz')
+        self.assertEqual(backup_config.compression_level, 5)
+
 if __name__ == "__main__":
     unittest.main()
 
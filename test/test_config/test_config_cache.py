@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.config.config_cache import ConfigCache
+
+__author__ = 'Alexander Pikovsky'
+
+
+class _Config(object):
+
+    def __init__(self, config_file):
+        with open(config_file, 'r') as in_file:
+            self.content = in_file.read()
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmp_dir, "config-cache.pickle")
+        self.config_file = os.path.join(self.tmp_dir, "backup-1.yaml")
+        with open(self.config_file, 'w') as out_file:
+            out_file.write("backup_type: archive\n")
+        self.loaded_files = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _load_config(self, config_file):
+        self.loaded_files.append(config_file)
+        return _Config(config_file)
+
+    def test_cached_config(self):
+        cache = ConfigCache(self.cache_file)
+        self.assertEqual(cache.get_backup_config(self.config_file, self._load_config).content, "backup_type: archive\n")
+        cache.save()
+        self.assertEqual(oct(os.stat(self.cache_file).st_mode & 0o777), oct(0o600))
+
+        #unchanged file is not parsed again
+        cache = ConfigCache(self.cache_file)
+        self.assertEqual(cache.get_backup_config(self.config_file, self._load_config).content, "backup_type: archive\n")
+        self.assertEqual(len(self.loaded_files), 1)
+
+        #changed file is parsed again
+        with open(self.config_file, 'w') as out_file:
+            out_file.write("backup_type: checker\n")
+        self.assertEqual(cache.get_backup_config(self.config_file, self._load_config).content, "backup_type: checker\n")
+        self.assertEqual(len(self.loaded_files), 2)
+
+    def test_damaged_cache(self):
+        with open(self.cache_file, 'w') as out_file:
+            out_file.write("damaged")
+
+        cache = ConfigCache(self.cache_file)
+        self.assertEqual(cache.get_backup_config(self.config_file, self._load_config).content, "backup_type: archive\n")
+
+    def test_folder_files(self):
+        cache = ConfigCache(self.cache_file)
+        self.assertEqual(cache.get_folder_files(self.tmp_dir, lambda folder: [self.config_file]), [self.config_file])
+        self.assertEqual(cache.get_folder_files(self.tmp_dir, lambda folder: []), [self.config_file])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,14 @@
+import sys
+import unittest
+
+import test_manifest
+
+
+def suite():
+    suites = ( test_manifest.suite(),
+             )
+    return unittest.TestSuite(suites)
+
+if __name__ == '__main__':
+    result = unittest.TextTestRunner(verbosity=2).run(suite())
+    sys.exit(0 if result.wasSuccessful() else 100)
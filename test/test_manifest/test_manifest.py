@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.manifest import Manifest, compute_file_hash
+
+__author__ = 'Alexander Pikovsky'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_file = os.path.join(self.tmp_dir, "src.txt")
+        with open(self.src_file, 'w') as out_file:
+            out_file.write("content")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_commit_and_load(self):
+        manifest = Manifest.for_data_folder(self.tmp_dir)
+        manifest.add_file(self.src_file, os.stat(self.src_file))
+        manifest.commit()
+
+        manifest = Manifest.for_data_folder(self.tmp_dir)
+        entry = manifest.get_unchanged_entry(self.src_file, os.stat(self.src_file))
+        self.assertIsNotNone(entry)
+        self.assertEqual(entry.size, 7)
+        self.assertEqual(entry.hash, compute_file_hash(self.src_file))
+
+    def test_changed_file(self):
+        manifest = Manifest.for_data_folder(self.tmp_dir)
+        manifest.add_file(self.src_file, os.stat(self.src_file))
+        manifest.commit()
+
+        with open(self.src_file, 'w') as out_file:
+            out_file.write("changed content")
+        self.assertIsNone(manifest.get_unchanged_entry(self.src_file, os.stat(self.src_file)))
+
+        entry = manifest.add_file(self.src_file, os.stat(self.src_file))
+        self.assertEqual(entry.hash, compute_file_hash(self.src_file))
+
+    def test_damaged_manifest(self):
+        with open(os.path.join(self.tmp_dir, Manifest.FILE_NAME), 'w') as out_file:
+            out_file.write("not a manifest")
+
+        manifest = Manifest.for_data_folder(self.tmp_dir)
+        self.assertEqual(manifest.entries, {})
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
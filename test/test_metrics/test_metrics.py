@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.metrics import RunMetrics, BackupCopyState, export_run_metrics, export_checker_metrics, \
+    format_textfile
+
+__author__ = 'Alexander Pikovsky'
+
+
+class _MetricsConfig(object):
+
+    def __init__(self, tmp_dir):
+        self.metrics_textfile_folder = os.path.join(tmp_dir, "textfile")
+        self.metrics_json_folder = os.path.join(tmp_dir, "json")
+
+
+class _CheckResult(object):
+
+    def __init__(self, backup_name, check_name, up_to_date):
+        self.backup_name = backup_name
+        self.check_name = check_name
+        self.up_to_date = up_to_date
+        self.error = None
+        self.timed_out = False
+
+    @property
+    def failed(self):
+        return not self.up_to_date
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, *path_parts):
+        with open(os.path.join(self.tmp_dir, *path_parts), 'r') as in_file:
+            return in_file.read()
+
+    def test_measure_stage(self):
+        run_metrics = RunMetrics("backup-1")
+        with run_metrics.measure("process_object", "files") as stage_metrics:
+            stage_metrics.files = 3
+            with open(os.path.join(self.tmp_dir, "file.bin"), 'wb') as out_file:
+                out_file.write(b"x" * 1000)
+
+        self.assertEqual(len(run_metrics.stages), 1)
+        self.assertEqual(stage_metrics.object_name, "files")
+        self.assertGreaterEqual(stage_metrics.wall_time, 0)
+        self.assertGreaterEqual(stage_metrics.cpu_time, 0)
+        self.assertFalse(stage_metrics.failed)
+        if stage_metrics.bytes_written is not None:
+            self.assertGreaterEqual(stage_metrics.bytes_written, 1000)
+
+    def test_failed_stage(self):
+        run_metrics = RunMetrics("backup-1")
+        try:
+            with run_metrics.measure("create_archive"):
+                raise ValueError("disk full")
+        except ValueError:
+            pass
+        self.assertTrue(run_metrics.stages[0].failed)
+        self.assertIsNotNone(run_metrics.stages[0].wall_time)
+
+    def test_format_textfile(self):
+        text = format_textfile([('metric_a', "Help.", [({'backup': 'b"1\\'}, 2), ({'backup': 'b2'}, None)]),
+                                ('metric_b', "Skipped.", [({}, None)])])
+        self.assertEqual(text, '# HELP metric_a Help.\n# TYPE metric_a gauge\nmetric_a{backup="b\\"1\\\\"} 2\n')
+
+    def test_export_run_metrics(self):
+        app_config = _MetricsConfig(self.tmp_dir)
+        run_metrics = RunMetrics("backup-1")
+        with run_metrics.measure("create_archive") as stage_metrics:
+            stage_metrics.files = 5
+        run_metrics.archive_size = 1234
+        run_metrics.finish(RunMetrics.RESULT_SUCCEEDED)
+        export_run_metrics(app_config, run_metrics)
+
+        text = self._read("textfile", "ap_backup_run_backup-1.prom")
+        self.assertIn('ap_backup_stage_files{backup="backup-1",object="",stage="create_archive"} 5\n', text)
+        self.assertIn('ap_backup_archive_size_bytes{backup="backup-1"} 1234\n', text)
+        self.assertIn('ap_backup_run_success{backup="backup-1"} 1\n', text)
+
+        json_folder = os.path.join(self.tmp_dir, "json", "runs", "backup-1")
+        json_files = os.listdir(json_folder)
+        self.assertEqual(len(json_files), 1)
+        data = json.loads(self._read("json", "runs", "backup-1", json_files[0]))
+        self.assertEqual(data['result'], RunMetrics.RESULT_SUCCEEDED)
+        self.assertEqual(data['stages'][0]['stage'], "create_archive")
+
+    def test_export_checker_metrics(self):
+        app_config = _MetricsConfig(self.tmp_dir)
+        check_time = datetime.now()
+        backup_states = [BackupCopyState("backup-1", "daily", check_time - timedelta(hours=2), 1000, 3),
+                         BackupCopyState("backup-2", "/backup/folder", None)]
+        results = [_CheckResult("backup-1", "destination 'daily'", True),
+                   _CheckResult("backup-2", "folder", False)]
+        export_checker_metrics(app_config, check_time, 1.5, backup_states, results)
+
+        text = self._read("textfile", "ap_backup_checker.prom")
+        self.assertIn('ap_backup_backup_age_seconds{backup="backup-1",location="daily"} 7200.0\n', text)
+        self.assertIn('ap_backup_backup_size_bytes{backup="backup-1",location="daily"} 1000\n', text)
+        self.assertNotIn('location="/backup/folder"', text)
+        self.assertIn('ap_backup_check_success{backup="backup-1",check="destination \'daily\'"} 1\n', text)
+        self.assertIn('ap_backup_check_success{backup="backup-2",check="folder"} 0\n', text)
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
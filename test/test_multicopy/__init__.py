@@ -0,0 +1,20 @@
+import sys
+import unittest
+
+import test_catalog
+import test_copy_engine
+import test_fanout
+import test_retention
+
+
+def suite():
+    suites = ( test_catalog.suite(),
+               test_copy_engine.suite(),
+               test_fanout.suite(),
+               test_retention.suite(),
+             )
+    return unittest.TestSuite(suites)
+
+if __name__ == '__main__':
+    result = unittest.TextTestRunner(verbosity=2).run(suite())
+    sys.exit(0 if result.wasSuccessful() else 100)
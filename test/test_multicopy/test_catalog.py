@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.multicopy.catalog import CopyCatalog, parse_copy_time
+
+__author__ = 'Alexander Pikovsky'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _create_copy(self, name):
+        file_path = os.path.join(self.tmp_dir, name)
+        with open(file_path, 'w') as out_file:
+            out_file.write(name)
+        return file_path
+
+    def test_parse_copy_time(self):
+        self.assertEqual(parse_copy_time("2016-01-02_10-30"), datetime(2016, 1, 2, 10, 30))
+        self.assertEqual(parse_copy_time("2016-01-02"), datetime(2016, 1, 2))
+        self.assertIsNone(parse_copy_time("backup"))
+        self.assertIsNone(parse_copy_time("backup_2016-01-02"))
+        self.assertIsNone(parse_copy_time("2016-1-2"))
+
+    def test_rebuild(self):
+        self._create_copy("backup_2016-01-03_10-30.tar.gz")
+        self._create_copy("backup_2016-01-02_10-30.tar.gz")
+        self._create_copy("other_2016-01-04_10-30.tar.gz")
+        self._create_copy("backup_other_2016-01-04_10-30.tar.gz")
+        self._create_copy("backup_2016-01-04_10-30.tar.gz.tmp")
+
+        catalog = CopyCatalog(self.tmp_dir, "backup", ".tar.gz")
+        self.assertEqual([entry.name for entry in catalog.entries],
+                         ["backup_2016-01-02_10-30.tar.gz", "backup_2016-01-03_10-30.tar.gz"])
+        self.assertEqual(catalog.get_last_entry().timestamp, datetime(2016, 1, 3, 10, 30))
+
+    def test_save_and_retention(self):
+        catalog = CopyCatalog(self.tmp_dir, "backup", ".zip")
+        for day in range(1, 5):
+            copy_path = self._create_copy("backup_2016-01-0{0}_10-30.zip".format(day))
+            catalog.add_copy(copy_path, datetime(2016, 1, day, 10, 30), checksum="checksum{0}".format(day))
+
+        removed_entries = catalog.remove_old_copies(2)
+        catalog.save()
+
+        self.assertEqual([entry.name for entry in removed_entries],
+                         ["backup_2016-01-01_10-30.zip", "backup_2016-01-02_10-30.zip"])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "backup_2016-01-01_10-30.zip")))
+
+        catalog = CopyCatalog(self.tmp_dir, "backup", ".zip")
+        self.assertEqual(len(catalog.entries), 2)
+        self.assertEqual(catalog.get_last_entry().checksum, "checksum4")
+        self.assertEqual(catalog.get_last_entry().size, len("backup_2016-01-04_10-30.zip"))
+
+    def test_uncataloged_copy(self):
+        catalog = CopyCatalog(self.tmp_dir, "backup", ".zip")
+        copy_path = self._create_copy("backup_2016-01-02_10-30.zip")
+        catalog.add_copy(copy_path, datetime(2016, 1, 2, 10, 30), checksum="checksum2")
+        catalog.save()
+
+        #copy written before a crash, the catalog was not saved
+        self._create_copy("backup_2016-01-01_10-30.zip")
+        catalog_mtime = os.path.getmtime(catalog.file_path)
+        os.utime(self.tmp_dir, (catalog_mtime + 1, catalog_mtime + 1))
+
+        catalog = CopyCatalog(self.tmp_dir, "backup", ".zip")
+        self.assertEqual([(entry.name, entry.checksum) for entry in catalog.entries],
+                         [("backup_2016-01-01_10-30.zip", None), ("backup_2016-01-02_10-30.zip", "checksum2")])
+
+        catalog.remove_old_copies(1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "backup_2016-01-01_10-30.zip")))
+
+    def test_up_to_date_catalog(self):
+        catalog = CopyCatalog(self.tmp_dir, "backup", ".zip")
+        copy_path = self._create_copy("backup_2016-01-02_10-30.zip")
+        catalog.add_copy(copy_path, datetime(2016, 1, 2, 10, 30))
+        catalog.save()
+
+        #the target folder is not listed while unchanged since the catalog was saved
+        folder_stat = os.stat(self.tmp_dir)
+        self._create_copy("backup_2016-01-01_10-30.zip")
+        os.utime(self.tmp_dir, (folder_stat.st_atime, folder_stat.st_mtime))
+
+        catalog = CopyCatalog(self.tmp_dir, "backup", ".zip")
+        self.assertEqual([entry.name for entry in catalog.entries], ["backup_2016-01-02_10-30.zip"])
+
+    def test_other_base_name_copies(self):
+        #copies of a longer base name starting with this one are never taken (and deleted by the retention)
+        self._create_copy("db_prod_2016-01-01_10-30.zip")
+        self._create_copy("db_2016-01-02_10-30.zip")
+
+        catalog = CopyCatalog(self.tmp_dir, "db", ".zip")
+        self.assertEqual([entry.name for entry in catalog.entries], ["db_2016-01-02_10-30.zip"])
+        catalog.remove_old_copies(0)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["db_prod_2016-01-01_10-30.zip"])
+
+    def test_damaged_catalog(self):
+        self._create_copy("backup_2016-01-01_10-30.zip")
+        with open(os.path.join(self.tmp_dir, ".backup.zip.catalog.json"), 'w') as out_file:
+            out_file.write("{damaged")
+
+        catalog = CopyCatalog(self.tmp_dir, "backup", ".zip")
+        self.assertEqual([entry.name for entry in catalog.entries], ["backup_2016-01-01_10-30.zip"])
+
+    def test_deleted_copy(self):
+        catalog = CopyCatalog(self.tmp_dir, "backup", ".zip")
+        copy_path = self._create_copy("backup_2016-01-01_10-30.zip")
+        catalog.add_copy(copy_path, datetime(2016, 1, 1, 10, 30))
+        os.remove(copy_path)
+
+        self.assertIsNone(catalog.get_last_entry())
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.multicopy import copy_engine
+from ap_backup.multicopy.copy_engine import copy_file, copy_file_with_stat, copy_tree, COPY_STRATEGY_REFLINK
+from ap_backup.throttle import Throttle
+
+__author__ = 'Alexander Pikovsky'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_file = os.path.join(self.tmp_dir, "src.bin")
+        self.content = os.urandom(100000)
+        with open(self.src_file, 'wb') as out_file:
+            out_file.write(self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, file_path):
+        with open(file_path, 'rb') as in_file:
+            return in_file.read()
+
+    def test_copy_file(self):
+        target_file = os.path.join(self.tmp_dir, "target.bin")
+        self.assertIsNotNone(copy_file(self.src_file, target_file))
+        self.assertEqual(self._read(target_file), self.content)
+
+    def test_copy_empty_file(self):
+        empty_file = os.path.join(self.tmp_dir, "empty.bin")
+        open(empty_file, 'wb').close()
+        target_file = os.path.join(self.tmp_dir, "target.bin")
+        copy_file(empty_file, target_file)
+        self.assertEqual(self._read(target_file), b"")
+
+    def test_copy_file_with_stat(self):
+        os.utime(self.src_file, (1000000000, 1000000000))
+        target_file = os.path.join(self.tmp_dir, "target.bin")
+        copy_file_with_stat(self.src_file, target_file)
+        self.assertEqual(os.stat(target_file).st_mtime, 1000000000)
+
+    def test_reflink_only(self):
+        target_file = os.path.join(self.tmp_dir, "target.bin")
+        strategy = copy_file(self.src_file, target_file, reflink_only=True)
+        if strategy is None:
+            self.assertFalse(os.path.exists(target_file))   # filesystem does not support reflinks
+        else:
+            self.assertEqual(strategy, COPY_STRATEGY_REFLINK)
+            self.assertEqual(self._read(target_file), self.content)
+
+    def test_throttled_copy(self):
+        target_file = os.path.join(self.tmp_dir, "target.bin")
+        copy_file(self.src_file, target_file, throttle=Throttle(read_rate=10 ** 9, write_rate=10 ** 9))
+        self.assertEqual(self._read(target_file), self.content)
+
+    def test_copy_tree(self):
+        src_folder = os.path.join(self.tmp_dir, "src")
+        os.makedirs(os.path.join(src_folder, "sub"))
+        shutil.copy(self.src_file, os.path.join(src_folder, "sub", "file.bin"))
+        target_folder = os.path.join(self.tmp_dir, "target")
+        copy_tree(src_folder, target_folder, Throttle(read_rate=10 ** 9))
+        self.assertEqual(self._read(os.path.join(target_folder, "sub", "file.bin")), self.content)
+
+    def test_copy_tree_unreadable_folder(self):
+        src_folder = os.path.join(self.tmp_dir, "src")
+        os.makedirs(os.path.join(src_folder, "sub"))
+        shutil.copy(self.src_file, os.path.join(src_folder, "file.bin"))
+        shutil.copy(self.src_file, os.path.join(src_folder, "sub", "file.bin"))
+
+        #the subfolder disappears after the source folder is listed, so it cannot be read by the walk
+        def copy_and_remove(src_file, target_file, throttle=None):
+            shutil.rmtree(os.path.join(src_folder, "sub"), ignore_errors=True)
+            return copy_file(src_file, target_file, throttle=throttle)
+
+        target_folder = os.path.join(self.tmp_dir, "target")
+        with mock.patch.object(copy_engine, 'copy_file_with_stat', copy_and_remove):
+            with self.assertRaises(shutil.Error) as context:
+                copy_tree(src_folder, target_folder)
+
+        self.assertEqual([error[0] for error in context.exception.args[0]], [os.path.join(src_folder, "sub")])
+        self.assertEqual(self._read(os.path.join(target_folder, "file.bin")), self.content)
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from ap_backup.multicopy.copy_engine import copy_file
+from ap_backup.multicopy.fanout import fanout_copy
+
+__author__ = 'Alexander Pikovsky'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_file = os.path.join(self.tmp_dir, "src.bin")
+        self.content = os.urandom(100000)
+        with open(self.src_file, 'wb') as out_file:
+            out_file.write(self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, file_path):
+        with open(file_path, 'rb') as in_file:
+            return in_file.read()
+
+    def test_copy(self):
+        target_files = [os.path.join(self.tmp_dir, "target-{0}.bin".format(i)) for i in range(3)]
+        errors = fanout_copy(self.src_file, target_files, block_size=1000, reporter=_NullReporter())
+
+        self.assertEqual(errors, {})
+        for target_file in target_files:
+            self.assertEqual(self._read(target_file), self.content)
+
+    def test_detached_writer(self):
+        #a single queued block forces the writer to detach and read the source on its own
+        target_file = os.path.join(self.tmp_dir, "target.bin")
+        errors = fanout_copy(self.src_file, [target_file], block_size=1000, max_queued_blocks=1,
+                             reporter=_NullReporter())
+
+        self.assertEqual(errors, {})
+        self.assertEqual(self._read(target_file), self.content)
+
+    def test_write_error(self):
+        target_file = os.path.join(self.tmp_dir, "target.bin")
+        os.mkdir(target_file)
+        errors = fanout_copy(self.src_file, [target_file], block_size=1000, reporter=_NullReporter())
+
+        self.assertEqual(list(errors.keys()), [target_file])
+
+    def test_expected_checksum(self):
+        target_file = os.path.join(self.tmp_dir, "target.bin")
+        errors = fanout_copy(self.src_file, [target_file], block_size=1000, reporter=_NullReporter(),
+                             expected_checksum=hashlib.sha256(self.content).hexdigest())
+
+        self.assertEqual(errors, {})
+        self.assertEqual(self._read(target_file), self.content)
+
+    def test_checksum_mismatch(self):
+        if copy_file(self.src_file, os.path.join(self.tmp_dir, "clone.bin"), reflink_only=True):
+            self.skipTest("cloned copies are not hashed")
+
+        target_file = os.path.join(self.tmp_dir, "target.bin")
+        errors = fanout_copy(self.src_file, [target_file], block_size=1000, reporter=_NullReporter(),
+                             expected_checksum=hashlib.sha256(b"other").hexdigest())
+
+        self.assertEqual(list(errors.keys()), [target_file])
+
+
+class _NullReporter(object):
+
+    def info(self, message):
+        pass
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
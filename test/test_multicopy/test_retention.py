@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import unittest
+
+from ap_backup.multicopy.catalog import CatalogEntry
+from ap_backup.multicopy.retention import RetentionPolicy
+
+__author__ = 'Alexander Pikovsky'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        #one copy every day at 01:00 and 13:00 for a year, newest on 2016-12-31
+        first_day = datetime(2016, 1, 1)
+        self.entries = []
+        for day in range(366):
+            for hour in (1, 13):
+                timestamp = first_day + timedelta(days=day, hours=hour)
+                self.entries.append(CatalogEntry("copy_{0}".format(timestamp.strftime("%Y-%m-%d_%H-%M")), timestamp))
+
+    def _kept(self, retention_policy):
+        expired_names = set(entry.name for entry in retention_policy.select_expired(self.entries))
+        return [entry.name for entry in self.entries if entry.name not in expired_names]
+
+    def test_num_copies(self):
+        self.assertEqual(self._kept(RetentionPolicy(num_copies=3)),
+                         ["copy_2016-12-30_13-00", "copy_2016-12-31_01-00", "copy_2016-12-31_13-00"])
+
+    def test_daily(self):
+        self.assertEqual(self._kept(RetentionPolicy(daily=2)), ["copy_2016-12-30_13-00", "copy_2016-12-31_13-00"])
+
+    def test_grandfather_father_son(self):
+        kept = self._kept(RetentionPolicy(num_copies=1, daily=7, weekly=4, monthly=12))
+
+        #monthly copies are the last copies of each month
+        self.assertIn("copy_2016-01-31_13-00", kept)
+        self.assertIn("copy_2016-11-30_13-00", kept)
+        #weekly copies are the last copies of each ISO week (Sundays)
+        self.assertIn("copy_2016-12-11_13-00", kept)
+        self.assertNotIn("copy_2016-12-10_13-00", kept)
+        #daily and overlapping copies are counted by every rule
+        self.assertEqual(len(kept), 7 + 2 + 11)
+
+    def test_keep_since(self):
+        kept = self._kept(RetentionPolicy(num_copies=1, keep_since=datetime(2016, 12, 29, 13)))
+        self.assertEqual(kept, ["copy_2016-12-29_13-00", "copy_2016-12-30_01-00", "copy_2016-12-30_13-00",
+                                "copy_2016-12-31_01-00", "copy_2016-12-31_13-00"])
+        self.assertEqual(self._kept(RetentionPolicy(num_copies=2, keep_since=datetime(2017, 1, 1))),
+                         ["copy_2016-12-31_01-00", "copy_2016-12-31_13-00"])
+
+    def test_expired_order(self):
+        expired_entries = RetentionPolicy(num_copies=2).select_expired(self.entries)
+        self.assertEqual(expired_entries[0].name, "copy_2016-01-01_01-00")
+        self.assertEqual(len(expired_entries), len(self.entries) - 2)
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
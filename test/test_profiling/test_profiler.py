@@ -0,0 +1,140 @@
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from ap_backup.profiling import Profiler
+
+__author__ = 'Alexander Pikovsky'
+
+
+class _Reporter(object):
+
+    def __init__(self):
+        self.infos = []
+        self.errors = []
+
+    def info(self, message, **kwargs):
+        self.infos.append(message)
+
+    def error(self, message, **kwargs):
+        self.errors.append(message)
+
+
+def _busy_function(seconds):
+    end_time = time.time() + seconds
+    while time.time() < end_time:
+        sum(range(100))
+
+
+def _waiting_function(event):
+    event.wait()
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.reporter = _Reporter()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _get_files(self, extension):
+        return [os.path.join(self.tmp_dir, file_name) for file_name in sorted(os.listdir(self.tmp_dir))
+                if file_name.endswith(extension)]
+
+    def test_profile_run(self):
+        profiler = Profiler(self.tmp_dir, top_functions=5, sample_interval=0.01)
+        with profiler.profile("backup-1", self.reporter, get_stages=lambda: ["create_archive"]):
+            thread = threading.Thread(target=_busy_function, args=(0.2,))
+            thread.start()
+            _busy_function(0.2)
+            thread.join()
+
+        self.assertEqual(self.reporter.errors, [])
+        pstats_files = self._get_files(".pstats")
+        self.assertEqual(len(pstats_files), 1)
+        self.assertTrue(os.path.basename(pstats_files[0]).startswith("backup-1_"))
+        function_names = [function[2] for function in pstats.Stats(pstats_files[0]).stats]
+        self.assertIn("_busy_function", function_names)
+
+        #header line plus 5 hot functions
+        self.assertIn("Profile of 'backup-1' written to", self.reporter.infos[0])
+        self.assertEqual(len(self.reporter.infos[1:7]), 6)
+
+        stacks_files = self._get_files(".stacks.txt")
+        self.assertEqual(len(stacks_files), 1)
+        with open(stacks_files[0], 'r') as in_file:
+            lines = in_file.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(all(line.startswith("create_archive;") for line in lines))
+        self.assertTrue(any("test_profiler.py:_busy_function" in line for line in lines))
+
+    def test_sampler_thread_stopped(self):
+        profiler = Profiler(self.tmp_dir, sample_interval=0.01)
+        with profiler.profile("backup-1", self.reporter):
+            sampler_thread = profiler._sampler_thread
+            with profiler.profile("backup-2", self.reporter):
+                self.assertIs(profiler._sampler_thread, sampler_thread)
+                _busy_function(0.05)
+            self.assertTrue(sampler_thread.is_alive())
+            _busy_function(0.05)
+
+        #the sampler thread is stopped and joined when the last run finishes, a new run starts a new one
+        self.assertFalse(sampler_thread.is_alive())
+        self.assertIsNone(profiler._sampler_thread)
+        with profiler.profile("backup-3", self.reporter):
+            self.assertTrue(profiler._sampler_thread.is_alive())
+        self.assertEqual(self.reporter.errors, [])
+
+    def test_thread_outliving_run(self):
+        thread_start = vars(threading.Thread)['start']
+        release = threading.Event()
+        with Profiler(self.tmp_dir).profile("backup-1", self.reporter):
+            thread = threading.Thread(target=_waiting_function, args=(release,))
+            thread.start()
+            _busy_function(0.05)
+
+        #the thread is profiled until it ends, its profile is not saved by the finished run
+        try:
+            self.assertEqual(self.reporter.errors, [])
+            function_names = [function[2] for function in pstats.Stats(self._get_files(".pstats")[0]).stats]
+            self.assertIn("_busy_function", function_names)
+            self.assertNotIn("_waiting_function", function_names)
+        finally:
+            release.set()
+            thread.join()
+
+        #threads started after the run are not profiled
+        self.assertIs(vars(threading.Thread)['start'], thread_start)
+        thread = threading.Thread(target=_busy_function, args=(0,))
+        thread.start()
+        thread.join()
+        self.assertNotIn('run', vars(thread))
+
+    def test_profile_call(self):
+        profiler = Profiler(self.tmp_dir)
+        profile_run = profiler.profile("checker-1", self.reporter)
+        profile_run.start()
+        self.assertEqual(profile_run.profile_call(lambda: _busy_function(0.05) or 42), 42)
+        profile_run.finish()
+
+        self.assertEqual(len(self._get_files(".pstats")), 1)
+        self.assertEqual(self._get_files(".stacks.txt"), [])
+
+    def test_nothing_profiled(self):
+        profile_run = Profiler(self.tmp_dir).profile("checker-1", self.reporter)
+        profile_run.start()
+        profile_run.finish()
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+        self.assertEqual(self.reporter.infos, [])
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
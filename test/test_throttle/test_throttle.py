@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import io
+import unittest
+
+from ap_backup.throttle import TokenBucket, Throttle, ThrottledReader, ThrottledWriter, create_throttle, parse_rate
+
+__author__ = 'Alexander Pikovsky'
+
+
+class _FakeClock(object):
+    """Clock advanced only by the sleeps of the bucket."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+class _RecordingThrottle(object):
+
+    def __init__(self):
+        self.read_bytes = 0
+        self.written_bytes = 0
+
+    def read(self, amount):
+        self.read_bytes += amount
+
+    def write(self, amount):
+        self.written_bytes += amount
+
+
+class Test(unittest.TestCase):
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("512K"), 512 * 1024)
+        self.assertEqual(parse_rate("20M"), 20 * 1024 ** 2)
+        self.assertEqual(parse_rate("1.5G"), 1.5 * 1024 ** 3)
+        self.assertEqual(parse_rate("20MB/s"), 20 * 1024 ** 2)
+        self.assertEqual(parse_rate(1000), 1000)
+        self.assertIsNone(parse_rate(None))
+        self.assertIsNone(parse_rate(0))
+        self.assertRaises(ValueError, parse_rate, "fast")
+        self.assertRaises(ValueError, parse_rate, -1)
+
+    def test_burst_is_not_delayed(self):
+        fake_clock = _FakeClock()
+        bucket = TokenBucket(1000, clock=fake_clock.clock, sleep=fake_clock.sleep)
+        self.assertEqual(bucket.consume(1000), 0)
+
+    def test_rate_is_limited(self):
+        fake_clock = _FakeClock()
+        bucket = TokenBucket(1000, burst=100, clock=fake_clock.clock, sleep=fake_clock.sleep)
+        for i in range(10):
+            bucket.consume(500)
+        #100 bytes burst, the remaining 4900 bytes at 1000 bytes per second
+        self.assertAlmostEqual(fake_clock.slept, 4.9)
+
+    def test_idle_time_refills_up_to_burst(self):
+        fake_clock = _FakeClock()
+        bucket = TokenBucket(1000, clock=fake_clock.clock, sleep=fake_clock.sleep)
+        bucket.consume(1000)
+        fake_clock.now += 60
+        self.assertEqual(bucket.consume(1000), 0)
+        self.assertAlmostEqual(bucket.consume(500), 0.5)
+
+    def test_shared_bucket(self):
+        fake_clock = _FakeClock()
+        bucket = TokenBucket(1000, shared=True, clock=fake_clock.clock, sleep=fake_clock.sleep)
+        bucket.consume(1500)
+        self.assertAlmostEqual(fake_clock.slept, 0.5)
+
+    def test_create_throttle(self):
+        self.assertIsNone(create_throttle())
+        parent = Throttle(read_rate=1000)
+        self.assertIs(create_throttle(parent=parent), parent)
+
+        throttle = create_throttle(write_rate=1000, parent=parent)
+        self.assertIsNone(throttle.read_bucket)
+        self.assertIsNotNone(throttle.write_bucket)
+        self.assertIs(throttle.parent, parent)
+
+    def test_parent_limits_apply(self):
+        parent = _RecordingThrottle()
+        throttle = Throttle(read_rate=10 ** 9, parent=parent)
+        throttle.read(100)
+        throttle.write(200)
+        self.assertEqual((parent.read_bytes, parent.written_bytes), (100, 200))
+
+    def test_throttled_reader_and_writer(self):
+        content = b"x" * 200000
+        throttle = _RecordingThrottle()
+        reader = ThrottledReader(io.BytesIO(content), throttle)
+        out_file = io.BytesIO()
+        writer = ThrottledWriter(out_file, throttle)
+        while True:
+            data = reader.read(1000)
+            if not data:
+                break
+            writer.write(data)
+
+        self.assertEqual(out_file.getvalue(), content)
+        self.assertEqual(throttle.read_bytes, len(content))
+        #writes are accounted in batches, at most one batch is pending
+        self.assertGreater(throttle.written_bytes, len(content) - 65536)
+        self.assertFalse(hasattr(writer, 'fileno'))
+
+    def test_throttled_reader_accounts_pending_data(self):
+        throttle = _RecordingThrottle()
+        in_file = io.BytesIO(b"x" * 1000)
+        reader = ThrottledReader(in_file, throttle)
+        self.assertEqual(len(reader.read(1000)), 1000)
+        self.assertEqual(throttle.read_bytes, 0)
+
+        #the end of the file is not read (e.g. by tarfile), close() accounts the data
+        reader.close()
+        self.assertEqual(throttle.read_bytes, 1000)
+        self.assertTrue(in_file.closed)
+
+    def test_throttled_writer_accounts_pending_data(self):
+        throttle = _RecordingThrottle()
+        out_file = io.BytesIO()
+        writer = ThrottledWriter(out_file, throttle)
+        writer.write(b"x" * 1000)
+        self.assertEqual(throttle.written_bytes, 0)
+
+        #data below the accounting batch size is accounted by flush() and close()
+        writer.flush()
+        self.assertEqual(throttle.written_bytes, 1000)
+        writer.write(b"y" * 10)
+        writer.close()
+        self.assertEqual(throttle.written_bytes, 1010)
+        self.assertTrue(out_file.closed)
+
+if __name__ == "__main__":
+    unittest.main()
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(Test)